@@ -1,7 +1,23 @@
 #!/usr/bin/env python3
+import copy
+import heapq
+import importlib.util
 import json
+import os
+import random
+import shlex
+import subprocess
 import sys
-from datetime import datetime
+import threading
+import time
+from array import array
+from datetime import datetime, timezone
+
+# Optional: NumPy vectorizes concept clustering
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # ------------------------------------------------------------
 # JSON-RPC helpers
@@ -21,6 +37,9 @@ def read_message():
 # Persistent Knowledge Graph client (via LM Studio routing)
 # ------------------------------------------------------------
 
+# Nodes the loop keeps its own state in; never fed back into reflect
+STATE_NODE_TYPES = ("cognitive_state", "cognitive_aggregates")
+
 class KnowledgeGraphClient:
     """
     v0.5: This is a logical client abstraction.
@@ -43,25 +62,95 @@ class KnowledgeGraphClient:
             "arguments": {"limit": limit}
         }
 
-    def add_node(self, label, type_, data=None):
+    def changes_since(self, cursor, limit=500, exclude_types=STATE_NODE_TYPES, include_rows=True):
+        arguments = {
+            "cursor": cursor,
+            "limit": limit,
+            "exclude_types": list(exclude_types),
+            "on_expired": "reset"
+        }
+        if not include_rows:
+            arguments["include_rows"] = False
+        return {
+            "call": "knowledge-graph:changes_since",
+            "arguments": arguments
+        }
+
+    def top_central_nodes(self, limit=5):
+        return {
+            "call": "knowledge-graph:top_central_nodes",
+            "arguments": {"limit": limit, "metric": "pagerank"}
+        }
+
+    def export_subgraph(self, name, types=None):
+        arguments = {"name": name, "format": "npz", "overwrite": True}
+        if types:
+            arguments["types"] = list(types)
+        return {
+            "call": "knowledge-graph:export_subgraph",
+            "arguments": arguments
+        }
+
+    def add_node(self, label, type_, data=None, unique=False):
+        arguments = {
+            "label": label,
+            "type": type_,
+            "data": data or {}
+        }
+        if unique:
+            # Repeats reinforce the existing node (hit counter) instead of adding rows
+            arguments["unique"] = True
         return {
             "call": "knowledge-graph:add_node",
-            "arguments": {
-                "label": label,
-                "type": type_,
-                "data": data or {}
-            }
+            "arguments": arguments
         }
 
-    def add_edge(self, source_id, target_id, relation, data=None):
+    def add_edge(self, source_id, target_id, relation, data=None, unique=False):
+        arguments = {
+            "source_id": source_id,
+            "target_id": target_id,
+            "relation": relation,
+            "data": data or {}
+        }
+        if unique:
+            arguments["unique"] = True
         return {
             "call": "knowledge-graph:add_edge",
-            "arguments": {
-                "source_id": source_id,
-                "target_id": target_id,
-                "relation": relation,
-                "data": data or {}
-            }
+            "arguments": arguments
+        }
+
+    def patch_node_data(self, node_id, merge=None, ops=None):
+        arguments = {"node_id": node_id}
+        if merge is not None:
+            arguments["merge"] = merge
+        if ops:
+            arguments["ops"] = ops
+        return {
+            "call": "knowledge-graph:patch_node_data",
+            "arguments": arguments
+        }
+
+    def append_state_history(self, node_id, cycle, record):
+        # The graph stores the record as a delta against the last stored one
+        return {
+            "call": "knowledge-graph:append_state_history",
+            "arguments": {"node_id": node_id, "cycle": cycle, "record": record}
+        }
+
+    def get_state_history(self, node_id, limit=10, reconstruct=False):
+        return {
+            "call": "knowledge-graph:get_state_history",
+            "arguments": {"node_id": node_id, "limit": limit, "reconstruct": reconstruct}
+        }
+
+    def apply_write_plan(self, plan):
+        """
+        Descriptor for executing a whole write plan in one call and one
+        transaction on the knowledge-graph side.
+        """
+        return {
+            "call": "knowledge-graph:apply_write_plan",
+            "arguments": {"plan": plan}
         }
 
     def find_state_node(self):
@@ -80,25 +169,544 @@ class KnowledgeGraphClient:
             }
         }
 
+    def find_aggregates_node(self):
+        """Find or create the node holding the loop's running aggregates."""
+        return {
+            "call": "knowledge-graph:find_or_create_state_node",
+            "arguments": {
+                "label": "Cognitive Loop Aggregates",
+                "type": "cognitive_aggregates",
+                "data": default_aggregates()
+            }
+        }
+
 KG_CLIENT = KnowledgeGraphClient()
 
+# ------------------------------------------------------------
+# Direct mode: executing plans against the Knowledge Graph
+# ------------------------------------------------------------
+#
+# run_full_cycle executes the read plan, reflect, apply_insights and the
+# write plan itself instead of handing descriptors to the host, over an
+# inprocess or stdio graph transport. long_term_memory reads go to
+# LTM_SERVER_COMMAND when set.
+
+KG_SERVER_PATH = os.environ.get(
+    "KG_SERVER_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "KnowledgeGraphServer.py")
+)
+KG_TRANSPORT = os.environ.get("KG_TRANSPORT", "inprocess")
+KG_CALL_PREFIX = "knowledge-graph:"
+LTM_SERVER_COMMAND = os.environ.get("LTM_SERVER_COMMAND")   # e.g. "python LongTermMemoryServer.py"
+LTM_CALL_PREFIX = "long_term_memory:"
+
+class InProcessGraphTransport:
+    """Calls the graph server's request handler directly, no serialization."""
+
+    name = "inprocess"
+
+    def __init__(self, path):
+        spec = importlib.util.spec_from_file_location("knowledge_graph_server", path)
+        self.server = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(self.server)
+        self.server.init_graphs()
+        self.next_id = 0
+
+    def request(self, method, params):
+        self.next_id += 1
+        return self.server.process_request({
+            "jsonrpc": "2.0",
+            "id": self.next_id,
+            "method": method,
+            "params": params
+        })
+
+    def close(self):
+        pass
+
+class StdioTransport:
+    """A persistent child server speaking line-delimited JSON-RPC."""
+
+    name = "stdio"
+
+    def __init__(self, command):
+        self.process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            bufsize=1
+        )
+        self.next_id = 0
+        self.lock = threading.Lock()     # one request on the pipe at a time
+        self.request("initialize", {})
+
+    def request(self, method, params):
+        with self.lock:
+            self.next_id += 1
+            req_id = self.next_id
+            self.process.stdin.write(json.dumps({
+                "jsonrpc": "2.0",
+                "id": req_id,
+                "method": method,
+                "params": params
+            }) + "\n")
+            self.process.stdin.flush()
+            # The server answers concurrently, so match on id
+            while True:
+                line = self.process.stdout.readline()
+                if not line:
+                    raise RuntimeError(f"{self.process.args[-1]} exited")
+                response = json.loads(line)
+                if response.get("id") == req_id:
+                    return response
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait(timeout=10)
+
+class StdioGraphTransport(StdioTransport):
+    def __init__(self, path):
+        super().__init__([sys.executable, path])
+
+GRAPH_TRANSPORTS = {
+    "inprocess": InProcessGraphTransport,
+    "stdio": StdioGraphTransport,
+}
+
+_transports = {}
+_transports_lock = threading.Lock()
+
+def graph_transport(kind=None):
+    """The shared transport of `kind`, opened on first use and kept."""
+    kind = kind or KG_TRANSPORT
+    if kind not in GRAPH_TRANSPORTS:
+        raise ValueError(f"Unknown transport: {kind} (expected one of {', '.join(GRAPH_TRANSPORTS)})")
+    with _transports_lock:
+        if kind not in _transports:
+            _transports[kind] = GRAPH_TRANSPORTS[kind](KG_SERVER_PATH)
+        return _transports[kind]
+
+def execute_call(transport, descriptor, prefix=KG_CALL_PREFIX):
+    """Run one call descriptor for the server behind `transport` and return its result."""
+    call = descriptor["call"]
+    if not call.startswith(prefix):
+        raise ValueError(f"Expected a {prefix[:-1]} call, not {call}")
+    tool = call[len(prefix):]
+    response = transport.request("tools/call", {"name": tool, "arguments": descriptor["arguments"]})
+    if "error" in response:
+        raise RuntimeError(f"{call} failed: {response['error'].get('message')}")
+    return response["result"]
+
+def memory_transport():
+    """The shared long-term memory server, or None if none is configured."""
+    if not LTM_SERVER_COMMAND:
+        return None
+    with _transports_lock:
+        if "memory" not in _transports:
+            _transports["memory"] = StdioTransport(shlex.split(LTM_SERVER_COMMAND))
+        return _transports["memory"]
+
+def memory_entries(result):
+    """The memory list of a long_term_memory result, MCP text content unwrapped."""
+    if isinstance(result, dict) and isinstance(result.get("content"), list):
+        text = "".join(block.get("text", "") for block in result["content"] if block.get("type") == "text")
+        try:
+            result = json.loads(text) if text else []
+        except ValueError:
+            result = [{"text": text}]
+    if isinstance(result, dict):
+        result = result.get("memories", [])
+    return result if isinstance(result, list) else []
+
 # ------------------------------------------------------------
 # Cognitive state model (stored in the Knowledge Graph)
 # ------------------------------------------------------------
 
 def default_cognitive_state():
+    """
+    The hot header kept in the cognitive_state node's data. Per-cycle
+    detail (reflection, summary, active concepts) is appended to the
+    node's state_history as one record per cycle instead, and the
+    running aggregates live in their own cognitive_aggregates node.
+    """
     return {
         "cycle_count": 0,
         "last_cycle_time": None,
         "last_mode": "normal",
-        "last_reflection": None,
-        "last_summary": None,
-        "last_written_nodes": [],
-        "last_written_edges": [],
-        "last_active_concepts": [],
-        "last_memory_snapshot": [],
+        "last_change_cursor": None,
+        "last_reset_cycle": None,       # last cycle rebuilt from a full export
+    }
+
+# Fields of the v0.5 state blob that now live in state_history;
+# the first header patch removes any still stored in the node. The
+# aggregates moved to their own node and are carried over from there.
+LEGACY_STATE_FIELDS = (
+    "last_reflection",
+    "last_summary",
+    "last_written_nodes",
+    "last_written_edges",
+    "last_active_concepts",
+    "last_memory_snapshot",
+    "aggregates",
+)
+
+# ------------------------------------------------------------
+# Running aggregates (kept in the cognitive_aggregates node)
+# ------------------------------------------------------------
+#
+# reflect folds each cycle's deltas into concept weights (decayed per
+# cycle), type / relation counts and document counts, and returns a
+# merge patch of the keys it touched. Decay is lazy: stored weights are
+# divided by `scale`, which is folded back in once it gets small.
+
+CONCEPT_DECAY = 0.9                 # per-cycle decay of concept activity
+CONCEPT_AGGREGATE_MAX = 500         # concepts kept (lowest weights pruned)
+DECAY_RENORMALIZE_BELOW = 1e-6      # rescale stored weights below this scale
+TOP_CONCEPTS = 10
+
+def default_aggregates():
+    return {
+        "cycles": 0,
+        "scale": 1.0,
+        "concepts": {},
+        "type_counts": {},
+        "relation_counts": {},
+        "documents": {"total": 0, "recent": 0.0},
     }
 
+def update_aggregates(aggregates, nodes, edges, events=None):
+    """
+    Fold one cycle's new and changed nodes/edges into `aggregates`
+    (in place) and return the merge patch of what changed.
+
+    `events` are changes_since events; they tell inserts from updates.
+    Without them every given node and edge counts as newly created.
+    Untyped nodes and edges without a relation are not counted by kind.
+    """
+    if events is None:
+        created_nodes = {n["id"] for n in nodes}
+        created_edges = {e["id"] for e in edges}
+    else:
+        created_nodes = {e[2] for e in events if e[1] == "node" and e[3] == "insert"}
+        created_edges = {e[2] for e in events if e[1] == "edge" and e[3] == "insert"}
+
+    scale = aggregates["scale"] * CONCEPT_DECAY
+    concepts = aggregates["concepts"]
+    documents = aggregates["documents"]
+    documents["recent"] *= CONCEPT_DECAY
+    patch = {"concepts": {}, "type_counts": {}, "relation_counts": {}}
+
+    for node in nodes:
+        if node.get("type") == "concept":
+            label = node["label"]
+            concepts[label] = concepts.get(label, 0.0) + 1.0 / scale
+            patch["concepts"][label] = concepts[label]
+        if node["id"] in created_nodes and node.get("type") is not None:
+            type_counts = aggregates["type_counts"]
+            type_counts[node["type"]] = type_counts.get(node["type"], 0) + 1
+            patch["type_counts"][node["type"]] = type_counts[node["type"]]
+            if node["type"] == "document":
+                documents["total"] += 1
+                documents["recent"] += 1.0
+
+    for edge in edges:
+        if edge["id"] in created_edges and edge.get("relation") is not None:
+            relation_counts = aggregates["relation_counts"]
+            relation_counts[edge["relation"]] = relation_counts.get(edge["relation"], 0) + 1
+            patch["relation_counts"][edge["relation"]] = relation_counts[edge["relation"]]
+
+    if scale < DECAY_RENORMALIZE_BELOW:
+        for label in concepts:
+            concepts[label] *= scale
+        scale = 1.0
+        patch["concepts"] = dict(concepts)
+
+    # Let the map grow to twice its cap so pruning stays amortized O(1)
+    if len(concepts) > 2 * CONCEPT_AGGREGATE_MAX:
+        keep = set(heapq.nlargest(CONCEPT_AGGREGATE_MAX, concepts, key=concepts.get))
+        for label in [label for label in concepts if label not in keep]:
+            del concepts[label]
+            patch["concepts"][label] = None
+
+    aggregates["scale"] = scale
+    aggregates["cycles"] += 1
+    patch.update({"scale": scale, "cycles": aggregates["cycles"], "documents": dict(documents)})
+    return patch
+
+def replacement_patch(stored, aggregates):
+    """Merge patch turning `stored` into `aggregates`; keys it drops become null."""
+    patch = copy.deepcopy(aggregates)
+    for key in ("concepts", "type_counts", "relation_counts"):
+        for name in stored.get(key) or {}:
+            patch[key].setdefault(name, None)
+    return patch
+
+def top_concepts(aggregates, limit=TOP_CONCEPTS):
+    """[(label, decayed weight)] of the most active concepts."""
+    scale = aggregates["scale"]
+    concepts = aggregates["concepts"]
+    return [
+        (label, round(concepts[label] * scale, 3))
+        for label in heapq.nlargest(limit, concepts, key=concepts.get)
+    ]
+
+# ------------------------------------------------------------
+# Concept clustering (co-occurrence + label propagation)
+# ------------------------------------------------------------
+#
+# Concepts co-occur when an edge links them or they share a document.
+# The matrix lives in this process and is rebuilt after a restart from
+# an export_subgraph .npz that the graph server writes (always to the same
+# name) and this process reads from disk, so the subgraph never passes
+# through the host; apply_insights clusters it with label propagation
+# (NumPy if available) under a time budget.
+
+CLUSTER_TIME_BUDGET_MS = 500        # label propagation stops after this
+CLUSTER_MAX_ITERATIONS = 30
+CLUSTER_MIN_SIZE = 2
+CLUSTER_INSIGHTS_MAX = 5            # insight nodes per cycle
+CLUSTER_LABEL_MEMBERS = 4           # members named in an insight label
+CLUSTER_DATA_MEMBERS = 50           # members listed in an insight's data
+DOCUMENT_CONCEPTS_MAX = 50          # concepts per document paired up
+
+def read_export(export):
+    """
+    Nodes, edges, change_seq and filters of a knowledge-graph
+    export_subgraph (npz) result, read from its files.
+    """
+    if np is None:
+        raise RuntimeError("NumPy is required to read graph exports")
+    if export.get("format") != "npz" or not export.get("paths") or not export.get("manifest"):
+        raise ValueError("subgraph_export must be an npz export_subgraph result")
+    with open(export["manifest"]) as f:
+        manifest = json.load(f)
+    with np.load(export["paths"][0], allow_pickle=False) as arrays:
+        type_names = arrays["type_names"].tolist()
+        relation_names = arrays["relation_names"].tolist()
+        offsets = arrays["node_label_offsets"].tolist()
+        label_bytes = arrays["node_label_bytes"].tobytes()
+        node_ids = arrays["node_ids"].tolist()
+        nodes = [
+            {"id": node_id, "type": type_names[code], "label": label_bytes[offsets[i]:offsets[i + 1]].decode("utf-8")}
+            for i, (node_id, code) in enumerate(zip(node_ids, arrays["node_type_codes"].tolist()))
+        ]
+        edges = [
+            {"id": edge_id, "source_id": node_ids[source], "target_id": node_ids[target],
+             "relation": relation_names[code]}
+            for edge_id, source, target, code in zip(
+                arrays["edge_ids"].tolist(), arrays["edge_source"].tolist(),
+                arrays["edge_target"].tolist(), arrays["edge_relation_codes"].tolist()
+            )
+        ]
+    return {"nodes": nodes, "edges": edges, "change_seq": manifest["change_seq"], "filters": manifest["filters"]}
+
+class ConceptCooccurrence:
+    """Sparse symmetric concept x concept weights, built incrementally."""
+
+    def __init__(self):
+        self.cursor = 0             # change-log seq folded in so far
+        self.row_of = {}            # concept node id -> row
+        self.labels = []            # row -> concept label
+        self.documents = {}         # document node id -> [concept rows]
+        self.pair_pos = {}          # (i << 32 | j), i < j -> position
+        self.rows = array("l")
+        self.cols = array("l")
+        self.weights = array("d")
+        self.touched = set()        # rows changed since the last clustering
+        self.cluster_of = []        # row -> cluster label of the last pass
+
+    def _concept_row(self, node_id, label):
+        row = self.row_of.get(node_id)
+        if row is None:
+            row = self.row_of[node_id] = len(self.labels)
+            self.labels.append(label)
+            self.cluster_of.append(row)
+        elif label is not None:
+            self.labels[row] = label
+        return row
+
+    def _add_pair(self, i, j, weight=1.0):
+        if i == j:
+            return
+        if i > j:
+            i, j = j, i
+        key = i << 32 | j
+        pos = self.pair_pos.get(key)
+        if pos is None:
+            self.pair_pos[key] = len(self.weights)
+            self.rows.append(i)
+            self.cols.append(j)
+            self.weights.append(weight)
+        else:
+            self.weights[pos] += weight
+        self.touched.update((i, j))
+
+    def _add_edge(self, source_id, target_id):
+        source_row = self.row_of.get(source_id)
+        target_row = self.row_of.get(target_id)
+        if source_row is not None and target_row is not None:
+            self._add_pair(source_row, target_row)
+            return
+        # document <-> concept link, in either direction
+        if source_row is not None and target_id in self.documents:
+            document, row = target_id, source_row
+        elif target_row is not None and source_id in self.documents:
+            document, row = source_id, target_row
+        else:
+            return
+        members = self.documents[document]
+        if row in members or len(members) >= DOCUMENT_CONCEPTS_MAX:
+            return
+        for other in members:
+            self._add_pair(row, other)
+        members.append(row)
+
+    def update(self, nodes, edges, events=None, cursor=None):
+        """Fold new concept/document nodes and new edges into the matrix."""
+        for node in nodes:
+            if node.get("type") == "concept":
+                self._concept_row(node["id"], node["label"])
+            elif node.get("type") == "document":
+                self.documents.setdefault(node["id"], [])
+
+        if events is not None:
+            fresh = {
+                e[2] for e in events
+                if e[1] == "edge" and e[3] == "insert" and e[0] > self.cursor
+            }
+            edges = [edge for edge in edges if edge["id"] in fresh]
+        for edge in edges:
+            self._add_edge(edge["source_id"], edge["target_id"])
+
+        if cursor is not None:
+            self.cursor = max(self.cursor, cursor)
+
+    def load(self, exported):
+        """Rebuild from read_export() of a knowledge-graph export."""
+        self.__init__()
+        self.update(exported["nodes"], [])
+        for edge in exported["edges"]:
+            self._add_edge(edge["source_id"], edge["target_id"])
+        self.cursor = exported["change_seq"]
+
+    def clusters(self, time_budget_ms=CLUSTER_TIME_BUDGET_MS):
+        """
+        Label-propagate, then return clusters touched since the last call
+        as [{"members": [labels by weighted degree], "size", "weight"}],
+        heaviest first.
+        """
+        n = len(self.labels)
+        if n == 0 or not self.weights:
+            self.touched.clear()
+            return []
+        deadline = time.monotonic() + time_budget_ms / 1000.0
+        propagate = _propagate_numpy if np is not None else _propagate_python
+        labels, degree, internal = propagate(
+            n, self.rows, self.cols, self.weights, list(self.cluster_of), deadline
+        )
+        self.cluster_of = labels
+
+        members = {}
+        for row in range(n):
+            members.setdefault(labels[row], []).append(row)
+        touched_clusters = {labels[row] for row in self.touched}
+        self.touched.clear()
+
+        result = []
+        for label in touched_clusters:
+            rows = members[label]
+            if len(rows) < CLUSTER_MIN_SIZE:
+                continue
+            rows.sort(key=lambda row: (-degree[row], self.labels[row]))
+            result.append({
+                "members": [self.labels[row] for row in rows],
+                "size": len(rows),
+                "weight": round(internal.get(label, 0.0), 3)
+            })
+        result.sort(key=lambda c: (-c["weight"], c["members"][0]))
+        return result
+
+def _propagate_numpy(n, rows, cols, weights, labels, deadline):
+    """Vectorized label propagation over the symmetric coordinate lists."""
+    rows = np.frombuffer(rows, dtype=np.int64) if rows.itemsize == 8 else np.array(rows, dtype=np.int64)
+    cols = np.frombuffer(cols, dtype=np.int64) if cols.itemsize == 8 else np.array(cols, dtype=np.int64)
+    weights = np.frombuffer(weights, dtype=np.float64)
+    src = np.concatenate([rows, cols])
+    dst = np.concatenate([cols, rows])
+    w = np.concatenate([weights, weights])
+    labels = np.asarray(labels, dtype=np.int64)
+    # Updating a random share per round avoids the two-cycle oscillation
+    # of fully synchronous propagation.
+    rng = np.random.default_rng(0)
+
+    for _ in range(CLUSTER_MAX_ITERATIONS):
+        # Sorted by (node, candidate label), summed per pair
+        keys, inverse = np.unique(dst * n + labels[src], return_inverse=True)
+        scores = np.bincount(inverse, weights=w)
+        node, candidate = keys // n, keys % n
+        # Ties keep the current label, then go to the larger cluster
+        sizes = np.bincount(labels, minlength=n)
+        scores += 1e-3 * (candidate == labels[node]) + 1e-6 * sizes[candidate] / n
+        starts = np.flatnonzero(np.r_[True, node[1:] != node[:-1]])
+        segment = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(node)]))
+        best = np.flatnonzero(scores >= np.maximum.reduceat(scores, starts)[segment])
+        best = best[np.r_[True, segment[best][1:] != segment[best][:-1]]]
+        node, candidate = node[best], candidate[best]
+
+        changed = candidate != labels[node]
+        if not changed.any():
+            break
+        update = changed & (rng.random(len(node)) < 0.8)
+        labels[node[update]] = candidate[update]
+        if time.monotonic() > deadline:
+            break
+
+    degree = np.bincount(src, weights=w, minlength=n)
+    same = labels[rows] == labels[cols]
+    internal = np.bincount(labels[rows[same]], weights=weights[same], minlength=n)
+    return labels.tolist(), degree.tolist(), {i: v for i, v in enumerate(internal.tolist()) if v}
+
+def _propagate_python(n, rows, cols, weights, labels, deadline):
+    """The same propagation without NumPy, updating nodes in place."""
+    neighbors = [[] for _ in range(n)]
+    for i, j, weight in zip(rows, cols, weights):
+        neighbors[i].append((j, weight))
+        neighbors[j].append((i, weight))
+    sizes = {}
+    for label in labels:
+        sizes[label] = sizes.get(label, 0) + 1
+    order = [node for node in range(n) if neighbors[node]]
+    rng = random.Random(0)
+
+    for _ in range(CLUSTER_MAX_ITERATIONS):
+        changed = False
+        rng.shuffle(order)
+        for node in order:
+            scores = {}
+            for other, weight in neighbors[node]:
+                scores[labels[other]] = scores.get(labels[other], 0.0) + weight
+            current = labels[node]
+            best = min(scores, key=lambda label: (-scores[label], label != current, -sizes[label], label))
+            if best != current:
+                changed = True
+                labels[node] = best
+                sizes[current] -= 1
+                sizes[best] = sizes.get(best, 0) + 1
+        if not changed or time.monotonic() > deadline:
+            break
+
+    degree = [sum(weight for _, weight in neighbors[node]) for node in range(n)]
+    internal = {}
+    for i, j, weight in zip(rows, cols, weights):
+        if labels[i] == labels[j]:
+            internal[labels[i]] = internal.get(labels[i], 0.0) + weight
+    return labels, degree, internal
+
+COOCCURRENCE = ConceptCooccurrence()
+COOCCURRENCE_TYPES = ("concept", "document")
+COOCCURRENCE_EXPORT = "cognitive-loop-cooccurrence"
+GRAPH_EXPORT = "cognitive-loop-graph"      # unfiltered, after an expired cursor
+
 # ------------------------------------------------------------
 # Tool: run_cycle (full autonomous cycle)
 # ------------------------------------------------------------
@@ -119,27 +727,41 @@ def tool_run_cycle(params):
       - call `apply_insights`
       - execute the write calls
       - update the state node
+    - Only changes since `change_cursor` (the state's last_change_cursor)
+      are read.
     """
 
     mode = params.get("mode", "normal")
+    change_cursor = params.get("change_cursor") or 0
+
+    graph_reads = [KG_CLIENT.changes_since(change_cursor)]
+    message = (
+        "v0.5 run_cycle initialized. Execute this read plan, then call `reflect` "
+        "with the changes_since result as `changes` and the aggregates node's data as "
+        "`aggregates`, then `apply_insights` with both node ids, then execute its writes."
+    )
+    if change_cursor > COOCCURRENCE.cursor and np is not None:
+        graph_reads.append(KG_CLIENT.export_subgraph(COOCCURRENCE_EXPORT, COOCCURRENCE_TYPES))
+        message += " Pass the export_subgraph result to `reflect` as `subgraph_export`."
+    message += (
+        " If changes_since reports `expired`, run export_subgraph without type filters "
+        "and pass that as `subgraph_export` instead."
+    )
 
-    read_plan = [
-        KG_CLIENT.list_recent_nodes(limit=20),
-        KG_CLIENT.list_recent_edges(limit=20),
+    read_plan = graph_reads + [
+        KG_CLIENT.top_central_nodes(limit=5),
         {
             "call": "long_term_memory:list_memories",
             "arguments": {"limit": 20}
         },
-        KG_CLIENT.find_state_node()
+        KG_CLIENT.find_state_node(),
+        KG_CLIENT.find_aggregates_node()
     ]
 
     return {
         "mode": mode,
         "plan": read_plan,
-        "message": (
-            "v0.5 run_cycle initialized. Execute this read plan, then call `reflect` "
-            "with the results, then `apply_insights`, then update the cognitive_state node."
-        )
+        "message": message
     }
 
 # ------------------------------------------------------------
@@ -150,21 +772,77 @@ def tool_reflect(params):
     """
     Accepts:
         {
-            "nodes": [...],
+            "changes": {...}, # changes_since result: what changed since the last cycle
+            "nodes": [...],   # or new/changed nodes and edges directly
             "edges": [...],
             "memories": [...],
-            "state": {...}   # optional cognitive_state data
+            "state": {...},  # optional cognitive_state data
+            "aggregates": {...},  # cognitive_aggregates node data
+            "subgraph_export": {...},  # export_subgraph result, when run_cycle asked for it;
+                                       # an unfiltered one if `changes` has expired
+            "central_nodes": [...]  # optional top_central_nodes result nodes
         }
 
     Produces:
         - reflection text
         - summary (including cognitive_state-aware info)
+        - aggregates_patch: merge patch for the aggregates node
     """
 
     nodes = params.get("nodes", [])
     edges = params.get("edges", [])
     memories = params.get("memories", [])
     state = params.get("state", {}) or default_cognitive_state()
+    changes = params.get("changes")
+    central_nodes = params.get("central_nodes", [])
+
+    change_cursor = state.get("last_change_cursor")
+    events = None
+    if changes is not None:
+        nodes = changes.get("nodes", [])
+        edges = changes.get("edges", [])
+        events = changes.get("events")
+        change_cursor = changes.get("cursor", change_cursor)
+
+    exported = read_export(params["subgraph_export"]) if params.get("subgraph_export") else None
+    reset = bool(changes is not None and changes.get("expired"))
+    if reset and (exported is None or exported["filters"]):
+        raise ValueError(
+            "changes expired: pass an export_subgraph result without filters as `subgraph_export`"
+        )
+
+    stored = params.get("aggregates") or default_aggregates()
+    legacy = state.get("aggregates")
+    migrate = bool(legacy) and not stored.get("cycles")
+    if reset:
+        # Events since the state's cursor were pruned: recount the whole
+        # graph, then fold in any events newer than the export.
+        aggregates = default_aggregates()
+        update_aggregates(
+            aggregates, [n for n in exported["nodes"] if n["type"] not in STATE_NODE_TYPES], exported["edges"]
+        )
+        events = [e for e in events or [] if e[0] > exported["change_seq"]]
+        newer_nodes = {e[2] for e in events if e[1] == "node"}
+        newer_edges = {e[2] for e in events if e[1] == "edge"}
+        nodes = [node for node in nodes if node["id"] in newer_nodes]
+        edges = [edge for edge in edges if edge["id"] in newer_edges]
+        update_aggregates(aggregates, nodes, edges, events)
+        aggregates["cycles"] = stored.get("cycles", 0) + 1
+        aggregates_patch = replacement_patch(stored, aggregates)
+    else:
+        aggregates = copy.deepcopy(legacy if migrate else stored)
+        aggregates_patch = update_aggregates(aggregates, nodes, edges, events)
+        if migrate:
+            # Aggregates still in an old state header: carry all of them over
+            aggregates_patch = copy.deepcopy(aggregates)
+
+    # The matrix misses history if this process has not seen every
+    # change up to the state's cursor (e.g. after a restart).
+    if exported is not None:
+        COOCCURRENCE.load(exported)
+    cooccurrence_complete = (state.get("last_change_cursor") or 0) <= COOCCURRENCE.cursor
+    COOCCURRENCE.update(nodes, edges, events, changes.get("cursor") if changes is not None else None)
+    history_concepts = top_concepts(aggregates)
 
     concepts = [n["label"] for n in nodes if n.get("type") == "concept"]
     documents = [n for n in nodes if n.get("type") == "document"]
@@ -172,15 +850,34 @@ def tool_reflect(params):
     reflection = []
 
     if nodes:
-        reflection.append(f"{len(nodes)} recent nodes are present in the knowledge graph.")
+        reflection.append(f"{len(nodes)} nodes are new or changed since the last cycle.")
     if edges:
-        reflection.append(f"{len(edges)} edges currently link concepts and entities.")
+        reflection.append(f"{len(edges)} edges are new or changed since the last cycle.")
     if concepts:
         reflection.append("Active concepts: " + ", ".join(concepts[:10]))
+    if history_concepts:
+        reflection.append(
+            "Most active concepts over time: "
+            + ", ".join(f"{label} ({weight})" for label, weight in history_concepts)
+        )
+    if aggregates["type_counts"]:
+        reflection.append(
+            "Nodes created so far by type: "
+            + ", ".join(f"{t} {n}" for t, n in sorted(aggregates["type_counts"].items(), key=lambda kv: -kv[1]))
+        )
     if documents:
         reflection.append(f"{len(documents)} document nodes detected.")
+    if aggregates["documents"]["total"]:
+        reflection.append(
+            f"{aggregates['documents']['total']} documents in total "
+            f"(recent activity {aggregates['documents']['recent']:.1f})."
+        )
     if memories:
         reflection.append(f"{len(memories)} recent memory entries retrieved.")
+    if central_nodes:
+        reflection.append(
+            "Most central nodes (PageRank): " + ", ".join(n["label"] for n in central_nodes[:5])
+        )
 
     if not reflection:
         reflection.append("No recent activity detected across graph or memory.")
@@ -190,7 +887,10 @@ def tool_reflect(params):
     if documents:
         reflection.append("Recent documents may need tagging or entity extraction.")
     if edges:
-        reflection.append("Graph connectivity is non-zero — consider exploring subgraphs or central nodes.")
+        reflection.append(
+            "Graph connectivity is non-zero — consider exploring subgraphs or central nodes "
+            "(knowledge-graph: neighbors, k_hop_subgraph, shortest_path)."
+        )
 
     # Incorporate cognitive state
     cycle_count = state.get("cycle_count", 0)
@@ -215,11 +915,24 @@ def tool_reflect(params):
         "active_concepts": concepts[:10],
         "cycle_count": cycle_count,
         "last_cycle_time": last_cycle_time,
+        "change_cursor": change_cursor,
+        "central_nodes": [n["label"] for n in central_nodes[:5]],
+        "top_concepts": history_concepts,
+        "type_counts": aggregates["type_counts"],
+        "relation_counts": aggregates["relation_counts"],
+        "documents": aggregates["documents"],
+        "cooccurrence": {
+            "concepts": len(COOCCURRENCE.labels),
+            "pairs": len(COOCCURRENCE.weights),
+            "complete": cooccurrence_complete,
+        },
+        "change_log_reset": reset,
     }
 
     return {
         "reflection": " ".join(reflection),
-        "summary": summary
+        "summary": summary,
+        "aggregates_patch": aggregates_patch
     }
 
 # ------------------------------------------------------------
@@ -233,25 +946,36 @@ def tool_apply_insights(params):
             "reflection": "...",
             "summary": {...},
             "state_node_id": <id>,        # ID of the cognitive_state node in KG
-            "state": {...}                # current cognitive_state data
+            "state": {...},               # current cognitive_state header
+            "aggregates_node_id": <id>,   # ID of the cognitive_aggregates node
+            "aggregates_patch": {...},    # from reflect
+            "mode": "normal",
+            "time_budget_ms": 500         # optional cap on clustering time
         }
 
     Returns:
         {
             "write_plan": [ ... ],        # KG write operations
-            "updated_state": {...},       # new cognitive_state data
+            "batched_call": {...},        # the same plan as one apply_write_plan call
+            "updated_state": {...},       # new cognitive_state header
+            "history_record": {...},      # this cycle's state_history record
             "message": "..."
         }
 
     The host is expected to:
-        - execute the write_plan (add_node, add_edge, update_state_node)
-        - persist updated_state into the cognitive_state node's data
+        - execute the write_plan, step by step or as the single `batched_call`
+          (it patches the state header and aggregates node and appends the
+          cycle's record to the state history)
     """
 
     reflection_text = params.get("reflection", "")
     summary = params.get("summary", {})
     state_node_id = params.get("state_node_id")
     state = params.get("state", {}) or default_cognitive_state()
+    aggregates_node_id = params.get("aggregates_node_id")
+    aggregates_patch = params.get("aggregates_patch")
+    if aggregates_patch and aggregates_node_id is None:
+        raise ValueError("aggregates_node_id is required with aggregates_patch")
 
     active_concepts = summary.get("active_concepts", [])
 
@@ -269,15 +993,22 @@ def tool_apply_insights(params):
     )
     write_plan.append(reflection_node_call)
 
-    # 2. Insight node if multiple active concepts
-    if len(active_concepts) > 1:
-        insight_label = "Concept Cluster: " + ", ".join(active_concepts[:4])
+    # 2. One insight node per concept cluster touched this cycle
+    cluster_budget_ms = CLUSTER_TIME_BUDGET_MS
+    if params.get("time_budget_ms") is not None:
+        cluster_budget_ms = min(cluster_budget_ms, params["time_budget_ms"])
+    clusters = COOCCURRENCE.clusters(cluster_budget_ms)
+    for cluster in clusters[:CLUSTER_INSIGHTS_MAX]:
+        insight_label = "Concept Cluster: " + ", ".join(cluster["members"][:CLUSTER_LABEL_MEMBERS])
         insight_node_call = KG_CLIENT.add_node(
             label=insight_label,
             type_="insight",
             data={
-                "related_concepts": active_concepts
-            }
+                "related_concepts": cluster["members"][:CLUSTER_DATA_MEMBERS],
+                "cluster_size": cluster["size"],
+                "cluster_weight": cluster["weight"]
+            },
+            unique=True
         )
         write_plan.append(insight_node_call)
 
@@ -289,35 +1020,172 @@ def tool_apply_insights(params):
         data={
             "source": "cognitive-loop",
             "reflection": reflection_text
-        }
+        },
+        unique=True
     )
     write_plan.append(action_node_call)
 
-    # 4. Update cognitive_state node in the KG
-    # We don't know the exact schema of the KG's update_node tool,
-    # so we express this as a high-level intention:
-    # "knowledge-graph:update_node_data" with state_node_id and updated_state.
-
-    new_state = dict(state)
-    new_state["cycle_count"] = state.get("cycle_count", 0) + 1
-    new_state["last_cycle_time"] = datetime.utcnow().isoformat(timespec="seconds")
-    new_state["last_reflection"] = reflection_text
-    new_state["last_summary"] = summary
-    new_state["last_active_concepts"] = active_concepts
-
-    update_state_call = {
-        "call": "knowledge-graph:update_node_data",
-        "arguments": {
-            "node_id": state_node_id,
-            "data": new_state
-        }
+    # 4. Update the cognitive_state header and append this cycle's record
+    # The header is a constant-size merge patch; the record goes to the
+    # state history, which diffs it against the last stored record.
+
+    cycle = state.get("cycle_count", 0) + 1
+    cycle_time = datetime.utcnow().isoformat(timespec="seconds")
+    state_updates = {
+        "cycle_count": cycle,
+        "last_cycle_time": cycle_time,
+        "last_mode": params.get("mode", state.get("last_mode", "normal")),
+        "last_change_cursor": summary.get("change_cursor", state.get("last_change_cursor")),
     }
-    write_plan.append(update_state_call)
+    if summary.get("change_log_reset"):
+        state_updates["last_reset_cycle"] = cycle
+    for field in LEGACY_STATE_FIELDS:
+        if field in state:
+            state_updates[field] = None
+
+    new_state = {k: v for k, v in state.items() if k not in LEGACY_STATE_FIELDS}
+    new_state.update(state_updates)
+    for field in LEGACY_STATE_FIELDS:
+        new_state.pop(field, None)
+
+    record = {
+        "time": cycle_time,
+        "reflection": reflection_text,
+        "summary": summary,
+        "active_concepts": active_concepts,
+        "insights": [call["arguments"]["label"] for call in write_plan if call["arguments"]["type"] == "insight"],
+    }
+
+    if aggregates_patch:
+        write_plan.append(KG_CLIENT.patch_node_data(aggregates_node_id, merge=aggregates_patch))
+    write_plan.append(KG_CLIENT.patch_node_data(state_node_id, merge=state_updates))
+    write_plan.append(KG_CLIENT.append_state_history(state_node_id, cycle, record))
 
     return {
         "write_plan": write_plan,
+        "batched_call": KG_CLIENT.apply_write_plan(write_plan),
         "updated_state": new_state,
-        "message": "Insights converted into direct write operations and cognitive_state update."
+        "history_record": record,
+        "clusters": len(clusters),
+        "message": (
+            "Insights converted into direct write operations and cognitive_state update. "
+            "Execute `batched_call` to apply the whole write_plan in one transaction, "
+            "or run the write_plan steps individually."
+        )
+    }
+
+# ------------------------------------------------------------
+# Tool: run_full_cycle (direct mode)
+# ------------------------------------------------------------
+
+# Reads the cycle can do without, e.g. when NumPy is missing graph-side
+OPTIONAL_READS = {"knowledge-graph:top_central_nodes", "knowledge-graph:export_subgraph"}
+
+def tool_run_full_cycle(params):
+    """
+    Run a whole cycle in one call: read plan, reflect, apply_insights and
+    the write plan, executed against the Knowledge Graph (and long-term
+    memory server) directly.
+
+    Accepts:
+        {
+            "mode": "normal",
+            "transport": "inprocess",    # or "stdio"; default KG_TRANSPORT
+            "memories": [...],           # long-term memory entries, if the host
+                                         # has them; else read via LTM_SERVER_COMMAND
+            "time_budget_ms": 5000       # optional: skip optional reads and
+                                         # shorten clustering past this
+        }
+
+    Returns the reflection, summary, updated state, write results and
+    per-phase timings.
+    """
+    transport = graph_transport(params.get("transport"))
+    timings = {}
+    started = time.monotonic()
+    budget_ms = params.get("time_budget_ms")
+    deadline = started + budget_ms / 1000.0 if budget_ms is not None else None
+
+    def lap(phase):
+        nonlocal started
+        now = time.monotonic()
+        timings[phase] = round((now - started) * 1000, 1)
+        started = now
+
+    state_node = execute_call(transport, KG_CLIENT.find_state_node())
+    state = state_node["data"] or default_cognitive_state()
+    aggregates_node = execute_call(transport, KG_CLIENT.find_aggregates_node())
+
+    cycle = tool_run_cycle({
+        "mode": params.get("mode", "normal"),
+        "change_cursor": state.get("last_change_cursor")
+    })
+    reads = {}
+    skipped = []
+    for descriptor in cycle["plan"]:
+        call = descriptor["call"]
+        if descriptor in (KG_CLIENT.find_state_node(), KG_CLIENT.find_aggregates_node()):
+            continue
+        if call.startswith(LTM_CALL_PREFIX):
+            if "memories" in params:
+                continue
+            memory = memory_transport()
+            if memory is None:
+                skipped.append(call)
+            else:
+                reads["memories"] = memory_entries(execute_call(memory, descriptor, LTM_CALL_PREFIX))
+            continue
+        if not call.startswith(KG_CALL_PREFIX) or (
+            call in OPTIONAL_READS and deadline is not None and time.monotonic() > deadline
+        ):
+            skipped.append(call)
+            continue
+        try:
+            reads[call[len(KG_CALL_PREFIX):]] = execute_call(transport, descriptor)
+        except RuntimeError:
+            if call not in OPTIONAL_READS:
+                raise
+            skipped.append(call)
+    if (reads.get("changes_since") or {}).get("expired"):
+        # Events were pruned before this loop saw them: recount from a full export
+        reads["export_subgraph"] = execute_call(transport, KG_CLIENT.export_subgraph(GRAPH_EXPORT))
+    lap("read_ms")
+
+    reflection = tool_reflect({
+        "changes": reads.get("changes_since"),
+        "central_nodes": reads.get("top_central_nodes", {}).get("nodes", []),
+        "memories": params.get("memories", reads.get("memories", [])),
+        "state": state,
+        "aggregates": aggregates_node["data"],
+        "subgraph_export": reads.get("export_subgraph")
+    })
+    insights = tool_apply_insights({
+        "reflection": reflection["reflection"],
+        "summary": reflection["summary"],
+        "state_node_id": state_node["node_id"],
+        "state": state,
+        "aggregates_node_id": aggregates_node["node_id"],
+        "aggregates_patch": reflection["aggregates_patch"],
+        "mode": cycle["mode"],
+        "time_budget_ms": (
+            max(0.0, (deadline - time.monotonic()) * 1000.0) if deadline is not None else None
+        )
+    })
+    lap("reflect_ms")
+
+    written = execute_call(transport, insights["batched_call"])
+    lap("write_ms")
+
+    return {
+        "mode": cycle["mode"],
+        "transport": transport.name,
+        "state_node_id": state_node["node_id"],
+        "reflection": reflection["reflection"],
+        "summary": reflection["summary"],
+        "updated_state": insights["updated_state"],
+        "written": written["results"],
+        "skipped_calls": skipped,
+        "timings": timings
     }
 
 # ------------------------------------------------------------
@@ -330,23 +1198,277 @@ def tool_heartbeat(params):
 
     Accepts:
         {
-            "state": {...}   # optional cognitive_state data from KG
+            "state": {...},       # optional cognitive_state header from KG
+            "state_node_id": 3,   # optional: adds a descriptor for recent history
+            "history": 5          # records to ask for (default 5)
         }
 
     Returns:
-        - a snapshot of the cognitive loop's last known state
+        - a snapshot of the cognitive loop's last known state header
+        - with state_node_id, a get_state_history call for recent cycles
     """
 
     state = params.get("state", {}) or default_cognitive_state()
+    state_node_id = params.get("state_node_id")
 
-    return {
+    result = {
         "status": "ok",
         "state": state,
         "message": (
-            "Cognitive Loop v0.5 heartbeat. State is stored in the Knowledge Graph "
-            "under a cognitive_state node."
+            "Cognitive Loop v0.5 heartbeat. The state header is stored in the Knowledge Graph "
+            "under a cognitive_state node; per-cycle records are in its state history."
         )
     }
+    if state_node_id is not None:
+        result["history_call"] = KG_CLIENT.get_state_history(
+            state_node_id, limit=params.get("history", 5), reconstruct=True
+        )
+    return result
+
+# ------------------------------------------------------------
+# Cycle scheduler (background, direct mode)
+# ------------------------------------------------------------
+#
+# Runs cycles on a cadence and/or after CYCLE_CHANGE_THRESHOLD graph
+# changes. Triggers coalesce; cycles are rate-limited, with backoff after
+# failures and overruns. CYCLE_LOCK serializes cycles with the request loop.
+
+CYCLE_INTERVAL_S = float(os.environ.get("CYCLE_INTERVAL_S", 0))              # 0: no cadence
+CYCLE_CHANGE_THRESHOLD = int(os.environ.get("CYCLE_CHANGE_THRESHOLD", 0))    # 0: no change trigger
+CYCLE_MIN_INTERVAL_S = float(os.environ.get("CYCLE_MIN_INTERVAL_S", 30))     # max cycle rate
+CYCLE_TIME_BUDGET_MS = float(os.environ.get("CYCLE_TIME_BUDGET_MS", 5000))
+CYCLE_POLL_S = float(os.environ.get("CYCLE_POLL_S", 5))                      # change-count checks
+CYCLE_BACKOFF_MAX_S = 600
+
+# Node types the loop writes itself; they never count towards a trigger
+LOOP_NODE_TYPES = STATE_NODE_TYPES + ("reflection", "insight", "action")
+
+CYCLE_LOCK = threading.RLock()
+
+class CycleScheduler:
+    def __init__(self):
+        self.config = {
+            "interval_s": CYCLE_INTERVAL_S,
+            "change_threshold": CYCLE_CHANGE_THRESHOLD,
+            "min_interval_s": CYCLE_MIN_INTERVAL_S,
+            "time_budget_ms": CYCLE_TIME_BUDGET_MS,
+            "poll_s": CYCLE_POLL_S,
+            "transport": None,
+        }
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self.paused = False
+        self.pending = set()            # reasons for the next cycle
+        self.running = False
+        self.backoff_s = 0.0            # added to min_interval_s after overruns
+        self.change_cursor = None
+        self.last_started = None        # time.monotonic()
+        self.last_poll = None
+        self.last_cycle = None
+        self.last_error = None
+        self.counters = {"cycles": 0, "triggers": 0, "coalesced": 0, "overruns": 0, "errors": 0}
+
+    # -- control ---------------------------------------------------
+
+    def enabled(self):
+        return bool(self.config["interval_s"] or self.config["change_threshold"])
+
+    def start(self):
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="cycle-scheduler", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=None):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def pause(self):
+        with self._cond:
+            self.paused = True
+            self._cond.notify_all()
+
+    def resume(self, **config):
+        with self._cond:
+            for key, value in config.items():
+                if value is not None:
+                    self.config[key] = value
+            self.paused = False
+            self.backoff_s = 0.0
+            self._cond.notify_all()
+        if self.enabled():
+            self.start()
+
+    def trigger(self, reason):
+        """Request a cycle; coalesces with one already pending or running."""
+        with self._cond:
+            self.counters["triggers"] += 1
+            if self.pending or self.running:
+                self.counters["coalesced"] += 1
+            self.pending.add(reason)
+            self._cond.notify_all()
+
+    # -- loop ------------------------------------------------------
+
+    def _next_allowed(self):
+        if self.last_started is None:
+            return 0.0
+        return self.last_started + self.config["min_interval_s"] + self.backoff_s
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._stopping:
+                    return
+                if self.paused or not self.enabled():
+                    self._cond.wait()
+                    continue
+                now = time.monotonic()
+                interval = self.config["interval_s"]
+                if interval and (self.last_started is None or now >= self.last_started + interval):
+                    if "cadence" not in self.pending:
+                        self.pending.add("cadence")
+                        self.counters["triggers"] += 1
+                poll_due = bool(self.config["change_threshold"]) and (
+                    self.last_poll is None or now >= self.last_poll + self.config["poll_s"]
+                )
+
+            if poll_due:
+                self._poll_changes()
+
+            with self._cond:
+                if self._stopping:
+                    return
+                now = time.monotonic()
+                if self.pending and not self.paused and now >= self._next_allowed():
+                    reasons = sorted(self.pending)
+                    self.pending.clear()
+                    self.running = True
+                else:
+                    wakeups = [self._next_allowed() if self.pending else None]
+                    if self.config["interval_s"] and self.last_started is not None:
+                        wakeups.append(self.last_started + self.config["interval_s"])
+                    if self.config["change_threshold"] and self.last_poll is not None:
+                        wakeups.append(self.last_poll + self.config["poll_s"])
+                    wakeups = [t for t in wakeups if t is not None]
+                    self._cond.wait(max(0.0, min(wakeups) - now) if wakeups else None)
+                    continue
+
+            self._run_cycle(reasons)
+
+    def _poll_changes(self):
+        """Trigger a cycle once CYCLE_CHANGE_THRESHOLD outside changes pile up."""
+        self.last_poll = time.monotonic()
+        threshold = self.config["change_threshold"]
+        try:
+            transport = graph_transport(self.config["transport"])
+            if self.change_cursor is None:
+                state = execute_call(transport, KG_CLIENT.find_state_node())["data"] or {}
+                self.change_cursor = state.get("last_change_cursor") or 0
+            changes = execute_call(transport, KG_CLIENT.changes_since(
+                self.change_cursor, limit=threshold, exclude_types=LOOP_NODE_TYPES, include_rows=False
+            ))
+        except Exception as e:
+            self.last_error = f"change poll: {e}"
+            return
+        if len(changes["events"]) >= threshold:
+            self.trigger("changes")
+
+    def _run_cycle(self, reasons):
+        started = time.monotonic()
+        with self._cond:
+            self.last_started = started
+        budget_ms = self.config["time_budget_ms"]
+        error = None
+        try:
+            with CYCLE_LOCK:
+                result = tool_run_full_cycle({
+                    "transport": self.config["transport"],
+                    "time_budget_ms": budget_ms,
+                })
+        except Exception as e:
+            error = str(e)
+        duration_ms = (time.monotonic() - started) * 1000.0
+
+        with self._cond:
+            self.running = False
+            self.counters["cycles"] += 1
+            overrun = duration_ms > budget_ms
+            if error is not None:
+                self.counters["errors"] += 1
+                self.last_error = error
+            if overrun:
+                self.counters["overruns"] += 1
+            if error is not None or overrun:
+                base = max(self.config["min_interval_s"], 1.0)
+                self.backoff_s = min(CYCLE_BACKOFF_MAX_S, max(base, 2 * self.backoff_s))
+            else:
+                self.backoff_s = 0.0
+                self.change_cursor = result["updated_state"].get("last_change_cursor")
+            self.last_cycle = {
+                "reasons": reasons,
+                "finished_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "duration_ms": round(duration_ms, 1),
+                "cycle": None if error else result["updated_state"].get("cycle_count"),
+                "error": error,
+            }
+
+    def status(self):
+        with self._cond:
+            now = time.monotonic()
+            next_allowed = self._next_allowed()
+            return {
+                "enabled": self.enabled(),
+                "alive": self._thread is not None and self._thread.is_alive(),
+                "paused": self.paused,
+                "running": self.running,
+                "pending": sorted(self.pending),
+                "config": dict(self.config),
+                "backoff_s": self.backoff_s,
+                "next_cycle_allowed_in_s": round(max(0.0, next_allowed - now), 1),
+                "change_cursor": self.change_cursor,
+                "last_cycle": self.last_cycle,
+                "last_error": self.last_error,
+                "counters": dict(self.counters),
+            }
+
+SCHEDULER = CycleScheduler()
+
+def tool_schedule_status(params):
+    """Scheduler configuration, pending triggers, last cycle and counters."""
+    return SCHEDULER.status()
+
+def tool_pause(params):
+    """Stop starting new cycles (a running cycle finishes)."""
+    SCHEDULER.pause()
+    return SCHEDULER.status()
+
+def tool_resume(params):
+    """
+    Resume (or start) scheduled cycles, optionally reconfiguring:
+        { "interval_s": 300, "change_threshold": 200, "min_interval_s": 30,
+          "time_budget_ms": 5000, "poll_s": 5, "transport": "inprocess" }
+    """
+    config = {key: params.get(key) for key in SCHEDULER.config}
+    if config["transport"] is not None and config["transport"] not in GRAPH_TRANSPORTS:
+        raise ValueError(f"Unknown transport: {config['transport']}")
+    for key in ("interval_s", "min_interval_s", "poll_s", "time_budget_ms", "change_threshold"):
+        value = config[key]
+        if value is None:
+            continue
+        kinds = int if key == "change_threshold" else (int, float)
+        if isinstance(value, bool) or not isinstance(value, kinds) or value < 0:
+            raise ValueError(f"{key} must be a non-negative number")
+        # 0 turns the cadence or the change trigger off; elsewhere it would spin
+        if value == 0 and key not in ("interval_s", "change_threshold"):
+            raise ValueError(f"{key} must be positive")
+    SCHEDULER.resume(**config)
+    return SCHEDULER.status()
 
 # ------------------------------------------------------------
 # Dispatch
@@ -386,7 +1508,8 @@ def handle_request(msg):
                             "inputSchema": {
                                 "type": "object",
                                 "properties": {
-                                    "mode": { "type": "string" }
+                                    "mode": { "type": "string" },
+                                    "change_cursor": { "type": "integer" }
                                 }
                             }
                         },
@@ -398,7 +1521,11 @@ def handle_request(msg):
                                     "nodes": { "type": "array" },
                                     "edges": { "type": "array" },
                                     "memories": { "type": "array" },
-                                    "state": { "type": "object" }
+                                    "state": { "type": "object" },
+                                    "changes": { "type": "object" },
+                                    "aggregates": { "type": "object" },
+                                    "subgraph_export": { "type": "object" },
+                                    "central_nodes": { "type": "array", "items": { "type": "object" } }
                                 }
                             }
                         },
@@ -410,17 +1537,63 @@ def handle_request(msg):
                                     "reflection": { "type": "string" },
                                     "summary": { "type": "object" },
                                     "state_node_id": { "type": "integer" },
-                                    "state": { "type": "object" }
+                                    "state": { "type": "object" },
+                                    "aggregates_node_id": { "type": "integer" },
+                                    "aggregates_patch": { "type": "object" },
+                                    "mode": { "type": "string" },
+                                    "time_budget_ms": { "type": "number" }
                                 },
                                 "required": ["reflection", "summary", "state_node_id"]
                             }
                         },
+                        {
+                            "name": "run_full_cycle",
+                            "inputSchema": {
+                                "type": "object",
+                                "properties": {
+                                    "mode": { "type": "string" },
+                                    "transport": { "type": "string", "enum": ["inprocess", "stdio"] },
+                                    "memories": { "type": "array" },
+                                    "time_budget_ms": { "type": "number" }
+                                }
+                            }
+                        },
+                        {
+                            "name": "schedule_status",
+                            "inputSchema": {
+                                "type": "object",
+                                "properties": {}
+                            }
+                        },
+                        {
+                            "name": "pause",
+                            "inputSchema": {
+                                "type": "object",
+                                "properties": {}
+                            }
+                        },
+                        {
+                            "name": "resume",
+                            "inputSchema": {
+                                "type": "object",
+                                "properties": {
+                                    "interval_s": { "type": "number" },
+                                    "change_threshold": { "type": "integer" },
+                                    "min_interval_s": { "type": "number" },
+                                    "time_budget_ms": { "type": "number" },
+                                    "poll_s": { "type": "number" },
+                                    "transport": { "type": "string", "enum": ["inprocess", "stdio"] }
+                                }
+                            }
+                        },
                         {
                             "name": "heartbeat",
                             "inputSchema": {
                                 "type": "object",
                                 "properties": {
-                                    "state": { "type": "object" }
+                                    "state": { "type": "object" },
+                                    "state_node_id": { "type": "integer" },
+                                    "history": { "type": "integer" }
                                 }
                             }
                         }
@@ -436,11 +1609,22 @@ def handle_request(msg):
             if tool == "run_cycle":
                 result = tool_run_cycle(args)
             elif tool == "reflect":
-                result = tool_reflect(args)
+                with CYCLE_LOCK:
+                    result = tool_reflect(args)
             elif tool == "apply_insights":
-                result = tool_apply_insights(args)
+                with CYCLE_LOCK:
+                    result = tool_apply_insights(args)
+            elif tool == "run_full_cycle":
+                with CYCLE_LOCK:
+                    result = tool_run_full_cycle(args)
             elif tool == "heartbeat":
                 result = tool_heartbeat(args)
+            elif tool == "schedule_status":
+                result = tool_schedule_status(args)
+            elif tool == "pause":
+                result = tool_pause(args)
+            elif tool == "resume":
+                result = tool_resume(args)
             else:
                 raise ValueError(f"Unknown tool: {tool}")
 
@@ -475,11 +1659,17 @@ def handle_request(msg):
 # ------------------------------------------------------------
 
 def main():
+    if SCHEDULER.enabled():
+        SCHEDULER.start()
     while True:
         msg = read_message()
         if msg is None:
             break
         handle_request(msg)
+    # Wait for a running cycle, so it never sees its transports closed
+    SCHEDULER.stop()
+    for transport in _transports.values():
+        transport.close()
 
 if __name__ == "__main__":
     main()
@@ -1,25 +1,490 @@
 #!/usr/bin/env python3
+import base64
+import bisect
+import gzip
+import hashlib
 import json
+import os
+import random
+import re
 import sys
 import sqlite3
-from datetime import datetime
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from queue import Empty, Queue
 
-DB_PATH = "knowledge_graph.db"
+# Optional: NumPy powers the in-memory adjacency cache, graph analytics
+# and the embedding index
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Optional: Arrow IPC as an alternative subgraph export format
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:
+    pa = None
+
+DB_PATH = "knowledge_graph.db"                # the default graph
+
+# Named graphs: one database file each, opened on demand
+DEFAULT_GRAPH = "default"
+GRAPHS_DIR = os.path.splitext(DB_PATH)[0] + "_graphs"
+GRAPH_CACHE_SIZE = 8                          # named graphs kept open (LRU)
+
+# Per-graph sidecar files, next to the graph's database file
+ARCHIVE_SUFFIX = "_archive.db"
+EMBEDDING_SUFFIX = "_embeddings.npy"
+SNAPSHOT_SUFFIX = "_snapshots"
+
+# Connection tuning (applied to every pooled connection)
+READER_POOL_SIZE = 4
+BUSY_TIMEOUT_MS = int(os.environ.get("KG_BUSY_TIMEOUT_MS", 5000))
+CACHE_SIZE_KIB = 64 * 1024          # page cache per connection (64 MiB)
+MMAP_SIZE = 256 * 1024 * 1024       # memory-mapped I/O window (256 MiB)
+STATEMENT_CACHE_SIZE = 256          # prepared statements kept per connection
+
+# Lock contention between processes sharing a database file: after
+# SQLite's own busy wait expires, retry with jittered exponential backoff.
+LOCK_RETRIES = int(os.environ.get("KG_LOCK_RETRIES", 3))
+LOCK_BACKOFF_MS = float(os.environ.get("KG_LOCK_BACKOFF_MS", 25))
+LOCK_BACKOFF_MAX_MS = float(os.environ.get("KG_LOCK_BACKOFF_MAX_MS", 1000))
+
+# Traversal limits (graph walks are always bounded server-side)
+MAX_TRAVERSAL_DEPTH = 6
+DEFAULT_MAX_FANOUT = 100            # edges followed per visited node
+DEFAULT_MAX_NODES = 500             # nodes returned by a walk
+MAX_VISITS_PER_NODE = 8             # walk budget = max_nodes * this
+
+# In-memory CSR adjacency cache (requires NumPy)
+ADJACENCY_CACHE_ENABLED = True
+ADJACENCY_MEMORY_BUDGET = 512 * 1024 * 1024   # bytes; larger graphs stay on SQLite
+ADJACENCY_REBUILD_MIN_DELTA = 10000           # rebuild once this many edges are pending...
+ADJACENCY_REBUILD_RATIO = 0.10                # ...and they exceed this share of the base
+
+# Graph analytics (requires NumPy)
+PAGERANK_DAMPING = 0.85
+PAGERANK_TOLERANCE = 1e-6                     # L1 change between iterations
+PAGERANK_MAX_ITERATIONS = 100
+METRICS_REFRESH_CHANGES = 1000                # change-log events before metrics go stale
+
+# Node embedding index (requires NumPy)
+EMBEDDING_DIM = 256                           # dimension of the default hashing embedder
+EMBEDDING_BATCH_SIZE = 1000                   # nodes embedded per batch during sync
+EMBEDDING_MIN_CAPACITY = 1024                 # initial rows in the .npy sidecar
+
+# Triple-pattern queries
+QUERY_MAX_PATTERNS = 8                        # edge patterns per query
+QUERY_MAX_GRAPHS = 8                          # graphs one query may span (via ATTACH)
+QUERY_DEFAULT_LIMIT = 100
+QUERY_MAX_LIMIT = 1000
+QUERY_TIMEOUT_MS = 2000                       # a query running longer is interrupted
+QUERY_STATS_REFRESH_CHANGES = 1000            # change-log events before planner stats are recounted
+
+# Snapshots
+SNAPSHOT_PAGES_PER_STEP = 1024                # pages copied per online-backup step
+SNAPSHOT_COMPRESSLEVEL = 6
+SNAPSHOT_CHUNK_SIZE = 1024 * 1024             # bytes per read while compressing / hashing
+
+# State history (per-cycle delta records of state nodes)
+STATE_CHECKPOINT_INTERVAL = 32                # cycles between full records
+STATE_HISTORY_KEEP = 1024                     # cycles kept per state node
+
+# Change log
+CHANGE_LOG_KEEP = int(os.environ.get("KG_CHANGE_LOG_KEEP", 100000))   # newest events kept; older cursors expire
+
+# Columnar subgraph exports, written where the Python sandbox can read them
+EXPORT_DIR = os.environ.get(
+    "KG_EXPORT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox", "exports")
+)
+EXPORT_FETCH_SIZE = 10000                     # rows fetched per round trip while exporting
+
+# Request loop
+READ_WORKERS = READER_POOL_SIZE               # threads serving reads (one pooled connection each)
+WRITE_BATCH_MAX = 64                          # write requests group-committed per transaction
 
 # ------------------------------------------------------------
 # DB setup
 # ------------------------------------------------------------
 
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+def is_lock_error(e):
+    """SQLITE_BUSY / SQLITE_LOCKED (including extended codes) from another connection."""
+    if not isinstance(e, sqlite3.OperationalError):
+        return False
+    code = getattr(e, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    message = str(e)
+    return "locked" in message or "busy" in message
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff, in seconds."""
+    ceiling = min(LOCK_BACKOFF_MAX_MS, LOCK_BACKOFF_MS * 2 ** attempt)
+    return random.uniform(0, ceiling) / 1000
+
+class LockStats:
+    """Counters and wait-time histograms (milliseconds) for one database."""
+
+    BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+            self.since = datetime.now(timezone.utc).isoformat()
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name, ms):
+        with self._lock:
+            hist = self.histograms.get(name)
+            if hist is None:
+                hist = self.histograms[name] = {
+                    "count": 0, "sum": 0.0, "max": 0.0,
+                    "buckets": [0] * (len(self.BUCKETS_MS) + 1)
+                }
+            hist["count"] += 1
+            hist["sum"] += ms
+            hist["max"] = max(hist["max"], ms)
+            hist["buckets"][bisect.bisect_left(self.BUCKETS_MS, ms)] += 1
+
+    def _quantile(self, hist, q):
+        """Upper bound of the bucket holding the q-quantile."""
+        rank = q * hist["count"]
+        seen = 0
+        for bound, n in zip(self.BUCKETS_MS + (None,), hist["buckets"]):
+            seen += n
+            if seen >= rank:
+                return bound if bound is not None else round(hist["max"], 3)
+        return None
+
+    def snapshot(self):
+        with self._lock:
+            histograms = {}
+            for name, hist in self.histograms.items():
+                labels = [f"<={b}" for b in self.BUCKETS_MS] + [f">{self.BUCKETS_MS[-1]}"]
+                histograms[name] = {
+                    "count": hist["count"],
+                    "mean": round(hist["sum"] / hist["count"], 3) if hist["count"] else 0.0,
+                    "max": round(hist["max"], 3),
+                    "p50": self._quantile(hist, 0.50),
+                    "p95": self._quantile(hist, 0.95),
+                    "p99": self._quantile(hist, 0.99),
+                    "buckets": {label: n for label, n in zip(labels, hist["buckets"]) if n}
+                }
+            return {"since": self.since, "counters": dict(self.counters), "wait_ms": histograms}
+
+class ConnectionManager:
+    """
+    Long-lived SQLite connections for the server process.
+
+    - One locked writer connection. `writer()` runs a BEGIN IMMEDIATE
+      transaction (nested calls become savepoints); lock errors on
+      BEGIN / COMMIT are retried with backoff and counted in `stats`.
+    - A pool of reader connections handed out by `reader()`.
+    - Caches hook into `after_commit()` to follow committed writes.
+    """
+
+    def __init__(self, path, readers=READER_POOL_SIZE):
+        self.path = path
+        self._readers = [self._connect() for _ in range(max(1, readers))]
+        self._reader_cond = threading.Condition()
+        self._writer = self._connect()
+        self._writer_lock = threading.RLock()
+        self._local = threading.local()
+        self._after_commit = []
+        self._attached = {}
+        self.stats = LockStats()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=BUSY_TIMEOUT_MS / 1000.0,
+            isolation_level=None,        # transactions are managed explicitly
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA busy_timeout = {int(BUSY_TIMEOUT_MS)}")
+        conn.execute(f"PRAGMA cache_size = -{int(CACHE_SIZE_KIB)}")
+        conn.execute(f"PRAGMA mmap_size = {int(MMAP_SIZE)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+    @contextmanager
+    def reader(self):
+        # A thread already holding the writer reads its own uncommitted state.
+        if getattr(self._local, "depth", 0):
+            yield self._writer
+            return
+        # Nested use on one thread shares the connection (and its snapshot),
+        # so a worker never holds two pool slots at once.
+        held = getattr(self._local, "reader", None)
+        if held is not None:
+            yield held
+            return
+
+        started = time.monotonic()
+        with self._reader_cond:
+            while not self._readers:
+                self._reader_cond.wait()
+            conn = self._readers.pop()
+        self.stats.observe("reader_pool", (time.monotonic() - started) * 1000)
+        self._local.reader = conn
+        try:
+            yield conn
+        finally:
+            self._local.reader = None
+            if conn.in_transaction:
+                conn.rollback()
+            with self._reader_cond:
+                self._readers.append(conn)
+                self._reader_cond.notify()
+
+    def _with_retry(self, name, fn):
+        """Run `fn`, retrying lock errors with backoff; the total wait is recorded as `name`."""
+        started = time.monotonic()
+        try:
+            for attempt in range(LOCK_RETRIES + 1):
+                try:
+                    return fn()
+                except sqlite3.OperationalError as e:
+                    if not is_lock_error(e):
+                        raise
+                    self.stats.count("lock_errors")
+                    if attempt == LOCK_RETRIES:
+                        self.stats.count("lock_failures")
+                        raise
+                    self.stats.count("lock_retries")
+                    time.sleep(backoff_delay(attempt))
+        finally:
+            self.stats.observe(name, (time.monotonic() - started) * 1000)
+
+    @contextmanager
+    def writer(self):
+        started = time.monotonic()
+        with self._writer_lock:
+            depth = getattr(self._local, "depth", 0)
+            conn = self._writer
+            savepoint = f"sp_{depth}"
+            callbacks_mark = len(self._after_commit)
+
+            if depth == 0:
+                self.stats.observe("writer_lock", (time.monotonic() - started) * 1000)
+                self._with_retry("begin_immediate", lambda: conn.execute("BEGIN IMMEDIATE"))
+                self.stats.count("write_transactions")
+            else:
+                conn.execute(f"SAVEPOINT {savepoint}")
+
+            self._local.depth = depth + 1
+            try:
+                yield conn
+            except BaseException:
+                if depth == 0:
+                    conn.rollback()
+                else:
+                    conn.execute(f"ROLLBACK TO {savepoint}")
+                    conn.execute(f"RELEASE {savepoint}")
+                del self._after_commit[callbacks_mark:]
+                raise
+            else:
+                if depth == 0:
+                    try:
+                        self._with_retry("commit", conn.commit)
+                    except BaseException:
+                        conn.rollback()
+                        del self._after_commit[callbacks_mark:]
+                        raise
+                else:
+                    conn.execute(f"RELEASE {savepoint}")
+            finally:
+                self._local.depth = depth
+
+            if depth == 0:
+                callbacks, self._after_commit = self._after_commit, []
+                for callback in callbacks:
+                    callback()
+
+    @contextmanager
+    def maintenance(self):
+        """
+        The writer connection outside any transaction, for statements
+        that cannot run inside one (ATTACH, VACUUM, incremental_vacuum).
+        """
+        with self._writer_lock:
+            if self.in_write():
+                raise RuntimeError("maintenance() cannot be used inside a write transaction")
+            yield self._writer
+
+    def attach(self, alias, path):
+        """ATTACH a database file to the writer connection (once)."""
+        with self.maintenance() as conn:
+            if alias not in self._attached:
+                conn.execute("ATTACH DATABASE ? AS " + alias, (path,))
+                self._attached[alias] = path
+
+    def in_write(self):
+        """True if the calling thread is inside a `writer()` block."""
+        return getattr(self._local, "depth", 0) > 0
+
+    def after_commit(self, callback):
+        """
+        Run `callback` once the current write transaction commits.
+        Dropped if the transaction (or enclosing savepoint) rolls back.
+        Must be called from inside `writer()`.
+        """
+        self._after_commit.append(callback)
+
+    def close(self):
+        with self._writer_lock:
+            self._writer.close()
+        with self._reader_cond:
+            for conn in self._readers:
+                conn.close()
+            self._readers = []
+
+# ------------------------------------------------------------
+# Graph namespaces
+# ------------------------------------------------------------
+#
+# Each named graph is its own database file; `use_graph()` makes one
+# current for the thread and DB / ADJACENCY / EMBEDDINGS resolve to it.
+# Nothing is opened until init_graphs().
+
+GRAPH_NAME_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+class Graph:
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        stem = os.path.splitext(path)[0]
+        self.archive_path = stem + ARCHIVE_SUFFIX
+        self.embedding_path = stem + EMBEDDING_SUFFIX
+        self.snapshot_dir = stem + SNAPSHOT_SUFFIX
+
+        self.db = ConnectionManager(path)
+        migrate(self.db)
+        self.adjacency = AdjacencyIndex(self.db)
+        self.embeddings = EmbeddingIndex(self.db, self.embedding_path, EMBEDDER)
+        self.query_stats = {"seq": None}
+        self.lock = threading.Lock()
+        self.users = 0
+
+    def close(self):
+        self.db.close()
+
+class GraphRegistry:
+    def __init__(self, capacity=GRAPH_CACHE_SIZE):
+        self.capacity = capacity
+        self._open = OrderedDict()      # name -> Graph, least recently used first
+        self._lock = threading.Lock()
+        self.default = Graph(DEFAULT_GRAPH, DB_PATH)
+
+    def path_for(self, name):
+        if name == DEFAULT_GRAPH:
+            return DB_PATH
+        if not isinstance(name, str) or not GRAPH_NAME_RE.match(name):
+            raise ValueError(f"Invalid graph name: {name!r}")
+        return os.path.join(GRAPHS_DIR, name + ".db")
+
+    def acquire(self, name):
+        if name is None or name == DEFAULT_GRAPH:
+            return self.default
+        path = self.path_for(name)
+        with self._lock:
+            graph = self._open.get(name)
+            if graph is None:
+                os.makedirs(GRAPHS_DIR, exist_ok=True)
+                graph = self._open[name] = Graph(name, path)
+            self._open.move_to_end(name)
+            graph.users += 1
+            self._evict()
+            return graph
+
+    def release(self, graph):
+        if graph is self.default:
+            return
+        with self._lock:
+            graph.users -= 1
+            self._evict()
+
+    def _evict(self):
+        # Only idle graphs are closed; busy ones may overshoot capacity briefly.
+        idle = [name for name, graph in self._open.items() if graph.users == 0]
+        for name in idle[:max(0, len(self._open) - self.capacity)]:
+            self._open.pop(name).close()
+
+    def each_open(self):
+        with self._lock:
+            return [self.default] + list(self._open.values())
+
+    def names(self):
+        names = {DEFAULT_GRAPH}
+        if os.path.isdir(GRAPHS_DIR):
+            names.update(
+                entry[:-len(".db")] for entry in os.listdir(GRAPHS_DIR)
+                if entry.endswith(".db") and GRAPH_NAME_RE.match(entry[:-len(".db")])
+            )
+        return sorted(names)
 
-def init_db():
-    conn = get_db()
-    cur = conn.cursor()
+_GRAPH_LOCAL = threading.local()
 
-    cur.execute("""
+def _registry():
+    if GRAPHS is None:
+        raise RuntimeError("Graphs are not open; call init_graphs() first")
+    return GRAPHS
+
+def current_graph():
+    graph = getattr(_GRAPH_LOCAL, "graph", None)
+    return graph if graph is not None else _registry().default
+
+@contextmanager
+def use_graph(name=None):
+    """Make graph `name` (default graph if None) current for this thread."""
+    graph = _registry().acquire(name)
+    previous = getattr(_GRAPH_LOCAL, "graph", None)
+    _GRAPH_LOCAL.graph = graph
+    try:
+        yield graph
+    finally:
+        _GRAPH_LOCAL.graph = previous
+        GRAPHS.release(graph)
+
+class _GraphBound:
+    """Module-level handle resolving to an attribute of the current graph."""
+
+    def __init__(self, attr):
+        self._attr = attr
+
+    def __getattr__(self, name):
+        return getattr(getattr(current_graph(), self._attr), name)
+
+DB = _GraphBound("db")
+
+# ------------------------------------------------------------
+# Schema migrations
+# ------------------------------------------------------------
+#
+# Applied once each, in order, and recorded in schema_version. Never
+# edit a released migration; append a new one.
+
+def _migration_001_base_tables(conn):
+    conn.execute("""
         CREATE TABLE IF NOT EXISTS nodes (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             label TEXT NOT NULL,
@@ -29,7 +494,7 @@ def init_db():
         )
     """)
 
-    cur.execute("""
+    conn.execute("""
         CREATE TABLE IF NOT EXISTS edges (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             source_id INTEGER NOT NULL,
@@ -42,18 +507,274 @@ def init_db():
         )
     """)
 
-    conn.commit()
-    conn.close()
+def _migration_002_lookup_indexes(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_nodes_type ON nodes(type)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_nodes_created_at ON nodes(created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_edges_source ON edges(source_id, relation)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_edges_target ON edges(target_id, relation)")
+
+def fts5_available(conn):
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp._fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+# Text content of a node's JSON data: every string leaf, space-separated.
+NODE_TEXT_SQL = """
+    CASE WHEN json_valid({data})
+         THEN (SELECT group_concat(value, ' ') FROM json_tree({data}) WHERE type = 'text')
+    END
+"""
+
+def _migration_003_node_search(conn):
+    # SQLite builds without FTS5 skip the index; search_nodes then falls
+    # back to a LIKE scan over labels.
+    if not fts5_available(conn):
+        return
+
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS nodes_fts USING fts5(
+            label,
+            body,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+    """)
+
+    new_text = NODE_TEXT_SQL.format(data="new.data")
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS nodes_fts_insert AFTER INSERT ON nodes BEGIN
+            INSERT INTO nodes_fts (rowid, label, body) VALUES (new.id, new.label, {new_text});
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS nodes_fts_delete AFTER DELETE ON nodes BEGIN
+            DELETE FROM nodes_fts WHERE rowid = old.id;
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS nodes_fts_update AFTER UPDATE OF label, data ON nodes BEGIN
+            DELETE FROM nodes_fts WHERE rowid = old.id;
+            INSERT INTO nodes_fts (rowid, label, body) VALUES (new.id, new.label, {new_text});
+        END
+    """)
+
+    conn.execute(f"""
+        INSERT INTO nodes_fts (rowid, label, body)
+        SELECT id, label, {NODE_TEXT_SQL.format(data="data")} FROM nodes
+    """)
+
+def _migration_004_keyset_indexes(conn):
+    # (created_at, id) gives a total order for keyset pagination; it
+    # supersedes the single-column created_at index.
+    conn.execute("DROP INDEX IF EXISTS idx_nodes_created_at")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_nodes_created ON nodes(created_at, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_edges_created ON edges(created_at, id)")
+
+def _create_change_log_triggers(conn):
+    for table, entity in (("nodes", "node"), ("edges", "edge")):
+        for op, event, row in (("insert", "INSERT", "new"), ("update", "UPDATE", "new"), ("delete", "DELETE", "old")):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_log_{op} AFTER {event} ON {table} BEGIN
+                    INSERT INTO changes (entity, entity_id, op) VALUES ('{entity}', {row}.id, '{op}');
+                END
+            """)
+
+def _migration_005_change_log(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity TEXT NOT NULL,
+            entity_id INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            changed_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    _create_change_log_triggers(conn)
+
+    # Existing rows enter the log as inserts, so a consumer starting
+    # from cursor 0 sees the whole graph.
+    conn.execute("INSERT INTO changes (entity, entity_id, op) SELECT 'node', id, 'insert' FROM nodes ORDER BY id")
+    conn.execute("INSERT INTO changes (entity, entity_id, op) SELECT 'edge', id, 'insert' FROM edges ORDER BY id")
+
+def _migration_006_dedup_keys(conn):
+    # Rows written with `unique: true` carry a dedup key; the partial
+    # unique indexes ignore everything else, so existing duplicates
+    # don't block the migration.
+    conn.execute("ALTER TABLE nodes ADD COLUMN dedup_key TEXT")
+    conn.execute("ALTER TABLE nodes ADD COLUMN hits INTEGER NOT NULL DEFAULT 1")
+    conn.execute("ALTER TABLE edges ADD COLUMN dedup_key TEXT")
+    conn.execute("ALTER TABLE edges ADD COLUMN hits INTEGER NOT NULL DEFAULT 1")
+    conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_nodes_dedup
+        ON nodes(type, dedup_key) WHERE dedup_key IS NOT NULL
+    """)
+    conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_edges_dedup
+        ON edges(source_id, target_id, dedup_key) WHERE dedup_key IS NOT NULL
+    """)
+
+def _migration_007_retention(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS retention_policies (
+            type TEXT PRIMARY KEY,
+            max_age_days REAL,
+            max_count INTEGER,
+            rollup TEXT,
+            archive INTEGER NOT NULL DEFAULT 1,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # Per-type scans in (created_at, id) order; also serves type = ? lookups.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_nodes_type_created ON nodes(type, created_at, id)")
+    conn.execute("DROP INDEX IF EXISTS idx_nodes_type")
+
+def _migration_008_node_metrics(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS node_metrics (
+            node_id INTEGER PRIMARY KEY,
+            pagerank REAL NOT NULL,
+            in_degree INTEGER NOT NULL,
+            out_degree INTEGER NOT NULL,
+            component INTEGER NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_node_metrics_pagerank ON node_metrics(pagerank DESC)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_node_metrics_in_degree ON node_metrics(in_degree DESC)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_node_metrics_out_degree ON node_metrics(out_degree DESC)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_node_metrics_component ON node_metrics(component)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS metrics_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            change_seq INTEGER NOT NULL,
+            nodes INTEGER NOT NULL,
+            edges INTEGER NOT NULL,
+            iterations INTEGER NOT NULL,
+            components INTEGER NOT NULL,
+            duration_ms REAL NOT NULL,
+            computed_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+def _migration_009_node_embeddings(conn):
+    # Vectors live in the graph's `_embeddings.npy` sidecar; these tables map nodes
+    # to matrix rows and record how far the change log has been applied.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS node_embeddings (
+            node_id INTEGER PRIMARY KEY,
+            row INTEGER NOT NULL UNIQUE
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS embedding_index (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            embedder TEXT NOT NULL,
+            dim INTEGER NOT NULL,
+            rows INTEGER NOT NULL,
+            change_seq INTEGER NOT NULL,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+def _migration_010_state_history(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS state_history (
+            node_id INTEGER NOT NULL,
+            cycle INTEGER NOT NULL,
+            delta TEXT NOT NULL,
+            checkpoint TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (node_id, cycle)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS nodes_state_history_delete AFTER DELETE ON nodes BEGIN
+            DELETE FROM state_history WHERE node_id = old.id;
+        END
+    """)
+
+def _migration_011_edge_dedup_relation(conn):
+    # Edge dedup keys were `relation or ""`, folding a null relation into
+    # "". Key on the JSON-quoted relation so the two stay distinct.
+    # Rewriting keys changes nothing consumers see, so the update trigger
+    # is off meanwhile rather than logging every unique edge.
+    conn.execute("DROP TRIGGER IF EXISTS edges_log_update")
+    conn.execute("UPDATE edges SET dedup_key = json_quote(relation) WHERE dedup_key IS NOT NULL")
+    _create_change_log_triggers(conn)
+
+def _migration_012_rollup_path(conn):
+    # Rollups used to always count $.summary.active_concepts; existing
+    # policies keep that path.
+    conn.execute("ALTER TABLE retention_policies ADD COLUMN rollup_path TEXT")
+    conn.execute(
+        "UPDATE retention_policies SET rollup_path = '/summary/active_concepts' WHERE rollup IS NOT NULL"
+    )
+
+MIGRATIONS = [
+    (1, "base nodes and edges tables", _migration_001_base_tables),
+    (2, "indexes on node type/created_at and edge adjacency", _migration_002_lookup_indexes),
+    (3, "FTS5 index over node labels and data text", _migration_003_node_search),
+    (4, "composite (created_at, id) indexes for keyset pagination", _migration_004_keyset_indexes),
+    (5, "change log with insert/update/delete triggers", _migration_005_change_log),
+    (6, "dedup keys and hit counters for upserted nodes/edges", _migration_006_dedup_keys),
+    (7, "retention policies and per-type created_at index", _migration_007_retention),
+    (8, "materialized node metrics (pagerank, degree, components)", _migration_008_node_metrics),
+    (9, "node embedding row map and sync state", _migration_009_node_embeddings),
+    (10, "per-cycle state history with checkpoints", _migration_010_state_history),
+    (11, "edge dedup keys distinguish null and empty relations", _migration_011_edge_dedup_relation),
+    (12, "per-policy JSON pointer counted by rollups", _migration_012_rollup_path),
+]
+
+def get_schema_version(conn):
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
 
-init_db()
+def migrate(db):
+    """
+    Bring the database up to the latest schema version.
+    Returns the list of versions applied by this call.
+    """
+    applied = []
+
+    with db.writer() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        current = get_schema_version(conn)
+
+        for version, description, apply in MIGRATIONS:
+            if version <= current:
+                continue
+            with db.writer() as conn:
+                apply(conn)
+                conn.execute(
+                    "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                    (version, description)
+                )
+            applied.append(version)
+
+        if applied:
+            # Refresh planner statistics so the new indexes get used.
+            conn.execute("ANALYZE")
+
+    return applied
 
 # ------------------------------------------------------------
 # JSON-RPC helpers
 # ------------------------------------------------------------
 
+SEND_LOCK = threading.Lock()
+
 def send_message(msg):
-    sys.stdout.write(json.dumps(msg) + "\n")
-    sys.stdout.flush()
+    line = json.dumps(msg) + "\n"
+    with SEND_LOCK:
+        sys.stdout.write(line)
+        sys.stdout.flush()
 
 def read_message():
     line = sys.stdin.readline()
@@ -65,161 +786,376 @@ def read_message():
 # Tools
 # ------------------------------------------------------------
 
-def tool_add_node(params):
-    label = params.get("label")
-    type_ = params.get("type")
-    data = params.get("data", {})
-
+def _insert_node(conn, label, type_, data):
     if not label:
         raise ValueError("label is required")
 
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute(
+    cur = conn.execute(
         "INSERT INTO nodes (label, type, data) VALUES (?, ?, ?)",
         (label, type_, json.dumps(data))
     )
-    conn.commit()
-    node_id = cur.lastrowid
-    conn.close()
-
-    return {
-        "node_id": node_id,
-        "label": label,
-        "type": type_,
-        "data": data
-    }
-
-def tool_add_edge(params):
-    source_id = params.get("source_id")
-    target_id = params.get("target_id")
-    relation = params.get("relation")
-    data = params.get("data", {})
+    return cur.lastrowid
 
+def _insert_edge(conn, source_id, target_id, relation, data):
     if source_id is None or target_id is None:
         raise ValueError("source_id and target_id are required")
 
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute(
+    cur = conn.execute(
         "INSERT INTO edges (source_id, target_id, relation, data) VALUES (?, ?, ?, ?)",
         (source_id, target_id, relation, json.dumps(data))
     )
-    conn.commit()
     edge_id = cur.lastrowid
-    conn.close()
+    adjacency = current_graph().adjacency
+    DB.after_commit(lambda: adjacency.append(edge_id, source_id, target_id, relation))
+    return edge_id
+
+def _node_row(row):
+    return {
+        "id": row["id"],
+        "label": row["label"],
+        "type": row["type"],
+        "data": json.loads(row["data"]) if row["data"] else {},
+        "created_at": row["created_at"]
+    }
+
+def _edge_row(row):
+    return {
+        "id": row["id"],
+        "source_id": row["source_id"],
+        "target_id": row["target_id"],
+        "relation": row["relation"],
+        "data": json.loads(row["data"]) if row["data"] else {},
+        "created_at": row["created_at"]
+    }
+
+def normalize_label(label):
+    """Dedup key for a node label: NFKC, case-folded, whitespace collapsed."""
+    return " ".join(unicodedata.normalize("NFKC", label).casefold().split())
+
+def _upsert_node(conn, label, type_, data):
+    """
+    Insert a node keyed on (type, normalized label), or merge `data` into
+    the existing one and bump its hit counter.
+    Returns (node_id, created, hits).
+    """
+    if not label:
+        raise ValueError("label is required")
+    if not type_:
+        raise ValueError("type is required for unique nodes")
+
+    # Look up before inserting: a conflicting INSERT would still take an
+    # AUTOINCREMENT id and leave a gap.
+    key = normalize_label(label)
+    row = conn.execute(
+        "SELECT id FROM nodes WHERE type = ? AND dedup_key = ?",
+        (type_, key)
+    ).fetchone()
+    if row is None:
+        cur = conn.execute(
+            "INSERT INTO nodes (label, type, data, dedup_key) VALUES (?, ?, ?, ?)",
+            (label, type_, json.dumps(data), key)
+        )
+        return cur.lastrowid, True, 1
+
+    hits = conn.execute("""
+        UPDATE nodes SET
+            data = json_patch(CASE WHEN json_valid(data) THEN data ELSE '{}' END, ?),
+            hits = hits + 1
+        WHERE id = ?
+        RETURNING hits
+    """, (json.dumps(data), row["id"])).fetchone()["hits"]
+    return row["id"], False, hits
+
+def _upsert_edge(conn, source_id, target_id, relation, data):
+    """
+    Insert an edge keyed on (source_id, target_id, relation), or merge
+    `data` into the existing one and bump its hit counter. A null
+    relation and "" are different keys.
+    Returns (edge_id, created, hits).
+    """
+    if source_id is None or target_id is None:
+        raise ValueError("source_id and target_id are required")
+
+    row = conn.execute(
+        "SELECT id FROM edges WHERE source_id = ? AND target_id = ? AND dedup_key = json_quote(?)",
+        (source_id, target_id, relation)
+    ).fetchone()
+    if row is None:
+        cur = conn.execute(
+            "INSERT INTO edges (source_id, target_id, relation, data, dedup_key) "
+            "VALUES (?, ?, ?, ?, json_quote(?))",
+            (source_id, target_id, relation, json.dumps(data), relation)
+        )
+        edge_id = cur.lastrowid
+        adjacency = current_graph().adjacency
+        DB.after_commit(lambda: adjacency.append(edge_id, source_id, target_id, relation))
+        return edge_id, True, 1
+
+    hits = conn.execute("""
+        UPDATE edges SET
+            data = json_patch(CASE WHEN json_valid(data) THEN data ELSE '{}' END, ?),
+            hits = hits + 1
+        WHERE id = ?
+        RETURNING hits
+    """, (json.dumps(data), row["id"])).fetchone()["hits"]
+    return row["id"], False, hits
+
+def _write_node(conn, item):
+    """add_node semantics for one item; `unique: true` selects upsert."""
+    label, type_, data = item.get("label"), item.get("type"), item.get("data", {})
+    if item.get("unique"):
+        return _upsert_node(conn, label, type_, data)
+    return _insert_node(conn, label, type_, data), True, 1
+
+def _write_edge(conn, item):
+    """add_edge semantics for one item; `unique: true` selects upsert."""
+    args = (item.get("source_id"), item.get("target_id"), item.get("relation"), item.get("data", {}))
+    if item.get("unique"):
+        return _upsert_edge(conn, *args)
+    return _insert_edge(conn, *args), True, 1
+
+def tool_add_node(params):
+    """
+    Accepts: label, type, data, unique
+
+    With `unique: true` the node is keyed on (type, normalized label):
+    a repeat merges its data into the existing node (RFC 7396) and
+    increments `hits` instead of adding a row.
+    """
+    with DB.writer() as conn:
+        node_id, created, hits = _write_node(conn, params)
+        row = conn.execute("SELECT label, type, data FROM nodes WHERE id = ?", (node_id,)).fetchone()
+
+    return {
+        "node_id": node_id,
+        "label": row["label"],
+        "type": row["type"],
+        "data": json.loads(row["data"]) if row["data"] else {},
+        "created": created,
+        "hits": hits
+    }
+
+def tool_add_edge(params):
+    """
+    Accepts: source_id, target_id, relation, data, unique
+
+    With `unique: true` the edge is keyed on (source_id, target_id,
+    relation): a repeat merges data and increments `hits`.
+    """
+    with DB.writer() as conn:
+        edge_id, created, hits = _write_edge(conn, params)
+        row = conn.execute(
+            "SELECT source_id, target_id, relation, data FROM edges WHERE id = ?", (edge_id,)
+        ).fetchone()
 
     return {
         "edge_id": edge_id,
-        "source_id": source_id,
-        "target_id": target_id,
-        "relation": relation,
-        "data": data
+        "source_id": row["source_id"],
+        "target_id": row["target_id"],
+        "relation": row["relation"],
+        "data": json.loads(row["data"]) if row["data"] else {},
+        "created": created,
+        "hits": hits
     }
 
-def tool_list_recent_nodes(params):
-    limit = params.get("limit", 20)
+# ------------------------------------------------------------
+# Keyset pagination
+# ------------------------------------------------------------
+#
+# Pages are ordered by (created_at, id); a cursor encodes the last row.
 
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT id, label, type, data, created_at FROM nodes ORDER BY created_at DESC LIMIT ?",
-        (limit,)
-    )
-    rows = cur.fetchall()
-    conn.close()
-
-    nodes = []
-    for row in rows:
-        data = json.loads(row["data"]) if row["data"] else {}
-        nodes.append({
-            "id": row["id"],
-            "label": row["label"],
-            "type": row["type"],
-            "data": data,
-            "created_at": row["created_at"]
-        })
+def encode_cursor(created_at, row_id):
+    raw = json.dumps([created_at, row_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
 
-    return {"nodes": nodes}
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+        return str(created_at), int(row_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
 
-def tool_list_recent_edges(params):
-    limit = params.get("limit", 20)
+def _normalize_timestamp(value, name):
+    """Accept ISO-8601 input; return SQLite's CURRENT_TIMESTAMP format (UTC)."""
+    if value is None:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"{name} must be an ISO-8601 timestamp")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.strftime("%Y-%m-%d %H:%M:%S")
 
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT id, source_id, target_id, relation, data, created_at FROM edges ORDER BY created_at DESC LIMIT ?",
-        (limit,)
-    )
-    rows = cur.fetchall()
-    conn.close()
-
-    edges = []
-    for row in rows:
-        data = json.loads(row["data"]) if row["data"] else {}
-        edges.append({
-            "id": row["id"],
-            "source_id": row["source_id"],
-            "target_id": row["target_id"],
-            "relation": row["relation"],
-            "data": data,
-            "created_at": row["created_at"]
-        })
+NODE_FIELDS = ("id", "label", "type", "data", "created_at", "hits")
+EDGE_FIELDS = ("id", "source_id", "target_id", "relation", "data", "created_at", "hits")
+DEFAULT_NODE_FIELDS = ("id", "label", "type", "data", "created_at")
+DEFAULT_EDGE_FIELDS = ("id", "source_id", "target_id", "relation", "data", "created_at")
+
+def _projection(params, allowed, default):
+    """
+    Resolve `fields` / `data_paths` into a SELECT list and a row builder.
+    data_paths are JSON pointers extracted server-side and returned as
+    {"<pointer>": value} under "data" instead of the whole document.
+    """
+    fields = params.get("fields") or list(default)
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)} (allowed: {', '.join(allowed)})")
+
+    data_paths = params.get("data_paths")
+    args = {}
+
+    columns = [f for f in fields if f != "data"]
+    # id and created_at are needed for cursors even if not returned
+    select = list(dict.fromkeys(["id", "created_at"] + columns))
+
+    data_mode = None          # None: data not read at all
+    if data_paths:
+        pairs = []
+        for index, pointer in enumerate(data_paths):
+            args[f"key{index}"] = pointer
+            pairs.append(f":key{index}, json_extract(data, {json_pointer_sql(pointer, 'data')})")
+        select.append(
+            "CASE WHEN json_valid(data) THEN json_object(" + ", ".join(pairs) + ") END AS data"
+        )
+        data_mode = "paths"
+    elif "data" in fields:
+        select.append("data")
+        data_mode = "full"
 
-    return {"edges": edges}
+    output = list(fields)
+    if data_mode and "data" not in output:
+        output.append("data")
+
+    def build(row):
+        item = {}
+        for f in output:
+            if f == "data":
+                item["data"] = json.loads(row["data"]) if row["data"] else {}
+            else:
+                item[f] = row[f]
+        return item
+
+    return ", ".join(select), args, build
+
+def _keyset_page(conn, table, columns, params, extra_args=None):
+    """
+    One page of `table` in (created_at, id) order.
+
+    params: limit, cursor, since (inclusive), until (exclusive),
+            order ("desc" newest first, default | "asc")
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    limit = int(params.get("limit", 20))
+    order = params.get("order", "desc")
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    if order not in ("asc", "desc"):
+        raise ValueError("order must be 'asc' or 'desc'")
+
+    where = []
+    args = {"limit": limit + 1}
+    args.update(extra_args or {})
+
+    since = _normalize_timestamp(params.get("since"), "since")
+    until = _normalize_timestamp(params.get("until"), "until")
+    if since is not None:
+        where.append("created_at >= :since")
+        args["since"] = since
+    if until is not None:
+        where.append("created_at < :until")
+        args["until"] = until
+
+    cursor = params.get("cursor")
+    if cursor:
+        args["cursor_at"], args["cursor_id"] = decode_cursor(cursor)
+        op = "<" if order == "desc" else ">"
+        where.append(f"(created_at, id) {op} (:cursor_at, :cursor_id)")
+
+    direction = "DESC" if order == "desc" else "ASC"
+    sql = f"SELECT {columns} FROM {table}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY created_at {direction}, id {direction} LIMIT :limit"
+
+    rows = conn.execute(sql, args).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last["created_at"], last["id"])
+
+    return rows, next_cursor
+
+def tool_list_recent_nodes(params):
+    """
+    Accepts: limit, cursor, since, until, order, fields, data_paths
+    (see _keyset_page and _projection).
+    """
+    columns, args, build = _projection(params, NODE_FIELDS, DEFAULT_NODE_FIELDS)
+    with DB.reader() as conn:
+        rows, next_cursor = _keyset_page(conn, "nodes", columns, params, args)
+
+    return {"nodes": [build(row) for row in rows], "next_cursor": next_cursor}
+
+def tool_list_recent_edges(params):
+    """
+    Accepts: limit, cursor, since, until, order, fields, data_paths
+    (see _keyset_page and _projection).
+    """
+    columns, args, build = _projection(params, EDGE_FIELDS, DEFAULT_EDGE_FIELDS)
+    with DB.reader() as conn:
+        rows, next_cursor = _keyset_page(conn, "edges", columns, params, args)
+
+    return {"edges": [build(row) for row in rows], "next_cursor": next_cursor}
 
 def tool_find_or_create_state_node(params):
     label = params.get("label")
     type_ = params.get("type")
+    initial_data = params.get("data")
 
     if not label or not type_:
         raise ValueError("label and type are required")
+    if initial_data is not None and not isinstance(initial_data, dict):
+        raise ValueError("data must be an object")
 
-    conn = get_db()
-    cur = conn.cursor()
+    # The lookup and the insert share one write transaction so two
+    # concurrent callers cannot both create a state node.
+    with DB.writer() as conn:
+        # 1. Try to find existing cognitive_state node
+        row = conn.execute(
+            "SELECT id, label, type, data FROM nodes WHERE type = ? LIMIT 1",
+            (type_,)
+        ).fetchone()
 
-    # 1. Try to find existing cognitive_state node
-    cur.execute(
-        "SELECT id, label, type, data FROM nodes WHERE type = ? LIMIT 1",
-        (type_,)
-    )
-    row = cur.fetchone()
-
-    if row:
-        node_id = row["id"]
-        label = row["label"]
-        type_ = row["type"]
-        data_json = row["data"]
-        data = json.loads(data_json) if data_json else {}
-        conn.close()
-        return {
-            "node_id": node_id,
-            "label": label,
-            "type": type_,
-            "data": data,
-            "created": False
-        }
-
-    # 2. Create new cognitive_state node
-    default_state = {
-        "cycle_count": 0,
-        "last_cycle_time": None,
-        "last_mode": "normal",
-        "last_reflection": None,
-        "last_summary": None,
-        "last_written_nodes": [],
-        "last_written_edges": [],
-        "last_active_concepts": [],
-        "last_memory_snapshot": []
-    }
+        if row:
+            data_json = row["data"]
+            data = json.loads(data_json) if data_json else {}
+            return {
+                "node_id": row["id"],
+                "label": row["label"],
+                "type": row["type"],
+                "data": data,
+                "created": False
+            }
 
-    cur.execute(
-        "INSERT INTO nodes (label, type, data) VALUES (?, ?, ?)",
-        (label, type_, json.dumps(default_state))
-    )
-    conn.commit()
-    node_id = cur.lastrowid
-    conn.close()
+        # 2. Create new cognitive_state node (a small header; per-cycle
+        #    detail goes to state_history), or one with the caller's data
+        default_state = initial_data if initial_data is not None else {
+            "cycle_count": 0,
+            "last_cycle_time": None,
+            "last_mode": "normal",
+            "last_change_cursor": None
+        }
+
+        cur = conn.execute(
+            "INSERT INTO nodes (label, type, data) VALUES (?, ?, ?)",
+            (label, type_, json.dumps(default_state))
+        )
+        node_id = cur.lastrowid
 
     return {
         "node_id": node_id,
@@ -238,22 +1174,13 @@ def tool_update_node_data(params):
     if data is None:
         raise ValueError("data is required")
 
-    conn = get_db()
-    cur = conn.cursor()
-
-    # Ensure node exists
-    cur.execute("SELECT id FROM nodes WHERE id = ?", (node_id,))
-    if cur.fetchone() is None:
-        conn.close()
-        raise ValueError(f"Node {node_id} does not exist")
-
-    # Update data
-    cur.execute(
-        "UPDATE nodes SET data = ? WHERE id = ?",
-        (json.dumps(data), node_id)
-    )
-    conn.commit()
-    conn.close()
+    with DB.writer() as conn:
+        cur = conn.execute(
+            "UPDATE nodes SET data = ? WHERE id = ?",
+            (json.dumps(data), node_id)
+        )
+        if cur.rowcount == 0:
+            raise ValueError(f"Node {node_id} does not exist")
 
     return {
         "node_id": node_id,
@@ -261,19 +1188,3760 @@ def tool_update_node_data(params):
         "data": data
     }
 
+ARRAY_INDEX_RE = re.compile(r"0|[1-9][0-9]*")
+
+def _pointer_segments(pointer):
+    if not isinstance(pointer, str) or not pointer.startswith("/"):
+        raise ValueError(f"Invalid JSON pointer: {pointer!r}")
+    segments = [s.replace("~1", "/").replace("~0", "~") for s in pointer[1:].split("/")]
+    for segment in segments:
+        if '"' in segment:
+            raise ValueError(f"Unsupported character in JSON pointer segment: {segment!r}")
+    return segments
+
+def json_pointer_to_path(pointer, json_type):
+    """
+    RFC 6901 JSON pointer -> SQLite JSON1 path.
+    "/summary/active_concepts/0" -> '$."summary"."active_concepts"[0]'
+    A numeric segment indexes an array and names a member of anything
+    else; `json_type(path)` reports what a path currently holds.
+    "-" means "end of array".
+    """
+    path = "$"
+    for segment in _pointer_segments(pointer):
+        if segment == "-":
+            path += "[#]"
+        elif ARRAY_INDEX_RE.fullmatch(segment) and json_type(path) == "array":
+            path += f"[{int(segment)}]"
+        else:
+            path += f'."{segment}"'
+    return path
+
+def json_pointer_sql(pointer, doc):
+    """
+    SQL expression for the JSON1 path of `pointer` in the JSON text `doc`
+    (an SQL expression), with numeric segments resolved per row.
+    """
+    suffixes = []           # [path suffix if the parent is an array, otherwise]
+    for segment in _pointer_segments(pointer):
+        if segment == "-":
+            suffixes.append(["[#]", "[#]"])
+        elif ARRAY_INDEX_RE.fullmatch(segment):
+            suffixes.append([f"[{segment}]", f'."{segment}"'])
+        else:
+            suffixes.append([f'."{segment}"'] * 2)
+    if all(in_array == in_object for in_array, in_object in suffixes):
+        return "('$" + "".join(in_array for in_array, _ in suffixes).replace("'", "''") + "')"
+
+    # One walk over the segments, choosing each suffix by the type at the
+    # path so far; the SQL stays the same size whatever the depth.
+    return f"""(WITH RECURSIVE walk(i, p) AS (
+        SELECT 0, '$'
+        UNION ALL
+        SELECT walk.i + 1, walk.p || json_extract(
+            s.value, CASE json_type({doc}, walk.p) WHEN 'array' THEN '$[0]' ELSE '$[1]' END
+        )
+        FROM walk JOIN json_each('{json.dumps(suffixes).replace("'", "''")}') s ON s.key = walk.i
+    ) SELECT p FROM walk ORDER BY i DESC LIMIT 1)"""
+
+def _compile_patch(merge, ops, json_type):
+    """
+    Fold a merge patch and set/append/remove operations into one nested
+    JSON1 expression over the `data` column. `json_type(expr, args, path)`
+    evaluates the type at `path` of the document built so far.
+    Returns (sql_expression, params).
+    """
+    expr = "CASE WHEN json_valid(data) THEN data ELSE '{}' END"
+    args = []
+
+    if merge is not None:
+        expr = f"json_patch({expr}, ?)"
+        args.append(json.dumps(merge))
+
+    for index, op in enumerate(ops):
+        kind = op.get("op")
+        pointer = op.get("path")
+        if pointer in (None, "", "/"):
+            raise ValueError(f"ops[{index}]: path must address a member (use update_node_data to replace data)")
+        path = json_pointer_to_path(pointer, lambda prefix: json_type(expr, args, prefix))
+
+        if kind == "set":
+            expr = f"json_set({expr}, ?, json(?))"
+            args += [path, json.dumps(op.get("value"))]
+        elif kind == "append":
+            # Create the array if missing, then append at its end.
+            expr = f"json_insert(json_insert({expr}, ?, json('[]')), ?, json(?))"
+            args += [path, path + "[#]", json.dumps(op.get("value"))]
+        elif kind == "remove":
+            expr = f"json_remove({expr}, ?)"
+            args.append(path)
+        else:
+            raise ValueError(f"ops[{index}]: op must be 'set', 'append' or 'remove'")
+
+    return expr, args
+
+def tool_patch_node_data(params):
+    """
+    Partially update a node's data in a single UPDATE statement,
+    without shipping the whole document.
+
+    Accepts either (or both; merge is applied first):
+        {
+            "node_id": 3,
+            "merge": {...},      # RFC 7396 merge patch (null deletes a key)
+            "ops": [             # JSON-pointer operations, applied in order
+                {"op": "set", "path": "/last_summary/cycle_count", "value": 4},
+                {"op": "append", "path": "/last_written_nodes", "value": 42},
+                {"op": "remove", "path": "/last_memory_snapshot"}
+            ],
+            "return_data": false # include the resulting data in the response
+        }
+    """
+    node_id = params.get("node_id")
+    merge = params.get("merge")
+    ops = params.get("ops") or []
+
+    if node_id is None:
+        raise ValueError("node_id is required")
+    if merge is None and not ops:
+        raise ValueError("merge or ops is required")
+    if merge is not None and not isinstance(merge, dict):
+        raise ValueError("merge must be an object")
+
+    with DB.writer() as conn:
+        def json_type(expr, args, path):
+            row = conn.execute(
+                f"SELECT json_type({expr}, ?) FROM nodes WHERE id = ?", args + [path, node_id]
+            ).fetchone()
+            return row[0] if row else None
+
+        expr, args = _compile_patch(merge, ops, json_type)
+        cur = conn.execute(f"UPDATE nodes SET data = {expr} WHERE id = ?", args + [node_id])
+        if cur.rowcount == 0:
+            raise ValueError(f"Node {node_id} does not exist")
+
+        result = {"node_id": node_id, "updated": True}
+        if params.get("return_data"):
+            row = conn.execute("SELECT data FROM nodes WHERE id = ?", (node_id,)).fetchone()
+            result["data"] = json.loads(row["data"])
+
+    return result
+
 # ------------------------------------------------------------
-# Dispatch
+# Batch / transactional writes
 # ------------------------------------------------------------
+#
+# Items may carry a "ref"; later items use source_ref / target_ref /
+# node_ref instead of the id, which is only known after the insert.
 
-def handle_request(msg):
-    method = msg.get("method")
-    params = msg.get("params", {})
-    req_id = msg.get("id")
+REF_FIELDS = {
+    "source_ref": "source_id",
+    "target_ref": "target_id",
+    "node_ref": "node_id",
+}
 
-    try:
-        if method == "initialize":
-            send_message({
-                "jsonrpc": "2.0",
+def _resolve_refs(args, refs):
+    resolved = dict(args)
+    for ref_field, id_field in REF_FIELDS.items():
+        if ref_field not in resolved:
+            continue
+        ref = resolved.pop(ref_field)
+        if ref not in refs:
+            raise ValueError(f"Unknown ref: {ref}")
+        resolved[id_field] = refs[ref]
+    return resolved
+
+def _add_nodes(conn, items, refs):
+    node_ids = []
+    for index, item in enumerate(items):
+        try:
+            node_id, _, _ = _write_node(conn, item)
+        except ValueError as e:
+            raise ValueError(f"nodes[{index}]: {e}")
+        ref = item.get("ref")
+        if ref is not None:
+            refs[ref] = node_id
+        node_ids.append(node_id)
+    return node_ids
+
+def _add_edges(conn, items, refs):
+    edge_ids = []
+    for index, item in enumerate(items):
+        try:
+            edge_id, _, _ = _write_edge(conn, _resolve_refs(item, refs))
+        except ValueError as e:
+            raise ValueError(f"edges[{index}]: {e}")
+        edge_ids.append(edge_id)
+    return edge_ids
+
+def tool_add_nodes_batch(params):
+    """
+    Insert many nodes (and optionally edges between them) in one
+    transaction. Either everything is written or nothing is.
+
+    Accepts:
+        {
+            "nodes": [{"label", "type", "data", "ref", "unique"}, ...],
+            "edges": [{"source_id" | "source_ref",
+                       "target_id" | "target_ref",
+                       "relation", "data", "unique"}, ...]     # optional
+        }
+    """
+    nodes = params.get("nodes") or []
+    edges = params.get("edges") or []
+
+    if not nodes:
+        raise ValueError("nodes must be a non-empty array")
+
+    refs = {}
+    with DB.writer() as conn:
+        node_ids = _add_nodes(conn, nodes, refs)
+        edge_ids = _add_edges(conn, edges, refs)
+
+    return {
+        "node_ids": node_ids,
+        "edge_ids": edge_ids,
+        "refs": refs
+    }
+
+def tool_add_edges_batch(params):
+    """
+    Insert many edges in one transaction.
+
+    Accepts:
+        {
+            "edges": [{"source_id", "target_id", "relation", "data", "unique"}, ...],
+            "refs": {"<ref>": <node_id>, ...}   # optional, for *_ref fields
+        }
+    """
+    edges = params.get("edges") or []
+    refs = dict(params.get("refs") or {})
+
+    if not edges:
+        raise ValueError("edges must be a non-empty array")
+
+    with DB.writer() as conn:
+        edge_ids = _add_edges(conn, edges, refs)
+
+    return {"edge_ids": edge_ids}
+
+def tool_apply_write_plan(params):
+    """
+    Execute a whole write plan (as produced by the cognitive loop's
+    apply_insights) in a single transaction.
+
+    Accepts:
+        {
+            "plan": [
+                {
+                    "call": "knowledge-graph:add_node",   # prefix optional
+                    "arguments": {...},                   # may use *_ref fields
+                    "ref": "reflection"                   # optional
+                },
+                ...
+            ]
+        }
+
+    If any step fails the whole plan is rolled back.
+    """
+    plan = params.get("plan") or []
+
+    if not plan:
+        raise ValueError("plan must be a non-empty array")
+
+    refs = {}
+    results = []
+    with DB.writer():
+        for index, step in enumerate(plan):
+            name = (step.get("call") or "").split(":")[-1]
+            if name not in PLAN_TOOLS:
+                raise ValueError(f"plan[{index}]: tool not allowed in a write plan: {name}")
+            step_graph = (step.get("arguments") or {}).get("graph")
+            if step_graph not in (None, current_graph().name):
+                raise ValueError(f"plan[{index}]: a write plan runs in one graph ({current_graph().name})")
+            try:
+                args = _resolve_refs(step.get("arguments") or {}, refs)
+                result = TOOLS[name](args)
+            except ValueError as e:
+                raise ValueError(f"plan[{index}] ({name}): {e}")
+
+            ref = step.get("ref")
+            if ref is not None and "node_id" in result:
+                refs[ref] = result["node_id"]
+            results.append(result)
+
+    return {
+        "applied": len(results),
+        "results": results,
+        "refs": refs
+    }
+
+# ------------------------------------------------------------
+# State history
+# ------------------------------------------------------------
+#
+# State nodes keep a small header in their data. Per-cycle records go
+# to state_history as merge patches against the previous record, with
+# a full checkpoint every STATE_CHECKPOINT_INTERVAL cycles; rows more
+# than STATE_HISTORY_KEEP cycles back are pruned.
+
+def _merge_patch(target, patch):
+    """RFC 7396 merge patch, applied to a copy of `target`."""
+    if not isinstance(patch, dict):
+        return patch
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = _merge_patch(result.get(key), value)
+    return result
+
+def _diff_patch(old, new):
+    """The RFC 7396 merge patch that turns `old` into `new`."""
+    patch = {key: None for key in old if key not in new}
+    for key, value in new.items():
+        if isinstance(value, dict) and isinstance(old.get(key), dict):
+            nested = _diff_patch(old[key], value)
+            if nested:
+                patch[key] = nested
+        elif key not in old or old[key] != value:
+            patch[key] = value
+    return patch
+
+def _history_record(conn, node_id, cycle):
+    """The full record at `cycle` (the latest at or before it), or None."""
+    base = conn.execute("""
+        SELECT cycle, checkpoint FROM state_history
+        WHERE node_id = ? AND cycle <= ? AND checkpoint IS NOT NULL
+        ORDER BY cycle DESC LIMIT 1
+    """, (node_id, cycle)).fetchone()
+    if base is None:
+        start, record = -1, None
+    else:
+        start, record = base["cycle"], json.loads(base["checkpoint"])
+    for row in conn.execute("""
+        SELECT delta FROM state_history
+        WHERE node_id = ? AND cycle > ? AND cycle <= ?
+        ORDER BY cycle
+    """, (node_id, start, cycle)):
+        record = _merge_patch(record or {}, json.loads(row["delta"]))
+    return record
+
+def tool_append_state_history(params):
+    """
+    Append one cycle's record to a state node's history.
+
+    Accepts:
+        {
+            "node_id": 3,          # or node_ref inside a write plan
+            "cycle": 42,           # must be above every recorded cycle
+            "record": {...}        # the full record; stored as a delta against the last one
+            "delta": {...}         # or: a merge patch against the previous record
+        }
+    """
+    node_id = params.get("node_id")
+    cycle = params.get("cycle")
+    record = params.get("record")
+    delta = params.get("delta")
+
+    if node_id is None or cycle is None:
+        raise ValueError("node_id and cycle are required")
+    if (record is None) == (delta is None):
+        raise ValueError("exactly one of record and delta is required")
+    if not isinstance(record if delta is None else delta, dict):
+        raise ValueError("record and delta must be objects")
+    cycle = int(cycle)
+
+    with DB.writer() as conn:
+        if conn.execute("SELECT 1 FROM nodes WHERE id = ?", (node_id,)).fetchone() is None:
+            raise ValueError(f"Node {node_id} does not exist")
+        last = conn.execute("""
+            SELECT MAX(cycle) AS cycle,
+                   MAX(CASE WHEN checkpoint IS NOT NULL THEN cycle END) AS checkpoint_cycle
+            FROM state_history WHERE node_id = ?
+        """, (node_id,)).fetchone()
+        if last["cycle"] is not None and cycle <= last["cycle"]:
+            raise ValueError(f"cycle {cycle} is not after the last recorded cycle {last['cycle']}")
+
+        checkpoint_due = (
+            last["checkpoint_cycle"] is None or cycle - last["checkpoint_cycle"] >= STATE_CHECKPOINT_INTERVAL
+        )
+        if record is not None:
+            previous = _history_record(conn, node_id, last["cycle"]) if last["cycle"] is not None else None
+            delta = _diff_patch(previous or {}, record)
+        elif checkpoint_due:
+            previous = _history_record(conn, node_id, cycle) or {}
+            record = _merge_patch(previous, delta)
+        checkpoint = json.dumps(record) if checkpoint_due else None
+
+        conn.execute(
+            "INSERT INTO state_history (node_id, cycle, delta, checkpoint) VALUES (?, ?, ?, ?)",
+            (node_id, cycle, json.dumps(delta), checkpoint)
+        )
+
+        pruned = 0
+        horizon = conn.execute("""
+            SELECT MAX(cycle) FROM state_history
+            WHERE node_id = ? AND checkpoint IS NOT NULL AND cycle <= ?
+        """, (node_id, cycle - STATE_HISTORY_KEEP)).fetchone()[0]
+        if horizon is not None:
+            pruned = conn.execute(
+                "DELETE FROM state_history WHERE node_id = ? AND cycle < ?", (node_id, horizon)
+            ).rowcount
+
+    return {
+        "node_id": node_id,
+        "cycle": cycle,
+        "checkpoint": checkpoint is not None,
+        "pruned": pruned
+    }
+
+def tool_get_state_history(params):
+    """
+    Ring-buffer view of a state node's history, newest first.
+
+    Accepts:
+        {
+            "node_id": 3,
+            "limit": 10,
+            "before_cycle": 40,     # optional: page further back
+            "reconstruct": false    # full records instead of deltas
+        }
+    """
+    node_id = params.get("node_id")
+    limit = int(params.get("limit", 10))
+    before_cycle = params.get("before_cycle")
+
+    if node_id is None:
+        raise ValueError("node_id is required")
+    if limit < 1:
+        raise ValueError("limit must be positive")
+
+    with DB.reader() as conn:
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+        rows = conn.execute("""
+            SELECT cycle, delta, checkpoint IS NOT NULL AS checkpoint, created_at
+            FROM state_history
+            WHERE node_id = ? AND cycle < ?
+            ORDER BY cycle DESC LIMIT ?
+        """, (node_id, int(before_cycle) if before_cycle is not None else 2 ** 62, limit)).fetchall()
+
+        entries = [{
+            "cycle": row["cycle"],
+            "delta": json.loads(row["delta"]),
+            "checkpoint": bool(row["checkpoint"]),
+            "created_at": row["created_at"]
+        } for row in rows]
+
+        if params.get("reconstruct") and entries:
+            # Rebuild the oldest record in the window, then roll forward.
+            oldest = entries[-1]
+            record = _history_record(conn, node_id, oldest["cycle"])
+            for entry in reversed(entries):
+                if entry is not oldest:
+                    record = _merge_patch(record, entry["delta"])
+                entry["record"] = record
+                del entry["delta"]
+
+        bounds = conn.execute(
+            "SELECT MIN(cycle), MAX(cycle) FROM state_history WHERE node_id = ?", (node_id,)
+        ).fetchone()
+
+    return {
+        "node_id": node_id,
+        "oldest_cycle": bounds[0],
+        "latest_cycle": bounds[1],
+        "entries": entries
+    }
+
+def tool_reconstruct_state(params):
+    """
+    Rebuild a state node's full state at a cycle: its header merged with
+    the history record of that cycle (default: the latest).
+
+    Accepts: { "node_id": 3, "cycle": 40 }
+    """
+    node_id = params.get("node_id")
+    if node_id is None:
+        raise ValueError("node_id is required")
+
+    with DB.reader() as conn:
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+        row = conn.execute("SELECT data FROM nodes WHERE id = ?", (node_id,)).fetchone()
+        if row is None:
+            raise ValueError(f"Node {node_id} does not exist")
+        header = json.loads(row["data"]) if row["data"] else {}
+
+        cycle = params.get("cycle")
+        if cycle is None:
+            cycle = conn.execute(
+                "SELECT MAX(cycle) FROM state_history WHERE node_id = ?", (node_id,)
+            ).fetchone()[0]
+        record = _history_record(conn, node_id, int(cycle)) if cycle is not None else None
+
+    if cycle is not None and record is None:
+        raise ValueError(f"No history at or before cycle {cycle}")
+
+    return {
+        "node_id": node_id,
+        "cycle": cycle,
+        "header": header,
+        "record": record or {},
+        "state": {**header, **(record or {})}
+    }
+
+# ------------------------------------------------------------
+# In-memory adjacency (CSR)
+# ------------------------------------------------------------
+#
+# Read-side CSR index (out- and in-edges) built lazily from `edges`,
+# with a delta overlay for later writes. Rebuilt when the overlay grows
+# or the change log was pruned past it; graphs over the memory budget
+# use the SQL path.
+
+EDGE_INDEX_BYTES = 2 * (4 + 4 + 8)      # per edge, both directions: target, relation, edge id
+NODE_INDEX_BYTES = 8 + 2 * 8            # per node: id + two offsets
+
+class AdjacencyIndex:
+    def __init__(self, db):
+        self.db = db
+        self.disabled_reason = None
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.built = False
+        self.stale = False
+        self.node_ids = None            # sorted int64 ids; dense index -> node id
+        self.out = None                 # (offsets, targets, relations, edge_ids)
+        self.inc = None                 # same layout, keyed by target
+        self.relation_codes = {}
+        self.relation_names = []
+        self.high_water = 0             # largest edge id reflected in the index
+        self.change_seq = 0             # change-log position last checked for edge deletes
+        self.base_edges = 0
+        self.delta_out = {}             # node_id -> [(other_id, relation_code, edge_id)]
+        self.delta_in = {}
+        self.delta_edges = 0
+
+    # ---- maintenance ---------------------------------------
+
+    def invalidate(self):
+        """Force a rebuild on next use (e.g. after edges were deleted)."""
+        with self._lock:
+            self.stale = True
+
+    def append(self, edge_id, source_id, target_id, relation):
+        """Write-through hook for a committed edge insert."""
+        with self._lock:
+            # Out of sequence means another writer got in between;
+            # the next `ready()` reads those edges from the table.
+            if self.built and edge_id == self.high_water + 1:
+                self._append(edge_id, source_id, target_id, relation)
+
+    def _append(self, edge_id, source_id, target_id, relation):
+        code = self._relation_code(relation)
+        self.delta_out.setdefault(source_id, []).append((target_id, code, edge_id))
+        self.delta_in.setdefault(target_id, []).append((source_id, code, edge_id))
+        self.delta_edges += 1
+        self.high_water = edge_id
+
+    def _relation_code(self, relation):
+        code = self.relation_codes.get(relation)
+        if code is None:
+            code = len(self.relation_names)
+            self.relation_codes[relation] = code
+            self.relation_names.append(relation)
+        return code
+
+    def _needs_rebuild(self):
+        threshold = max(ADJACENCY_REBUILD_MIN_DELTA, ADJACENCY_REBUILD_RATIO * self.base_edges)
+        return self.delta_edges > threshold
+
+    def ready(self):
+        """
+        Bring the index up to date with committed edges. Returns False
+        when traversals should use SQL instead (NumPy missing, cache
+        disabled, over budget, or called inside a write transaction,
+        whose uncommitted edges must not leak into the cache).
+        """
+        if np is None or not ADJACENCY_CACHE_ENABLED or self.db.in_write():
+            return False
+
+        with self._lock, self.db.reader() as conn:
+            # Edge deletes, including ones made by other processes sharing
+            # the file (e.g. retention), invalidate the index.
+            latest = conn.execute("SELECT MAX(seq) FROM changes").fetchone()[0] or 0
+            if self.built and latest > self.change_seq and (
+                self.change_seq < change_log_floor(conn) or conn.execute(
+                    "SELECT 1 FROM changes WHERE seq > ? AND entity = 'edge' AND op = 'delete' LIMIT 1",
+                    (self.change_seq,)
+                ).fetchone()
+            ):
+                self.stale = True
+
+            ready = self._sync(conn)
+            self.change_seq = latest
+            return ready
+
+    def _sync(self, conn):
+        max_id = conn.execute("SELECT MAX(id) FROM edges").fetchone()[0] or 0
+
+        if self.built and max_id < self.high_water:
+            self.stale = True
+        if not self.built or self.stale or self._needs_rebuild():
+            return self._build(conn, max_id)
+
+        if max_id > self.high_water:
+            for row in conn.execute(
+                "SELECT id, source_id, target_id, relation FROM edges "
+                "WHERE id > ? AND id <= ? ORDER BY id",
+                (self.high_water, max_id)
+            ):
+                self._append(row[0], row[1], row[2], row[3])
+            self.high_water = max_id
+            if self._needs_rebuild():
+                return self._build(conn, max_id)
+
+        return True
+
+    def _build(self, conn, max_edge_id):
+        self._reset()
+
+        max_node_id = conn.execute("SELECT MAX(id) FROM nodes").fetchone()[0] or 0
+        estimate = max_edge_id * EDGE_INDEX_BYTES + max_node_id * NODE_INDEX_BYTES
+        if estimate > ADJACENCY_MEMORY_BUDGET:
+            self.disabled_reason = (
+                f"estimated {estimate} bytes exceeds the {ADJACENCY_MEMORY_BUDGET} byte budget"
+            )
+            return False
+        self.disabled_reason = None
+
+        rows = conn.execute(
+            "SELECT id, source_id, target_id, relation FROM edges WHERE id <= ?",
+            (max_edge_id,)
+        ).fetchall()
+        count = len(rows)
+
+        edge_ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=count)
+        sources = np.fromiter((r[1] for r in rows), dtype=np.int64, count=count)
+        targets = np.fromiter((r[2] for r in rows), dtype=np.int64, count=count)
+        relations = np.fromiter((self._relation_code(r[3]) for r in rows), dtype=np.int32, count=count)
+        del rows
+
+        self.node_ids = np.unique(np.concatenate([sources, targets]))
+        src = np.searchsorted(self.node_ids, sources).astype(np.int32)
+        dst = np.searchsorted(self.node_ids, targets).astype(np.int32)
+
+        self.out = self._csr(src, dst, relations, edge_ids)
+        self.inc = self._csr(dst, src, relations, edge_ids)
+        self.base_edges = count
+        self.high_water = max_edge_id
+        self.built = True
+        return True
+
+    def _csr(self, rows, cols, relations, edge_ids):
+        order = np.argsort(rows, kind="stable")
+        offsets = np.zeros(len(self.node_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(self.node_ids)), out=offsets[1:])
+        return offsets, cols[order], relations[order], edge_ids[order]
+
+    def status(self):
+        with self._lock:
+            nbytes = 0
+            if self.built:
+                nbytes = self.node_ids.nbytes + sum(
+                    a.nbytes for a in self.out + self.inc
+                )
+            return {
+                "available": np is not None and ADJACENCY_CACHE_ENABLED,
+                "built": self.built,
+                "stale": self.stale,
+                "nodes": 0 if self.node_ids is None else int(len(self.node_ids)),
+                "base_edges": self.base_edges,
+                "delta_edges": self.delta_edges,
+                "high_water_edge_id": self.high_water,
+                "bytes": int(nbytes),
+                "memory_budget": ADJACENCY_MEMORY_BUDGET,
+                "disabled_reason": self.disabled_reason,
+            }
+
+    def edge_arrays(self):
+        """All indexed edges as parallel (source_ids, target_ids) int64 arrays."""
+        with self._lock:
+            offsets, cols, _, _ = self.out
+            sources = [np.repeat(self.node_ids, np.diff(offsets))]
+            targets = [self.node_ids[cols]]
+            for source_id, hops in self.delta_out.items():
+                sources.append(np.full(len(hops), source_id, dtype=np.int64))
+                targets.append(np.array([hop[0] for hop in hops], dtype=np.int64))
+            return np.concatenate(sources), np.concatenate(targets)
+
+    # ---- traversal -----------------------------------------
+
+    def relation_filter(self, relations):
+        """Relation names -> array of codes (None means no filter)."""
+        if relations is None:
+            return None
+        return np.array(
+            [self.relation_codes[r] for r in relations if r in self.relation_codes],
+            dtype=np.int32
+        )
+
+    def _expand_base(self, csr, frontier, allowed, fanout):
+        offsets, cols, rels, eids = csr
+        empty = np.zeros(0, dtype=np.int64)
+        if not len(self.node_ids) or not len(frontier):
+            return empty, empty, empty.astype(np.int32), empty
+
+        pos = np.searchsorted(self.node_ids, frontier)
+        pos = np.minimum(pos, len(self.node_ids) - 1)
+        known = self.node_ids[pos] == frontier
+        pos, sources = pos[known], frontier[known]
+
+        starts = offsets[pos]
+        counts = offsets[pos + 1] - starts
+        group = np.repeat(np.arange(len(pos)), counts)
+        idx = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+        if allowed is not None:
+            mask = np.isin(rels[idx], allowed)
+            idx, group = idx[mask], group[mask]
+        if fanout is not None and len(group):
+            # rank of each edge within its source's run; keep the first `fanout`
+            rank = np.arange(len(group)) - np.searchsorted(group, group)
+            keep = rank < fanout
+            idx, group = idx[keep], group[keep]
+
+        return sources[group], self.node_ids[cols[idx]], rels[idx], eids[idx]
+
+    def _expand_delta(self, delta, frontier, allowed, fanout):
+        allowed_set = None if allowed is None else set(allowed.tolist())
+        hops = []
+        for node_id in frontier.tolist():
+            taken = 0
+            for other_id, code, edge_id in delta.get(node_id, ()):
+                if allowed_set is not None and code not in allowed_set:
+                    continue
+                if fanout is not None and taken >= fanout:
+                    break
+                hops.append((node_id, other_id, code, edge_id))
+                taken += 1
+        if not hops:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty.astype(np.int32), empty
+        cols = list(zip(*hops))
+        return (
+            np.array(cols[0], dtype=np.int64),
+            np.array(cols[1], dtype=np.int64),
+            np.array(cols[2], dtype=np.int32),
+            np.array(cols[3], dtype=np.int64),
+        )
+
+    def expand(self, frontier, direction, allowed=None, fanout=None):
+        """
+        One hop from every node id in `frontier`. Returns parallel arrays
+        (from_ids, to_ids, relation_codes, edge_ids), where `to_ids` is
+        the node on the far side of each edge.
+        """
+        frontier = np.asarray(frontier, dtype=np.int64)
+        parts = []
+        for side, csr, delta in (("out", self.out, self.delta_out), ("in", self.inc, self.delta_in)):
+            if direction not in (side, "both"):
+                continue
+            hops = tuple(np.concatenate(column) for column in zip(
+                self._expand_base(csr, frontier, allowed, fanout),
+                self._expand_delta(delta, frontier, allowed, fanout),
+            ))
+            # Each part is capped on its own; cap the merged hops again
+            parts.append(hops if fanout is None else self._cap_fanout(hops, fanout))
+        return tuple(np.concatenate(column) for column in zip(*parts))
+
+    @staticmethod
+    def _cap_fanout(hops, fanout):
+        """Keep the first `fanout` hops of each source node, in order."""
+        order = np.argsort(hops[0], kind="stable")
+        sources = hops[0][order]
+        rank = np.arange(len(order)) - np.searchsorted(sources, sources)
+        keep = np.sort(order[rank < fanout])
+        return tuple(column[keep] for column in hops)
+
+    def k_hop(self, start, opts):
+        with self._lock:
+            allowed = self.relation_filter(opts["relation_names"])
+            depths = {start: 0}
+            frontier = np.array([start], dtype=np.int64)
+
+            for depth in range(1, opts["depth"] + 1):
+                if not len(frontier) or len(depths) >= opts["max_nodes"]:
+                    break
+                _, reached, _, _ = self.expand(frontier, opts["direction"], allowed, opts["fanout"])
+                fresh = [n for n in np.unique(reached).tolist() if n not in depths]
+                fresh = fresh[:opts["max_nodes"] - len(depths)]
+                for node_id in fresh:
+                    depths[node_id] = depth
+                frontier = np.array(fresh, dtype=np.int64)
+
+            # edges among the visited nodes
+            visited = np.fromiter(depths.keys(), dtype=np.int64, count=len(depths))
+            sources, targets, codes, edge_ids = self.expand(visited, "out", allowed)
+            inside = np.isin(targets, visited)
+            edges = [
+                [e, s, t, self.relation_names[c]]
+                for e, s, t, c in zip(
+                    edge_ids[inside].tolist(), sources[inside].tolist(),
+                    targets[inside].tolist(), codes[inside].tolist()
+                )
+            ]
+            return depths, edges
+
+    def shortest_path(self, source_id, target_id, opts, budget):
+        if source_id == target_id:
+            return [source_id], []
+        with self._lock:
+            allowed = self.relation_filter(opts["relation_names"])
+            parents = {source_id: None}
+            frontier = np.array([source_id], dtype=np.int64)
+
+            for _ in range(opts["depth"]):
+                if not len(frontier) or len(parents) > budget:
+                    break
+                sources, reached, codes, edge_ids = self.expand(
+                    frontier, opts["direction"], allowed, opts["fanout"]
+                )
+                fresh = []
+                for s, t, e in zip(sources.tolist(), reached.tolist(), edge_ids.tolist()):
+                    if t in parents:
+                        continue
+                    parents[t] = (s, e)
+                    if t == target_id:
+                        return self._unwind(parents, target_id)
+                    fresh.append(t)
+                frontier = np.array(fresh, dtype=np.int64)
+
+            return None
+
+    @staticmethod
+    def _unwind(parents, target_id):
+        node_ids, edge_ids = [target_id], []
+        step = parents[target_id]
+        while step is not None:
+            node_id, edge_id = step
+            node_ids.append(node_id)
+            edge_ids.append(edge_id)
+            step = parents[node_id]
+        return node_ids[::-1], edge_ids[::-1]
+
+ADJACENCY = _GraphBound("adjacency")
+
+def tool_adjacency_cache_status(params):
+    if params.get("refresh"):
+        ADJACENCY.ready()
+    return ADJACENCY.status()
+
+# ------------------------------------------------------------
+# Graph traversal
+# ------------------------------------------------------------
+#
+# In memory on the CSR index when available, otherwise recursive CTEs.
+# Fan-out and visit budgets bound every walk.
+
+DIRECTIONS = ("out", "in", "both")
+
+def _traversal_options(params, default_depth):
+    direction = params.get("direction", "both")
+    if direction not in DIRECTIONS:
+        raise ValueError(f"direction must be one of {', '.join(DIRECTIONS)}")
+
+    relations = params.get("relations")
+    if relations is not None and not isinstance(relations, list):
+        raise ValueError("relations must be an array of strings")
+
+    depth = int(params.get("depth", default_depth))
+    if depth < 1 or depth > MAX_TRAVERSAL_DEPTH:
+        raise ValueError(f"depth must be between 1 and {MAX_TRAVERSAL_DEPTH}")
+
+    return {
+        "direction": direction,
+        "relation_names": relations or None,
+        "relations": json.dumps(relations) if relations else None,
+        "depth": depth,
+        "fanout": max(1, int(params.get("max_fanout", DEFAULT_MAX_FANOUT))),
+        "max_nodes": max(1, int(params.get("max_nodes", DEFAULT_MAX_NODES))),
+    }
+
+def _adjacency_sql(direction, relations):
+    """
+    SQL fragments for one hop from `w.node_id`: a join condition on
+    `edges e` (limited to :fanout edges per direction) and the
+    expression for the node on the other side of `e`.
+    """
+    relation_filter = ""
+    if relations:
+        relation_filter = " AND relation IN (SELECT value FROM json_each(:relations))"
+
+    out_ids = f"SELECT id FROM (SELECT id FROM edges WHERE source_id = w.node_id{relation_filter} LIMIT :fanout)"
+    in_ids = f"SELECT id FROM (SELECT id FROM edges WHERE target_id = w.node_id{relation_filter} LIMIT :fanout)"
+
+    if direction == "out":
+        return f"e.id IN ({out_ids})", "e.target_id"
+    if direction == "in":
+        return f"e.id IN ({in_ids})", "e.source_id"
+    return (
+        f"e.id IN ({out_ids} UNION ALL {in_ids})",
+        "CASE WHEN e.source_id = w.node_id THEN e.target_id ELSE e.source_id END"
+    )
+
+def _require_node(conn, node_id):
+    if node_id is None:
+        raise ValueError("node_id is required")
+    row = conn.execute("SELECT id, label, type FROM nodes WHERE id = ?", (node_id,)).fetchone()
+    if row is None:
+        raise ValueError(f"Node {node_id} does not exist")
+    return row
+
+def _node_labels(conn, node_ids):
+    rows = conn.execute(
+        "SELECT id, label, type FROM nodes WHERE id IN (SELECT value FROM json_each(?))",
+        (json.dumps(list(node_ids)),)
+    )
+    return {row["id"]: (row["label"], row["type"]) for row in rows}
+
+def tool_neighbors(params):
+    """
+    Direct neighbours of a node, one row per connecting edge.
+
+    Accepts: node_id, direction ("out" | "in" | "both"), relations, limit
+    """
+    opts = _traversal_options(params, default_depth=1)
+    limit = int(params.get("limit", opts["fanout"]))
+    with DB.reader() as conn:
+        node_id = _require_node(conn, params.get("node_id"))["id"]
+
+    if ADJACENCY.ready():
+        hops = []
+        with ADJACENCY._lock:
+            allowed = ADJACENCY.relation_filter(opts["relation_names"])
+            for direction in ("out", "in"):
+                if opts["direction"] not in (direction, "both"):
+                    continue
+                _, others, codes, edge_ids = ADJACENCY.expand([node_id], direction, allowed, limit)
+                hops.extend(
+                    (e, ADJACENCY.relation_names[c], direction, o)
+                    for e, c, o in zip(edge_ids.tolist(), codes.tolist(), others.tolist())
+                )
+        hops = hops[:limit]
+
+        with DB.reader() as conn:
+            labels = _node_labels(conn, {hop[3] for hop in hops})
+
+        neighbors = [
+            {
+                "edge_id": edge_id,
+                "relation": relation,
+                "direction": direction,
+                "node_id": other_id,
+                "label": labels.get(other_id, (None, None))[0],
+                "type": labels.get(other_id, (None, None))[1]
+            }
+            for edge_id, relation, direction, other_id in hops
+        ]
+        return {"node_id": node_id, "engine": "memory", "neighbors": neighbors}
+
+    queries = []
+    if opts["direction"] in ("out", "both"):
+        queries.append("""
+            SELECT * FROM (
+                SELECT e.id AS edge_id, e.relation, 'out' AS direction,
+                       e.target_id AS node_id
+                FROM edges e
+                WHERE e.source_id = :node_id{filter}
+                LIMIT :limit
+            )
+        """)
+    if opts["direction"] in ("in", "both"):
+        queries.append("""
+            SELECT * FROM (
+                SELECT e.id AS edge_id, e.relation, 'in' AS direction,
+                       e.source_id AS node_id
+                FROM edges e
+                WHERE e.target_id = :node_id{filter}
+                LIMIT :limit
+            )
+        """)
+
+    relation_filter = ""
+    if opts["relations"]:
+        relation_filter = " AND e.relation IN (SELECT value FROM json_each(:relations))"
+    sql = (
+        "SELECT a.edge_id, a.relation, a.direction, a.node_id, n.label, n.type "
+        "FROM (" + " UNION ALL ".join(queries).format(filter=relation_filter) + ") a "
+        "LEFT JOIN nodes n ON n.id = a.node_id "
+        "LIMIT :limit"
+    )
+
+    with DB.reader() as conn:
+        rows = conn.execute(sql, {
+            "node_id": node_id,
+            "relations": opts["relations"],
+            "limit": limit,
+        }).fetchall()
+
+    return {
+        "node_id": node_id,
+        "engine": "sql",
+        "neighbors": [
+            {
+                "edge_id": row["edge_id"],
+                "relation": row["relation"],
+                "direction": row["direction"],
+                "node_id": row["node_id"],
+                "label": row["label"],
+                "type": row["type"]
+            }
+            for row in rows
+        ]
+    }
+
+def _k_hop_sql(conn, node_id, opts, max_edges):
+    join, next_node = _adjacency_sql(opts["direction"], opts["relations"])
+
+    walk_sql = f"""
+        WITH RECURSIVE walk(node_id, depth) AS (
+            SELECT :node_id, 0
+            UNION
+            SELECT {next_node}, w.depth + 1
+            FROM walk w JOIN edges e ON {join}
+            WHERE w.depth < :depth
+            LIMIT :budget
+        )
+        SELECT node_id, MIN(depth) AS depth
+        FROM walk
+        GROUP BY node_id
+        ORDER BY depth, node_id
+        LIMIT :max_nodes
+    """
+
+    edge_relation_filter = ""
+    if opts["relations"]:
+        edge_relation_filter = " AND relation IN (SELECT value FROM json_each(:relations))"
+    edges_sql = f"""
+        SELECT id, source_id, target_id, relation FROM edges
+        WHERE source_id IN (SELECT value FROM json_each(:ids))
+          AND target_id IN (SELECT value FROM json_each(:ids)){edge_relation_filter}
+        LIMIT :max_edges
+    """
+
+    depths = {
+        row["node_id"]: row["depth"]
+        for row in conn.execute(walk_sql, {
+            "node_id": node_id,
+            "depth": opts["depth"],
+            "fanout": opts["fanout"],
+            "relations": opts["relations"],
+            "budget": opts["max_nodes"] * MAX_VISITS_PER_NODE,
+            "max_nodes": opts["max_nodes"],
+        })
+    }
+    edges = [
+        [row["id"], row["source_id"], row["target_id"], row["relation"]]
+        for row in conn.execute(edges_sql, {
+            "ids": json.dumps(list(depths)),
+            "relations": opts["relations"],
+            "max_edges": max_edges,
+        })
+    ]
+    return depths, edges
+
+def tool_k_hop_subgraph(params):
+    """
+    The subgraph within `depth` hops of a node: nodes with their hop
+    distance, plus the edges among them.
+
+    Accepts: node_id, depth, direction, relations, max_fanout,
+             max_nodes, max_edges
+    """
+    node_id = params.get("node_id")
+    opts = _traversal_options(params, default_depth=2)
+    max_edges = max(1, int(params.get("max_edges", opts["max_nodes"] * 4)))
+
+    engine = "memory" if ADJACENCY.ready() else "sql"
+
+    with DB.reader() as conn:
+        node_id = _require_node(conn, node_id)["id"]
+        if engine == "memory":
+            depths, edges = ADJACENCY.k_hop(node_id, opts)
+            edges = edges[:max_edges]
+        else:
+            depths, edges = _k_hop_sql(conn, node_id, opts, max_edges)
+        labels = _node_labels(conn, depths)
+
+    nodes = [
+        {
+            "id": nid,
+            "label": labels.get(nid, (None, None))[0],
+            "type": labels.get(nid, (None, None))[1],
+            "depth": depth
+        }
+        for nid, depth in sorted(depths.items(), key=lambda item: (item[1], item[0]))
+        if nid in labels
+    ]
+
+    return {
+        "node_id": node_id,
+        "depth": opts["depth"],
+        "engine": engine,
+        "nodes": nodes,
+        "edges": edges,
+        "truncated": len(depths) >= opts["max_nodes"] or len(edges) >= max_edges
+    }
+
+def _shortest_path_sql(conn, source_id, target_id, opts, budget):
+    join, next_node = _adjacency_sql(opts["direction"], opts["relations"])
+
+    # Recursive CTEs are evaluated breadth-first, so the first row that
+    # reaches the target is a shortest path. Paths are carried as
+    # ",id,id," strings so a walk never revisits a node.
+    path_sql = f"""
+        WITH RECURSIVE walk(node_id, depth, path, edge_path) AS (
+            SELECT :source_id, 0, ',' || :source_id || ',', ','
+            UNION ALL
+            SELECT {next_node}, w.depth + 1,
+                   w.path || ({next_node}) || ',',
+                   w.edge_path || e.id || ','
+            FROM walk w JOIN edges e ON {join}
+            WHERE w.depth < :depth
+              AND w.node_id != :target_id
+              AND instr(w.path, ',' || ({next_node}) || ',') = 0
+            LIMIT :budget
+        )
+        SELECT depth, path, edge_path FROM walk
+        WHERE node_id = :target_id
+        ORDER BY depth
+        LIMIT 1
+    """
+
+    row = conn.execute(path_sql, {
+        "source_id": source_id,
+        "target_id": target_id,
+        "depth": opts["depth"],
+        "fanout": opts["fanout"],
+        "relations": opts["relations"],
+        "budget": budget,
+    }).fetchone()
+
+    if row is None:
+        return None
+    node_ids = [int(x) for x in row["path"].strip(",").split(",")]
+    edge_ids = [int(x) for x in row["edge_path"].strip(",").split(",") if x]
+    return node_ids, edge_ids
+
+def tool_shortest_path(params):
+    """
+    Fewest-hop path between two nodes, or `found: false` if none exists
+    within `max_depth` hops (or within the visit budget).
+
+    Accepts: source_id, target_id, max_depth, direction, relations,
+             max_fanout, max_nodes
+    """
+    source_id = params.get("source_id")
+    target_id = params.get("target_id")
+    opts = _traversal_options(
+        {**params, "depth": params.get("max_depth", params.get("depth", 4))},
+        default_depth=4
+    )
+    budget = opts["max_nodes"] * MAX_VISITS_PER_NODE
+
+    engine = "memory" if ADJACENCY.ready() else "sql"
+
+    with DB.reader() as conn:
+        source_id = _require_node(conn, source_id)["id"]
+        target_id = _require_node(conn, target_id)["id"]
+        if engine == "memory":
+            path = ADJACENCY.shortest_path(source_id, target_id, opts, budget)
+        else:
+            path = _shortest_path_sql(conn, source_id, target_id, opts, budget)
+
+        if path is None:
+            return {"source_id": source_id, "target_id": target_id, "engine": engine, "found": False}
+
+        node_ids, edge_ids = path
+        labels = _node_labels(conn, node_ids)
+        edges = {
+            r["id"]: r
+            for r in conn.execute(
+                "SELECT id, source_id, target_id, relation FROM edges WHERE id IN (SELECT value FROM json_each(?))",
+                (json.dumps(edge_ids),)
+            )
+        }
+
+    return {
+        "source_id": source_id,
+        "target_id": target_id,
+        "engine": engine,
+        "found": True,
+        "length": len(edge_ids),
+        "nodes": [
+            {"id": nid, "label": labels.get(nid, (None, None))[0], "type": labels.get(nid, (None, None))[1]}
+            for nid in node_ids
+        ],
+        "edges": [
+            [eid, edges[eid]["source_id"], edges[eid]["target_id"], edges[eid]["relation"]]
+            for eid in edge_ids
+        ]
+    }
+
+# ------------------------------------------------------------
+# Full-text search
+# ------------------------------------------------------------
+
+def _table_exists(conn, name):
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = ? AND type IN ('table', 'view')",
+        (name,)
+    ).fetchone()
+    return row is not None
+
+def _simple_match_query(text, prefix):
+    """
+    Turn free text into an FTS5 query: every word must match, each word
+    quoted so punctuation and FTS operators in user input are inert.
+    """
+    terms = [t.replace('"', '""') for t in text.split()]
+    if not terms:
+        raise ValueError("query must contain at least one word")
+    quoted = [f'"{t}"' for t in terms]
+    if prefix:
+        quoted[-1] += "*"
+    return " ".join(quoted)
+
+def tool_search_nodes(params):
+    """
+    Ranked full-text search over node labels and the text fields of
+    node data.
+
+    Accepts:
+        {
+            "query": "...",
+            "types": ["concept", ...],   # optional type filter
+            "limit": 20,
+            "syntax": "simple" | "fts5", # simple (default) = all words must match
+            "prefix": false,             # simple syntax: prefix-match the last word
+            "snippet_tokens": 12
+        }
+
+    Label matches weigh more than data matches; higher scores are better.
+    """
+    query = (params.get("query") or "").strip()
+    types = params.get("types")
+    limit = int(params.get("limit", 20))
+    syntax = params.get("syntax", "simple")
+    snippet_tokens = max(1, min(64, int(params.get("snippet_tokens", 12))))
+
+    if not query:
+        raise ValueError("query is required")
+    if syntax not in ("simple", "fts5"):
+        raise ValueError("syntax must be 'simple' or 'fts5'")
+
+    match = query if syntax == "fts5" else _simple_match_query(query, params.get("prefix", False))
+    type_filter = ""
+    if types:
+        type_filter = " AND n.type IN (SELECT value FROM json_each(:types))"
+
+    with DB.reader() as conn:
+        if not _table_exists(conn, "nodes_fts"):
+            rows = conn.execute(f"""
+                SELECT n.id, n.label, n.type, 0.0 AS score, NULL AS snippet
+                FROM nodes n
+                WHERE n.label LIKE :pattern{type_filter}
+                ORDER BY n.id DESC
+                LIMIT :limit
+            """, {
+                "pattern": f"%{query}%",
+                "types": json.dumps(types) if types else None,
+                "limit": limit,
+            }).fetchall()
+            engine = "like"
+        else:
+            try:
+                rows = conn.execute(f"""
+                    SELECT n.id, n.label, n.type,
+                           -bm25(nodes_fts, 10.0, 1.0) AS score,
+                           snippet(nodes_fts, -1, '[', ']', '…', :tokens) AS snippet
+                    FROM nodes_fts
+                    JOIN nodes n ON n.id = nodes_fts.rowid
+                    WHERE nodes_fts MATCH :match{type_filter}
+                    ORDER BY bm25(nodes_fts, 10.0, 1.0)
+                    LIMIT :limit
+                """, {
+                    "match": match,
+                    "tokens": snippet_tokens,
+                    "types": json.dumps(types) if types else None,
+                    "limit": limit,
+                }).fetchall()
+            except sqlite3.OperationalError as e:
+                raise ValueError(f"Invalid search query: {e}")
+            engine = "fts5"
+
+    return {
+        "query": query,
+        "engine": engine,
+        "results": [
+            {
+                "id": row["id"],
+                "label": row["label"],
+                "type": row["type"],
+                "score": round(row["score"], 4),
+                "snippet": row["snippet"]
+            }
+            for row in rows
+        ]
+    }
+
+# ------------------------------------------------------------
+# Change feed
+# ------------------------------------------------------------
+
+def change_log_floor(conn):
+    """Newest seq pruned from the change log (0 if none); cursors below it have expired."""
+    oldest = conn.execute("SELECT MIN(seq) FROM changes").fetchone()[0]
+    return oldest - 1 if oldest else 0
+
+def prune_change_log(conn, keep=None):
+    """Drop all but the newest `keep` (CHANGE_LOG_KEEP) events; returns how many went."""
+    keep = CHANGE_LOG_KEEP if keep is None else keep
+    return conn.execute(
+        "DELETE FROM changes WHERE seq <= (SELECT MAX(seq) FROM changes) - ?",
+        (max(1, int(keep)),)
+    ).rowcount
+
+def tool_changes_since(params):
+    """
+    Everything that changed after a change-log sequence number.
+
+    Accepts:
+        {
+            "cursor": 0,                  # last seq already processed
+            "limit": 500,                 # max events per call
+            "include_rows": true,         # attach current node/edge rows
+            "exclude_types": ["cognitive_state"],  # skip events for these node types
+            "on_expired": "error"         # or "reset": restart from the oldest kept event
+        }
+
+    Returns `events` as [seq, entity, id, op] (oldest first), the current
+    rows of changed nodes/edges, the ids of deleted ones and the next
+    `cursor`. A cursor behind the pruned part of the log has expired.
+    """
+    cursor = int(params.get("cursor") or 0)
+    limit = int(params.get("limit", 500))
+    include_rows = params.get("include_rows", True)
+    exclude_types = params.get("exclude_types")
+    on_expired = params.get("on_expired", "error")
+
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    if on_expired not in ("error", "reset"):
+        raise ValueError("on_expired must be 'error' or 'reset'")
+
+    type_filter = ""
+    if exclude_types:
+        type_filter = """
+            AND NOT EXISTS (
+                SELECT 1 FROM nodes n
+                WHERE c.entity = 'node' AND n.id = c.entity_id
+                  AND n.type IN (SELECT value FROM json_each(:exclude_types))
+            )
+        """
+
+    with DB.reader() as conn:
+        if not conn.in_transaction:
+            conn.execute("BEGIN")   # one snapshot for events and rows
+        latest = conn.execute("SELECT MAX(seq) FROM changes").fetchone()[0] or 0
+        floor = change_log_floor(conn)
+        expired = cursor < floor
+        if expired:
+            if on_expired == "error":
+                raise ValueError(f"cursor expired: events up to seq {floor} were pruned")
+            cursor = floor
+
+        events = conn.execute(f"""
+            SELECT c.seq, c.entity, c.entity_id, c.op FROM changes c
+            WHERE c.seq > :cursor AND c.seq <= :latest{type_filter}
+            ORDER BY c.seq
+            LIMIT :limit
+        """, {
+            "cursor": cursor,
+            "latest": latest,
+            "limit": limit + 1,
+            "exclude_types": json.dumps(exclude_types) if exclude_types else None,
+        }).fetchall()
+
+        has_more = len(events) > limit
+        events = events[:limit]
+        next_cursor = events[-1]["seq"] if has_more else max(cursor, latest)
+
+        result = {
+            "cursor": next_cursor,
+            "has_more": has_more,
+            "events": [[e["seq"], e["entity"], e["entity_id"], e["op"]] for e in events],
+        }
+        if expired:
+            result["expired"] = True
+
+        if include_rows:
+            node_ids = json.dumps(sorted({e["entity_id"] for e in events if e["entity"] == "node"}))
+            edge_ids = json.dumps(sorted({e["entity_id"] for e in events if e["entity"] == "edge"}))
+
+            nodes = [
+                _node_row(row) for row in conn.execute(
+                    "SELECT id, label, type, data, created_at FROM nodes "
+                    "WHERE id IN (SELECT value FROM json_each(?))",
+                    (node_ids,)
+                )
+            ]
+            edges = [
+                _edge_row(row) for row in conn.execute(
+                    "SELECT id, source_id, target_id, relation, data, created_at FROM edges "
+                    "WHERE id IN (SELECT value FROM json_each(?))",
+                    (edge_ids,)
+                )
+            ]
+            present_nodes = {n["id"] for n in nodes}
+            present_edges = {e["id"] for e in edges}
+
+            result["nodes"] = nodes
+            result["edges"] = edges
+            result["deleted"] = {
+                "nodes": [i for i in json.loads(node_ids) if i not in present_nodes],
+                "edges": [i for i in json.loads(edge_ids) if i not in present_edges],
+            }
+
+    return result
+
+# ------------------------------------------------------------
+# Retention, rollup and archival
+# ------------------------------------------------------------
+#
+# Per-type policies expire nodes by age or count. Expired nodes are
+# optionally rolled up per period, then archived or dropped.
+
+ROLLUP_PERIODS = {
+    "day": "%Y-%m-%d",
+    "week": "%Y-W%W",
+    "month": "%Y-%m",
+}
+PROTECTED_TYPES = {"cognitive_state", "cognitive_aggregates"}
+RETENTION_BATCH_SIZE = 5000
+INCREMENTAL_VACUUM_PAGES = 2000
+
+def _ensure_archive():
+    DB.attach("archive", current_graph().archive_path)
+    with DB.writer() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS archive.nodes (
+                id INTEGER PRIMARY KEY,
+                label TEXT NOT NULL,
+                type TEXT,
+                data TEXT,
+                created_at TEXT,
+                dedup_key TEXT,
+                hits INTEGER,
+                archived_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS archive.edges (
+                id INTEGER PRIMARY KEY,
+                source_id INTEGER NOT NULL,
+                target_id INTEGER NOT NULL,
+                relation TEXT,
+                data TEXT,
+                created_at TEXT,
+                dedup_key TEXT,
+                hits INTEGER,
+                archived_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_archive_nodes_type ON nodes(type, created_at)")
+
+def tool_set_retention_policy(params):
+    """
+    Create, replace or remove the retention policy for a node type.
+
+    Accepts:
+        {
+            "type": "reflection",
+            "max_age_days": 14,      # optional
+            "max_count": 1000,       # optional: keep only the newest N
+            "rollup": "week",        # optional: day | week | month
+            "rollup_path": "/summary/active_concepts",  # optional: values counted per rollup
+            "archive": true,         # move to the archive DB (false = delete)
+            "remove": false          # drop the policy instead
+        }
+    """
+    type_ = params.get("type")
+    if not type_:
+        raise ValueError("type is required")
+    if type_ in PROTECTED_TYPES:
+        raise ValueError(f"type {type_} cannot have a retention policy")
+
+    if params.get("remove"):
+        with DB.writer() as conn:
+            conn.execute("DELETE FROM retention_policies WHERE type = ?", (type_,))
+        return {"type": type_, "removed": True}
+
+    max_age_days = params.get("max_age_days")
+    max_count = params.get("max_count")
+    rollup = params.get("rollup")
+    rollup_path = params.get("rollup_path")
+
+    if max_age_days is None and max_count is None:
+        raise ValueError("max_age_days or max_count is required")
+    if max_age_days is not None and float(max_age_days) <= 0:
+        raise ValueError("max_age_days must be positive")
+    if max_count is not None and int(max_count) < 0:
+        raise ValueError("max_count must not be negative")
+    if rollup is not None and rollup not in ROLLUP_PERIODS:
+        raise ValueError(f"rollup must be one of {', '.join(ROLLUP_PERIODS)}")
+    if rollup_path is not None:
+        if rollup is None:
+            raise ValueError("rollup_path requires rollup")
+        _pointer_segments(rollup_path)
+
+    policy = {
+        "type": type_,
+        "max_age_days": None if max_age_days is None else float(max_age_days),
+        "max_count": None if max_count is None else int(max_count),
+        "rollup": rollup,
+        "rollup_path": rollup_path,
+        "archive": bool(params.get("archive", True)),
+    }
+
+    with DB.writer() as conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO retention_policies
+                (type, max_age_days, max_count, rollup, rollup_path, archive, updated_at)
+            VALUES (:type, :max_age_days, :max_count, :rollup, :rollup_path, :archive, CURRENT_TIMESTAMP)
+        """, policy)
+
+    return {"policy": policy}
+
+def _expired_node_ids(conn, policy, limit):
+    cutoff = None
+    if policy["max_age_days"] is not None:
+        cutoff = conn.execute(
+            "SELECT datetime('now', ?)", (f"-{policy['max_age_days']} days",)
+        ).fetchone()[0]
+
+    rows = conn.execute("""
+        SELECT id FROM nodes
+        WHERE type = :type AND (
+            (:cutoff IS NOT NULL AND created_at < :cutoff)
+            OR (:max_count IS NOT NULL AND (created_at, id) <= (
+                SELECT created_at, id FROM nodes WHERE type = :type
+                ORDER BY created_at DESC, id DESC
+                LIMIT 1 OFFSET :max_count
+            ))
+        )
+        ORDER BY created_at, id
+        LIMIT :limit
+    """, {
+        "type": policy["type"],
+        "cutoff": cutoff,
+        "max_count": policy["max_count"],
+        "limit": limit,
+    }).fetchall()
+    return [row["id"] for row in rows]
+
+def _rollup(conn, policy, ids_json):
+    """Fold expired nodes into one summary node per period; returns their ids."""
+    fmt = ROLLUP_PERIODS[policy["rollup"]]
+    rollup_type = f"{policy['type']}_rollup"
+    rollup_ids = []
+
+    periods = conn.execute("""
+        SELECT strftime(:fmt, created_at) AS period, COUNT(*) AS count,
+               MIN(created_at) AS first_created_at, MAX(created_at) AS last_created_at
+        FROM nodes WHERE id IN (SELECT value FROM json_each(:ids))
+        GROUP BY period
+    """, {"fmt": fmt, "ids": ids_json}).fetchall()
+
+    for period in periods:
+        # Values found at the policy's rollup_path in the rolled-up nodes
+        value_rows = []
+        if policy["rollup_path"]:
+            doc = "CASE WHEN json_valid(n.data) THEN n.data ELSE '{}' END"
+            value_rows = conn.execute(f"""
+                SELECT v.value AS value, COUNT(*) AS count
+                FROM nodes n, json_each({doc}, {json_pointer_sql(policy["rollup_path"], doc)}) v
+                WHERE n.id IN (SELECT value FROM json_each(:ids))
+                  AND strftime(:fmt, n.created_at) = :period
+                GROUP BY v.value
+            """, {"fmt": fmt, "ids": ids_json, "period": period["period"]}).fetchall()
+
+        label = f"{policy['type'].capitalize()} rollup {period['period']}"
+        existing = conn.execute(
+            "SELECT id, data FROM nodes WHERE type = ? AND dedup_key = ?",
+            (rollup_type, normalize_label(label))
+        ).fetchone()
+        data = json.loads(existing["data"]) if existing and existing["data"] else {
+            "source_type": policy["type"],
+            "period": period["period"],
+            "count": 0,
+            "first_created_at": period["first_created_at"],
+            "last_created_at": period["last_created_at"],
+            "rollup_path": policy["rollup_path"],
+            "value_counts": {},
+        }
+
+        data["count"] += period["count"]
+        data["first_created_at"] = min(data["first_created_at"], period["first_created_at"])
+        data["last_created_at"] = max(data["last_created_at"], period["last_created_at"])
+        counts = data.setdefault("value_counts", data.pop("concept_counts", {}))
+        for row in value_rows:
+            key = str(row["value"])
+            counts[key] = counts.get(key, 0) + row["count"]
+
+        if existing:
+            node_id = existing["id"]
+            conn.execute("UPDATE nodes SET data = ? WHERE id = ?", (json.dumps(data), node_id))
+        else:
+            node_id, _, _ = _upsert_node(conn, label, rollup_type, data)
+        rollup_ids.append(node_id)
+
+    return rollup_ids
+
+def _expire_nodes(conn, policy, ids):
+    ids_json = json.dumps(ids)
+    edge_filter = """
+        source_id IN (SELECT value FROM json_each(:ids))
+        OR target_id IN (SELECT value FROM json_each(:ids))
+    """
+
+    if policy["archive"]:
+        conn.execute("""
+            INSERT OR REPLACE INTO archive.nodes
+                (id, label, type, data, created_at, dedup_key, hits)
+            SELECT id, label, type, data, created_at, dedup_key, hits FROM main.nodes
+            WHERE id IN (SELECT value FROM json_each(:ids))
+        """, {"ids": ids_json})
+        conn.execute(f"""
+            INSERT OR REPLACE INTO archive.edges
+                (id, source_id, target_id, relation, data, created_at, dedup_key, hits)
+            SELECT id, source_id, target_id, relation, data, created_at, dedup_key, hits
+            FROM main.edges WHERE {edge_filter}
+        """, {"ids": ids_json})
+
+    edges_removed = conn.execute(
+        f"DELETE FROM main.edges WHERE {edge_filter}", {"ids": ids_json}
+    ).rowcount
+    conn.execute(
+        "DELETE FROM main.nodes WHERE id IN (SELECT value FROM json_each(:ids))",
+        {"ids": ids_json}
+    )
+    return edges_removed
+
+def _vacuum(mode):
+    if mode == "none":
+        return "skipped"
+
+    with DB.maintenance() as conn:
+        auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+
+        if mode == "full":
+            # One-off: switching auto_vacuum mode only takes effect after VACUUM.
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+            return "full"
+
+        if auto_vacuum != 2:
+            return "skipped: auto_vacuum is not INCREMENTAL (run once with vacuum='full' to enable)"
+        conn.execute(f"PRAGMA incremental_vacuum({INCREMENTAL_VACUUM_PAGES})").fetchall()
+        return "incremental"
+
+def tool_apply_retention(params):
+    """
+    Apply retention policies.
+
+    Accepts:
+        {
+            "types": ["reflection"],  # optional: only these policies
+            "dry_run": false,         # report what would expire, change nothing
+            "batch_size": 5000,       # max nodes expired per policy per call
+            "vacuum": "incremental"   # incremental | full | none
+        }
+
+    `has_more` is set when a policy has expired nodes beyond this batch.
+    """
+    types = params.get("types")
+    dry_run = params.get("dry_run", False)
+    batch_size = max(1, int(params.get("batch_size", RETENTION_BATCH_SIZE)))
+    vacuum = params.get("vacuum", "incremental")
+
+    if vacuum not in ("incremental", "full", "none"):
+        raise ValueError("vacuum must be 'incremental', 'full' or 'none'")
+
+    with DB.reader() as conn:
+        policies = [dict(row) for row in conn.execute("SELECT * FROM retention_policies ORDER BY type")]
+    if types:
+        policies = [p for p in policies if p["type"] in types]
+
+    if not dry_run and any(p["archive"] for p in policies):
+        _ensure_archive()
+
+    report = []
+    edges_removed = 0
+    for policy in policies:
+        with DB.writer() as conn:
+            ids = _expired_node_ids(conn, policy, batch_size + 1)
+            has_more = len(ids) > batch_size
+            ids = ids[:batch_size]
+
+            entry = {
+                "type": policy["type"],
+                "expired": len(ids),
+                "has_more": has_more,
+                "archived": bool(policy["archive"]) and not dry_run,
+                "rollup_node_ids": [],
+            }
+
+            if ids and not dry_run:
+                if policy["rollup"]:
+                    entry["rollup_node_ids"] = _rollup(conn, policy, json.dumps(ids))
+                removed = _expire_nodes(conn, policy, ids)
+                entry["edges_removed"] = removed
+                edges_removed += removed
+
+        report.append(entry)
+
+    if edges_removed:
+        ADJACENCY.invalidate()
+
+    change_log_pruned = 0
+    if not dry_run:
+        with DB.writer() as conn:
+            change_log_pruned = prune_change_log(conn)
+
+    expired_any = any(entry["expired"] for entry in report)
+    return {
+        "dry_run": dry_run,
+        "policies": report,
+        "change_log_pruned": change_log_pruned,
+        "vacuum": _vacuum(vacuum) if expired_any and not dry_run else "skipped"
+    }
+
+# ------------------------------------------------------------
+# Graph analytics
+# ------------------------------------------------------------
+#
+# PageRank, degrees and components, recomputed in full with NumPy from
+# one reader snapshot (PageRank warm-starts from the stored ranks). Only
+# the node_metrics replace goes through the writer. Reads never
+# recompute: stale metrics are served flagged and a refresh is started
+# in the background.
+
+METRICS = ("pagerank", "in_degree", "out_degree")
+
+def _load_graph_arrays(conn):
+    node_ids = np.fromiter(
+        (row[0] for row in conn.execute("SELECT id FROM nodes ORDER BY id")), dtype=np.int64
+    )
+    if ADJACENCY.ready():
+        sources, targets = ADJACENCY.edge_arrays()
+    else:
+        rows = conn.execute("SELECT source_id, target_id FROM edges").fetchall()
+        pairs = np.array(rows, dtype=np.int64).reshape(-1, 2)
+        sources, targets = pairs[:, 0], pairs[:, 1]
+
+    # Drop edges whose endpoints no longer exist
+    src = np.searchsorted(node_ids, sources)
+    dst = np.searchsorted(node_ids, targets)
+    valid = (src < len(node_ids)) & (dst < len(node_ids))
+    valid[valid] &= (node_ids[src[valid]] == sources[valid]) & (node_ids[dst[valid]] == targets[valid])
+    return node_ids, src[valid], dst[valid]
+
+def pagerank(src, dst, n, initial=None, damping=PAGERANK_DAMPING,
+             tolerance=PAGERANK_TOLERANCE, max_iterations=PAGERANK_MAX_ITERATIONS):
+    """Power iteration over dense-index edge arrays. Returns (ranks, iterations)."""
+    if n == 0:
+        return np.zeros(0), 0
+
+    out_degree = np.bincount(src, minlength=n).astype(np.float64)
+    dangling = out_degree == 0
+    inv_out = np.divide(1.0, out_degree, out=np.zeros(n), where=~dangling)
+
+    ranks = np.full(n, 1.0 / n) if initial is None else initial / initial.sum()
+    for iteration in range(1, max_iterations + 1):
+        flow = np.bincount(dst, weights=ranks[src] * inv_out[src], minlength=n)
+        updated = (1.0 - damping) / n + damping * (flow + ranks[dangling].sum() / n)
+        delta = np.abs(updated - ranks).sum()
+        ranks = updated
+        if delta < tolerance:
+            break
+    return ranks, iteration
+
+def weakly_connected_components(src, dst, n):
+    """Min-label propagation with pointer jumping. Returns a label per node."""
+    labels = np.arange(n)
+    if not len(src):
+        return labels
+    while True:
+        previous = labels.copy()
+        smaller = np.minimum(labels[src], labels[dst])
+        np.minimum.at(labels, src, smaller)
+        np.minimum.at(labels, dst, smaller)
+        labels = labels[labels]
+        if np.array_equal(labels, previous):
+            return labels
+
+def compute_node_metrics():
+    if np is None:
+        raise RuntimeError("NumPy is required for graph analytics")
+
+    started = time.monotonic()
+    with DB.reader() as conn:
+        if not conn.in_transaction:
+            conn.execute("BEGIN")       # one snapshot for nodes, edges and change seq
+        change_seq = conn.execute("SELECT MAX(seq) FROM changes").fetchone()[0] or 0
+        node_ids, src, dst = _load_graph_arrays(conn)
+
+        previous = dict(conn.execute("SELECT node_id, pagerank FROM node_metrics"))
+
+    n = len(node_ids)
+    initial = None
+    if previous:
+        initial = np.fromiter((previous.get(i, 1.0 / max(n, 1)) for i in node_ids.tolist()), dtype=np.float64, count=n)
+
+    ranks, iterations = pagerank(src, dst, n, initial)
+    in_degree = np.bincount(dst, minlength=n)
+    out_degree = np.bincount(src, minlength=n)
+    components = node_ids[weakly_connected_components(src, dst, n)] if n else node_ids
+    rows = list(zip(node_ids.tolist(), ranks.tolist(), in_degree.tolist(), out_degree.tolist(), components.tolist()))
+    run = {
+        "change_seq": change_seq,
+        "nodes": n,
+        "edges": int(len(src)),
+        "iterations": iterations,
+        "components": int(len(np.unique(components))),
+        "duration_ms": round((time.monotonic() - started) * 1000, 1),
+    }
+
+    def store():
+        with DB.writer() as conn:
+            conn.execute("DELETE FROM node_metrics")
+            conn.executemany(
+                "INSERT INTO node_metrics (node_id, pagerank, in_degree, out_degree, component) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            cur = conn.execute("""
+                INSERT INTO metrics_runs (change_seq, nodes, edges, iterations, components, duration_ms)
+                VALUES (:change_seq, :nodes, :edges, :iterations, :components, :duration_ms)
+            """, run)
+            run["computed_at"] = conn.execute(
+                "SELECT computed_at FROM metrics_runs WHERE id = ?", (cur.lastrowid,)
+            ).fetchone()[0]
+        return run
+
+    return run_on_writer(store)
+
+def _metrics_staleness(conn):
+    """(last run or None, change-log events since that run)."""
+    run = conn.execute("SELECT * FROM metrics_runs ORDER BY id DESC LIMIT 1").fetchone()
+    latest = conn.execute("SELECT MAX(seq) FROM changes").fetchone()[0] or 0
+    if run is None:
+        return None, latest
+    return dict(run), latest - run["change_seq"]
+
+# main() points this at the writer thread's queue; without it (module
+# used in-process) short writes run on the calling thread.
+WRITE_QUEUE = None
+_ON_WRITER = threading.local()
+_pending_refreshes = set()
+_pending_refreshes_lock = threading.Lock()
+
+def run_on_writer(job):
+    """Run the short write `job()` for the current graph on the writer thread; returns its result."""
+    if WRITE_QUEUE is None or getattr(_ON_WRITER, "active", False):
+        return job()
+    name = current_graph().name
+    future = Future()
+
+    def run():
+        try:
+            with use_graph(name):
+                future.set_result(job())
+        except Exception as e:
+            future.set_exception(e)
+
+    WRITE_QUEUE.put(run)
+    return future.result()
+
+def request_metrics_refresh():
+    """Start one background metrics run for the current graph; False if one is pending."""
+    name = current_graph().name
+    with _pending_refreshes_lock:
+        if name in _pending_refreshes:
+            return False
+        _pending_refreshes.add(name)
+
+    def refresh():
+        try:
+            with use_graph(name):
+                compute_node_metrics()
+        except Exception as e:
+            sys.stderr.write(f"metrics refresh of graph {name} failed: {e}\n")
+        finally:
+            with _pending_refreshes_lock:
+                _pending_refreshes.discard(name)
+
+    threading.Thread(target=refresh, name="kg-metrics", daemon=True).start()
+    return True
+
+def tool_compute_graph_metrics(params):
+    """Recompute node_metrics now; returns run statistics."""
+    return compute_node_metrics()
+
+def tool_top_central_nodes(params):
+    """
+    Highest-ranked nodes from the materialized metrics.
+
+    Accepts:
+        {
+            "limit": 10,
+            "metric": "pagerank" | "in_degree" | "out_degree",
+            "types": ["concept"],      # optional node type filter
+            "refresh": "auto"          # auto | never
+        }
+
+    Stored metrics are `stale` after METRICS_REFRESH_CHANGES changes;
+    with refresh "auto" a recompute is then started.
+    """
+    limit = int(params.get("limit", 10))
+    metric = params.get("metric", "pagerank")
+    types = params.get("types")
+    refresh = params.get("refresh", "auto")
+
+    if metric not in METRICS:
+        raise ValueError(f"metric must be one of {', '.join(METRICS)}")
+    if refresh not in ("auto", "never"):
+        raise ValueError("refresh must be 'auto' or 'never'")
+
+    with DB.reader() as conn:
+        run, pending = _metrics_staleness(conn)
+
+    if run is None and np is None:
+        raise ValueError("No graph metrics have been computed yet (NumPy is required to compute them)")
+    stale = run is None or pending >= METRICS_REFRESH_CHANGES
+    refresh_queued = stale and refresh == "auto" and np is not None and request_metrics_refresh()
+
+    type_filter = ""
+    if types:
+        type_filter = "WHERE n.type IN (SELECT value FROM json_each(:types))"
+
+    with DB.reader() as conn:
+        rows = conn.execute(f"""
+            SELECT m.node_id, n.label, n.type, m.pagerank, m.in_degree, m.out_degree, m.component
+            FROM node_metrics m JOIN nodes n ON n.id = m.node_id
+            {type_filter}
+            ORDER BY m.{metric} DESC
+            LIMIT :limit
+        """, {"types": json.dumps(types) if types else None, "limit": limit}).fetchall()
+
+    return {
+        "metric": metric,
+        "computed_at": run["computed_at"] if run else None,
+        "stale": stale,
+        "refresh_queued": refresh_queued,
+        "pending_changes": pending,
+        "nodes": [
+            {
+                "id": row["node_id"],
+                "label": row["label"],
+                "type": row["type"],
+                "pagerank": round(row["pagerank"], 8),
+                "in_degree": row["in_degree"],
+                "out_degree": row["out_degree"],
+                "component": row["component"]
+            }
+            for row in rows
+        ]
+    }
+
+# ------------------------------------------------------------
+# Node embeddings
+# ------------------------------------------------------------
+#
+# One float32 vector per node in a memory-mapped .npy sidecar, synced
+# from the change log before each search. set_embedder swaps the model;
+# a new `name` re-embeds every node.
+
+TOKEN_RE = re.compile(r"\w+")
+
+class HashingEmbedder:
+    """Signed feature hashing of words and word bigrams. Deterministic, no model files."""
+
+    def __init__(self, dim=EMBEDDING_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text):
+        tokens = TOKEN_RE.findall(normalize_label(text))
+        return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for feature in self._features(text or ""):
+                h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+                vectors[i, h % self.dim] += 1.0 if h >> 63 else -1.0
+        return vectors
+
+def _normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+NODE_EMBED_TEXT_SQL = "label || ' ' || coalesce(" + NODE_TEXT_SQL.format(data="data") + ", '')"
+
+class EmbeddingIndex:
+    def __init__(self, db, path, embedder=None):
+        self.db = db
+        self.path = path
+        if embedder is None and np is not None:
+            embedder = HashingEmbedder()
+        self.embedder = embedder
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.matrix = None              # memmap (capacity, dim) float32, rows unit-length
+        self.row_nodes = None           # int64 per row; node id, or 0 for a free row
+        self.node_rows = {}             # node id -> row
+        self.free = []
+        self.rows = 0                   # rows in use, including freed ones
+        self.change_seq = 0
+        self.inode = None
+
+    def set_embedder(self, embedder):
+        with self._lock:
+            self.embedder = embedder
+            self._reset()
+
+    # ---- storage -------------------------------------------
+
+    def _open(self, capacity=None):
+        """Open the sidecar; with `capacity`, first rewrite it at that size."""
+        if capacity is not None:
+            tmp_path = self.path + ".tmp"
+            grown = np.lib.format.open_memmap(
+                tmp_path, mode="w+", dtype=np.float32, shape=(capacity, self.embedder.dim)
+            )
+            row_nodes = np.zeros(capacity, dtype=np.int64)
+            if self.matrix is not None:
+                grown[:self.rows] = self.matrix[:self.rows]
+                row_nodes[:self.rows] = self.row_nodes[:self.rows]
+            grown.flush()
+            del grown
+            self.matrix = None
+            os.replace(tmp_path, self.path)
+            self.row_nodes = row_nodes
+        self.matrix = np.load(self.path, mmap_mode="r+")
+        self.inode = os.stat(self.path).st_ino
+
+    def _is_current(self, state):
+        """False if another process has advanced (or rewritten) the shared index."""
+        try:
+            inode = os.stat(self.path).st_ino
+        except OSError:
+            return False
+        return (
+            self.matrix is not None and state is not None
+            and state["rows"] == self.rows and state["change_seq"] == self.change_seq
+            and inode == self.inode
+        )
+
+    def _load(self, conn, state):
+        """Attach to the persisted index; False if it must be rebuilt."""
+        if state is None or state["embedder"] != self.embedder.name or not os.path.exists(self.path):
+            return False
+        try:
+            self._open()
+        except (OSError, ValueError):
+            return False
+        if self.matrix.ndim != 2 or self.matrix.shape[1] != self.embedder.dim or self.matrix.shape[0] < state["rows"]:
+            self.matrix = None
+            return False
+
+        self.rows = state["rows"]
+        self.change_seq = state["change_seq"]
+        self.row_nodes = np.zeros(self.matrix.shape[0], dtype=np.int64)
+        self.node_rows = dict(conn.execute("SELECT node_id, row FROM node_embeddings"))
+        if self.node_rows:
+            self.row_nodes[list(self.node_rows.values())] = list(self.node_rows.keys())
+        self.free = np.flatnonzero(self.row_nodes[:self.rows] == 0).tolist()
+        return True
+
+    def _save(self, stored, removed):
+        self.matrix.flush()
+        with self.db.writer() as conn:
+            conn.executemany("DELETE FROM node_embeddings WHERE node_id = ?", ((i,) for i in removed))
+            conn.executemany("INSERT OR REPLACE INTO node_embeddings (node_id, row) VALUES (?, ?)", stored)
+            conn.execute("""
+                INSERT INTO embedding_index (id, embedder, dim, rows, change_seq) VALUES (1, ?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    embedder = excluded.embedder, dim = excluded.dim, rows = excluded.rows,
+                    change_seq = excluded.change_seq, updated_at = CURRENT_TIMESTAMP
+            """, (self.embedder.name, self.embedder.dim, self.rows, self.change_seq))
+
+    # ---- sync ----------------------------------------------
+
+    def _store(self, node_texts):
+        """Embed and write (node_id, text) pairs; returns (node_id, row) pairs."""
+        if not node_texts:
+            return []
+        vectors = _normalize_rows(self.embedder.embed([text for _, text in node_texts]))
+        stored = []
+        for (node_id, _), vector in zip(node_texts, vectors):
+            row = self.node_rows.get(node_id)
+            if row is None:
+                if self.free:
+                    row = self.free.pop()
+                else:
+                    if self.rows == self.matrix.shape[0]:
+                        self._open(capacity=2 * self.matrix.shape[0])
+                    row = self.rows
+                    self.rows += 1
+                self.node_rows[node_id] = row
+                self.row_nodes[row] = node_id
+            self.matrix[row] = vector
+            stored.append((node_id, row))
+        return stored
+
+    def _rebuild(self, conn, latest):
+        self._reset()
+        count = conn.execute("SELECT COUNT(*) FROM nodes").fetchone()[0]
+        self._open(capacity=max(EMBEDDING_MIN_CAPACITY, count))
+
+        stored = []
+        cursor = conn.execute(f"SELECT id, {NODE_EMBED_TEXT_SQL} FROM nodes ORDER BY id")
+        while True:
+            batch = cursor.fetchmany(EMBEDDING_BATCH_SIZE)
+            if not batch:
+                break
+            stored.extend(self._store([(row[0], row[1]) for row in batch]))
+
+        self.change_seq = latest
+        with self.db.writer() as write_conn:
+            write_conn.execute("DELETE FROM node_embeddings")
+            self._save(stored, [])
+
+    def _apply_changes(self, conn, latest):
+        changed = [
+            row[0] for row in conn.execute(
+                "SELECT DISTINCT entity_id FROM changes WHERE entity = 'node' AND seq > ? AND seq <= ?",
+                (self.change_seq, latest)
+            )
+        ]
+        stored, removed = [], []
+        for start in range(0, len(changed), EMBEDDING_BATCH_SIZE):
+            ids = changed[start:start + EMBEDDING_BATCH_SIZE]
+            present = conn.execute(
+                f"SELECT id, {NODE_EMBED_TEXT_SQL} FROM nodes "
+                f"WHERE id IN (SELECT value FROM json_each(?))",
+                (json.dumps(ids),)
+            ).fetchall()
+            for node_id in set(ids) - {row[0] for row in present}:
+                row = self.node_rows.pop(node_id, None)
+                if row is not None:
+                    self.row_nodes[row] = 0
+                    self.matrix[row] = 0
+                    self.free.append(row)
+                    removed.append(node_id)
+            stored.extend(self._store([(row[0], row[1]) for row in present]))
+
+        self.change_seq = latest
+        self._save(stored, removed)
+
+    def is_current(self):
+        """True if the index already reflects every committed node change."""
+        with self._lock, self.db.reader() as conn:
+            latest = conn.execute("SELECT MAX(seq) FROM changes").fetchone()[0] or 0
+            state = conn.execute("SELECT * FROM embedding_index WHERE id = 1").fetchone()
+            return latest == self.change_seq and self._is_current(state)
+
+    def sync(self):
+        """Bring the index up to date with committed node changes."""
+        if np is None:
+            raise RuntimeError("NumPy is required for the embedding index")
+        if self.db.in_write():
+            raise RuntimeError("The embedding index cannot be synced inside a write transaction")
+
+        with self._lock:
+            if self.is_current():
+                return
+
+            # Syncing writes the sidecar, which other processes serving this
+            # graph share; the database write lock makes them take turns.
+            with self.db.writer() as conn:
+                latest = conn.execute("SELECT MAX(seq) FROM changes").fetchone()[0] or 0
+                state = conn.execute("SELECT * FROM embedding_index WHERE id = 1").fetchone()
+                if not self._is_current(state):
+                    self._reset()
+                    if not self._load(conn, state):
+                        self._rebuild(conn, latest)
+                        return
+                if latest < self.change_seq or self.change_seq < change_log_floor(conn):
+                    self._rebuild(conn, latest)
+                elif latest > self.change_seq:
+                    self._apply_changes(conn, latest)
+
+    # ---- search --------------------------------------------
+
+    def vectors_for(self, node_ids):
+        rows = []
+        for node_id in node_ids:
+            row = self.node_rows.get(node_id)
+            if row is None:
+                raise ValueError(f"Node {node_id} is not in the embedding index")
+            rows.append(row)
+        return np.array(self.matrix[rows])
+
+    def embed_texts(self, texts):
+        return _normalize_rows(self.embedder.embed(texts))
+
+    def search(self, queries, limit, allowed_rows=None, exclude=None):
+        """
+        Top-`limit` cosine matches for each row of `queries`.
+        Returns one list of (node_id, score) per query.
+        """
+        with self._lock:
+            scores = np.asarray(queries, dtype=np.float32) @ self.matrix[:self.rows].T
+            invalid = self.row_nodes[:self.rows] == 0
+            if allowed_rows is not None:
+                keep = np.zeros(self.rows, dtype=bool)
+                keep[allowed_rows] = True
+                invalid |= ~keep
+            scores[:, invalid] = -np.inf
+            if exclude is not None:
+                for q, node_id in enumerate(exclude):
+                    row = self.node_rows.get(node_id)
+                    if row is not None:
+                        scores[q, row] = -np.inf
+
+            k = max(0, min(limit, self.rows))
+            if k == 0:
+                return [[] for _ in range(len(scores))]
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+            return [
+                [
+                    (int(self.row_nodes[row]), float(score))
+                    for row, score in zip(rows, row_scores) if score > -np.inf
+                ]
+                for rows, row_scores in zip(top, top_scores)
+            ]
+
+EMBEDDINGS = _GraphBound("embeddings")
+EMBEDDER = None                 # None: each graph uses a HashingEmbedder
+
+def set_embedder(embedder):
+    """Swap the embedding model in every graph (see the section comment for the protocol)."""
+    global EMBEDDER
+    EMBEDDER = embedder
+    for graph in (GRAPHS.each_open() if GRAPHS is not None else []):
+        graph.embeddings.set_embedder(embedder)
+
+def tool_similar_nodes(params):
+    """
+    Nearest nodes by cosine similarity of their embeddings.
+
+    Accepts one or more queries, by node or by free text:
+        {
+            "node_id": 12,             # or "node_ids": [12, 40]
+            "text": "sparse graphs",   # or "texts": ["...", "..."]
+            "limit": 10,
+            "types": ["concept"],      # optional node type filter
+            "min_score": 0.2           # optional
+        }
+
+    Returns one result per query, node queries first.
+    """
+    node_ids = list(params.get("node_ids") or [])
+    if params.get("node_id") is not None:
+        node_ids.insert(0, params["node_id"])
+    texts = list(params.get("texts") or [])
+    if params.get("text"):
+        texts.insert(0, params["text"])
+    if not node_ids and not texts:
+        raise ValueError("node_id(s) or text(s) is required")
+
+    limit = int(params.get("limit", 10))
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    types = params.get("types")
+    min_score = params.get("min_score")
+
+    if np is None:
+        raise RuntimeError("NumPy is required for the embedding index")
+    if not EMBEDDINGS.is_current():
+        run_on_writer(EMBEDDINGS.sync)
+
+    with EMBEDDINGS._lock:
+        parts = []
+        if node_ids:
+            parts.append(EMBEDDINGS.vectors_for(node_ids))
+        if texts:
+            parts.append(EMBEDDINGS.embed_texts(texts))
+        queries = np.concatenate(parts)
+
+        allowed_rows = None
+        if types:
+            with DB.reader() as conn:
+                allowed_rows = [
+                    row[0] for row in conn.execute("""
+                        SELECT e.row FROM node_embeddings e JOIN nodes n ON n.id = e.node_id
+                        WHERE n.type IN (SELECT value FROM json_each(?))
+                    """, (json.dumps(types),))
+                ]
+
+        exclude = node_ids + [None] * len(texts)
+        matches = EMBEDDINGS.search(queries, limit, allowed_rows, exclude)
+
+    if min_score is not None:
+        matches = [[m for m in found if m[1] >= min_score] for found in matches]
+
+    with DB.reader() as conn:
+        labels = _node_labels(conn, {node_id for found in matches for node_id, _ in found})
+
+    results = []
+    for query, found in zip(
+        [{"node_id": i} for i in node_ids] + [{"text": t} for t in texts], matches
+    ):
+        query["matches"] = [
+            {"id": node_id, "label": labels[node_id][0], "type": labels[node_id][1], "score": round(score, 6)}
+            for node_id, score in found if node_id in labels
+        ]
+        results.append(query)
+
+    return {"embedder": EMBEDDINGS.embedder.name, "results": results}
+
+# ------------------------------------------------------------
+# Triple-pattern queries
+# ------------------------------------------------------------
+#
+# A small pattern language compiled to a single SQL statement:
+#
+#     ?doc -[tagged_with]-> ?concept; ?concept.type = 'concept'
+#
+# Clauses are separated by `;` or newlines:
+#   edge     TERM -[rel]-> TERM, TERM <-[rel]- TERM, TERM --> TERM
+#            `rel` is a name, `a|b`, a ?variable (bound to the relation
+#            name) or empty for any relation
+#   filter   ?var.field OP value, with field one of id, label, type,
+#            created_at or data.<key>[.<key>...], and OP one of
+#            = != < <= > >= like in, not in
+#   return   return ?a, ?b    (default: every named variable)
+# TERM is a ?variable, a node id, or a quoted node label.
+#
+# Aliases are joined in a greedy row-estimate order pinned with CROSS JOIN.
+
+QUOTED = r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\""
+TERM = rf"\?\w+|\d+|{QUOTED}"
+EDGE_PATTERN_RE = re.compile(rf"^({TERM})\s*(<?)-\[([^\]]*)\]-(>?)\s*({TERM})$")
+EDGE_SHORT_RE = re.compile(rf"^({TERM})\s*(<?)--(>?)\s*({TERM})$")
+FILTER_RE = re.compile(
+    r"^\?(\w+)\.([A-Za-z_][\w.]*)\s*(=|!=|<>|<=|>=|<|>|not\s+in\b|in\b|like\b)\s*(.+)$",
+    re.IGNORECASE
+)
+RETURN_RE = re.compile(r"^return\s+(.+)$", re.IGNORECASE)
+
+QUERY_NODE_FIELDS = {"id", "label", "type", "created_at"}
+QUERY_COMPARISONS = {"=", "!=", "<", "<=", ">", ">="}
+
+def _split_outside_quotes(text, separators):
+    return [
+        part.strip()
+        for part in re.findall(rf"(?:{QUOTED}|[^{separators}'\"])+", text)
+        if part.strip()
+    ]
+
+def _unquote(text):
+    return re.sub(r"\\(.)", r"\1", text[1:-1])
+
+def _parse_literal(text):
+    text = text.strip()
+    if text.startswith("(") and text.endswith(")"):
+        return [_parse_literal(part) for part in _split_outside_quotes(text[1:-1], ",")]
+    if re.fullmatch(QUOTED, text):
+        return _unquote(text)
+    lowered = text.lower()
+    if lowered in ("true", "false"):
+        return lowered == "true"
+    if lowered == "null":
+        return None
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    raise ValueError(f"Cannot parse value: {text}")
+
+def _parse_query(text):
+    """
+    Returns (nodes, edges, returns):
+        nodes   {var: [(field, op, value), ...]}, anonymous terms named "#n"
+        edges   [{"source", "target", "relations", "relation_var"}]
+        returns list of variable names, or None for "all named"
+    """
+    nodes, edges, returns = {}, [], None
+
+    def term(token):
+        if token.startswith("?"):
+            nodes.setdefault(token[1:], [])
+            return token[1:]
+        name = f"#{len(nodes)}"
+        if token.isdigit():
+            nodes[name] = [("id", "=", int(token))]
+        else:
+            nodes[name] = [("label", "=", _unquote(token))]
+        return name
+
+    for clause in _split_outside_quotes(text, ";\n"):
+        edge = EDGE_PATTERN_RE.match(clause)
+        short = None if edge else EDGE_SHORT_RE.match(clause)
+        if edge or short:
+            if edge:
+                left, back, spec, forward, right = edge.groups()
+            else:
+                left, back, forward, right = short.groups()
+                spec = ""
+            if bool(back) == bool(forward):
+                raise ValueError(f"Edge pattern needs exactly one direction: {clause}")
+            source, target = (term(left), term(right)) if forward else (term(right), term(left))
+
+            spec = spec.strip()
+            relations = relation_var = None
+            if spec.startswith("?"):
+                relation_var = spec[1:]
+                if not relation_var.isidentifier():
+                    raise ValueError(f"Invalid relation variable: {spec}")
+            elif spec:
+                relations = [
+                    _unquote(name) if re.fullmatch(QUOTED, name) else name
+                    for name in _split_outside_quotes(spec, "|")
+                ]
+            edges.append({
+                "source": source, "target": target,
+                "relations": relations, "relation_var": relation_var
+            })
+            continue
+
+        match = FILTER_RE.match(clause)
+        if match:
+            var, field, op, value = match.groups()
+            op = " ".join(op.lower().split())
+            op = "!=" if op == "<>" else op
+            value = _parse_literal(value)
+
+            if field.startswith("data."):
+                field = "/" + field[len("data."):].replace(".", "/")
+                _pointer_segments(field)
+            elif field not in QUERY_NODE_FIELDS:
+                raise ValueError(f"Unknown field '{field}' in: {clause}")
+            if op in ("in", "not in") and not isinstance(value, list):
+                raise ValueError(f"'{op}' needs a parenthesized list: {clause}")
+            if op not in ("in", "not in") and isinstance(value, list):
+                raise ValueError(f"A list value needs 'in' or 'not in': {clause}")
+
+            nodes.setdefault(var, []).append((field, op, value))
+            continue
+
+        match = RETURN_RE.match(clause)
+        if match:
+            returns = []
+            for name in _split_outside_quotes(match.group(1), ","):
+                if not re.fullmatch(r"\?\w+", name):
+                    raise ValueError(f"return expects ?variables: {clause}")
+                returns.append(name[1:])
+            continue
+
+        raise ValueError(f"Cannot parse clause: {clause}")
+
+    if not edges and not nodes:
+        raise ValueError("query is empty")
+    if len(edges) > QUERY_MAX_PATTERNS:
+        raise ValueError(f"At most {QUERY_MAX_PATTERNS} edge patterns per query")
+
+    relation_vars = {edge["relation_var"] for edge in edges if edge["relation_var"]}
+    for var in relation_vars & set(nodes):
+        raise ValueError(f"?{var} is used both as a node and as a relation")
+    for var in returns or ():
+        if var not in nodes and var not in relation_vars:
+            raise ValueError(f"return names unknown variable ?{var}")
+
+    return nodes, edges, returns
+
+def _query_stats(conn):
+    """Node/edge totals and per-type / per-relation counts, recounted as the graph changes."""
+    graph = current_graph()
+    stats = graph.query_stats
+    latest = conn.execute("SELECT MAX(seq) FROM changes").fetchone()[0] or 0
+    with graph.lock:
+        seq = stats["seq"]
+        if seq is None or abs(latest - seq) >= QUERY_STATS_REFRESH_CHANGES:
+            types = dict(conn.execute("SELECT type, COUNT(*) FROM nodes GROUP BY type"))
+            relations = dict(conn.execute("SELECT relation, COUNT(*) FROM edges GROUP BY relation"))
+            stats.update({
+                "seq": latest,
+                "nodes": max(sum(types.values()), 1),
+                "edges": max(sum(relations.values()), 1),
+                "types": types,
+                "relations": relations,
+            })
+        return dict(stats)
+
+def _estimate_node(filters, stats):
+    estimate = stats["nodes"]
+    for field, op, value in filters:
+        if field in ("id", "label") and op == "=":
+            estimate = min(estimate, 1)
+        elif field == "id" and op == "in":
+            estimate = min(estimate, len(value))
+        elif field == "type" and op == "=":
+            estimate = min(estimate, stats["types"].get(value, 0))
+        elif field == "type" and op == "in":
+            estimate = min(estimate, sum(stats["types"].get(v, 0) for v in value))
+        else:
+            estimate *= 0.25
+    return max(estimate, 1)
+
+def _estimate_edge(edge, stats):
+    if edge["relations"] is None:
+        return stats["edges"]
+    return max(sum(stats["relations"].get(r, 0) for r in edge["relations"]), 1)
+
+def _plan_query(nodes, edges, returns, stats):
+    """
+    Greedy join order: start from the smallest alias, then repeatedly add
+    the connected alias that keeps the estimated row count lowest.
+    Returns [(kind, key, estimated_rows)].
+    """
+    returned = set(returns) if returns is not None else {v for v in nodes if not v.startswith("#")}
+    endpoints = {e["source"] for e in edges} | {e["target"] for e in edges}
+    pending = [("node", var) for var in nodes if nodes[var] or var in returned or var not in endpoints]
+    pending += [("edge", i) for i in range(len(edges))]
+
+    n = stats["nodes"]
+    bound, plan, rows = set(), [], 1.0
+    while pending:
+        best = None
+        for item in pending:
+            kind, key = item
+            if kind == "node":
+                connected = key in bound
+                factor = _estimate_node(nodes[key], stats) / (n if connected else 1)
+            else:
+                edge = edges[key]
+                ends = (edge["source"] in bound) + (edge["target"] in bound)
+                count = _estimate_edge(edge, stats)
+                connected = ends > 0
+                factor = (count, count / n, min(1.0, count / n) / n)[ends]
+            candidate = (not connected and bool(plan), rows * factor, item)
+            if best is None or candidate[:2] < best[:2]:
+                best = candidate
+        _, rows, item = best
+        pending.remove(item)
+        plan.append((item[0], item[1], max(rows, 1.0)))
+        if item[0] == "node":
+            bound.add(item[1])
+        else:
+            bound.update((edges[item[1]]["source"], edges[item[1]]["target"]))
+    return plan
+
+def _filter_sql(expr, op, value, params):
+    if op in ("in", "not in"):
+        params.append(json.dumps(value))
+        return f"{expr} {op.upper()} (SELECT value FROM json_each(?))"
+    if value is None and op in ("=", "!="):
+        return f"{expr} IS {'NOT ' if op == '!=' else ''}NULL"
+    if op == "like":
+        params.append(value)
+        return f"{expr} LIKE ?"
+    params.append(value)
+    return f"{expr} {op} ?"
+
+def _compile_query(nodes, edges, returns, plan, schema=None):
+    """
+    Plan -> (sql, params, columns); columns are (variable, kind) in select
+    order. With `schema` (an attached graph) tables are qualified by it
+    and each row leads with the graph name.
+    """
+    if returns is None:
+        relation_vars = [e["relation_var"] for e in edges if e["relation_var"]]
+        returns = [v for v in nodes if not v.startswith("#")] + list(dict.fromkeys(relation_vars))
+
+    prefix = f"{schema[0]}." if schema else ""
+    sources, conditions, params = [], [], []
+    node_alias, bind, relation_bind = {}, {}, {}
+
+    def bind_node(var, expr):
+        if var in bind:
+            conditions.append(f"{expr} = {bind[var]}")
+        else:
+            bind[var] = expr
+
+    for kind, key, _ in plan:
+        if kind == "node":
+            alias = f"n{len(sources)}"
+            sources.append(f"{prefix}nodes AS {alias}")
+            node_alias[key] = alias
+            bind_node(key, f"{alias}.id")
+            for field, op, value in nodes[key]:
+                if field.startswith("/"):
+                    expr = f"json_extract({alias}.data, {json_pointer_sql(field, alias + '.data')})"
+                else:
+                    expr = f"{alias}.{field}"
+                conditions.append(_filter_sql(expr, op, value, params))
+        else:
+            edge = edges[key]
+            alias = f"e{len(sources)}"
+            sources.append(f"{prefix}edges AS {alias}")
+            bind_node(edge["source"], f"{alias}.source_id")
+            bind_node(edge["target"], f"{alias}.target_id")
+            if edge["relations"] is not None:
+                conditions.append(_filter_sql(f"{alias}.relation", "in", edge["relations"], params))
+            if edge["relation_var"]:
+                var = edge["relation_var"]
+                if var in relation_bind:
+                    conditions.append(f"{alias}.relation = {relation_bind[var]}")
+                else:
+                    relation_bind[var] = f"{alias}.relation"
+
+    select, columns = ([f"'{schema[1]}' AS graph"] if schema else []), []
+    for var in returns:
+        if var in node_alias:
+            alias = node_alias[var]
+            select += [f"{alias}.id", f"{alias}.label", f"{alias}.type"]
+            columns.append((var, "node"))
+        else:
+            select.append(relation_bind[var])
+            columns.append((var, "relation"))
+
+    sql = f"SELECT DISTINCT {', '.join(select)} FROM {' CROSS JOIN '.join(sources)}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    return sql, params, columns
+
+def _join_order(plan):
+    return [
+        {"alias": f"?{key}" if kind == "node" else f"edge {key + 1}", "estimated_rows": round(rows, 1)}
+        for kind, key, rows in plan
+    ]
+
+@contextmanager
+def _time_limit(conn, timeout_ms):
+    deadline = time.monotonic() + timeout_ms / 1000
+    conn.set_progress_handler(lambda: time.monotonic() > deadline, 10000)
+    try:
+        yield
+    except sqlite3.OperationalError as e:
+        if "interrupted" in str(e):
+            raise ValueError(f"Query exceeded {timeout_ms} ms") from None
+        raise
+    finally:
+        conn.set_progress_handler(None, 0)
+
+def tool_query(params):
+    """
+    Run a triple-pattern query (see the section comment for the syntax).
+
+    Accepts:
+        {
+            "query": "?doc -[tagged_with]-> ?c; ?c.type = 'concept'",
+            "limit": 100,
+            "offset": 0,
+            "explain": false,      # return the SQL and plan instead of rows
+            "graphs": ["a", "b"]   # optional: run over several graphs
+        }
+
+    Each row maps variable names to {id, label, type} (relation
+    variables to the relation name); with several graphs rows also carry
+    their "graph".
+    """
+    text = params.get("query")
+    if not text or not isinstance(text, str):
+        raise ValueError("query is required")
+    limit = min(int(params.get("limit", QUERY_DEFAULT_LIMIT)), QUERY_MAX_LIMIT)
+    offset = int(params.get("offset", 0))
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    if offset < 0:
+        raise ValueError("offset must not be negative")
+
+    nodes, edges, returns = _parse_query(text)
+
+    names = list(dict.fromkeys(params.get("graphs") or [current_graph().name]))
+    if len(names) > QUERY_MAX_GRAPHS:
+        raise ValueError(f"At most {QUERY_MAX_GRAPHS} graphs per query")
+    multi = len(names) > 1
+
+    # Plan against each graph's own statistics
+    plans = []
+    for name in names:
+        with use_graph(name) as graph, DB.reader() as conn:
+            plans.append((graph.name, graph.path, _plan_query(nodes, edges, returns, _query_stats(conn))))
+
+    with DB.reader() as conn:
+        attached = []
+        if multi and conn.in_transaction:
+            raise ValueError("A cross-graph query cannot run inside a transaction")
+        try:
+            parts, args = [], []
+            for index, (name, path, plan) in enumerate(plans):
+                schema = None
+                if multi:
+                    alias = "main"
+                    if name != current_graph().name:
+                        alias = f"g{index}"
+                        conn.execute(f"ATTACH DATABASE ? AS {alias}", (path,))
+                        attached.append(alias)
+                    schema = (alias, name)
+                sql, part_args, columns = _compile_query(nodes, edges, returns, plan, schema)
+                parts.append(sql)
+                args += part_args
+            # One row past the page tells whether there is more
+            sql = " UNION ALL ".join(parts) + " LIMIT ? OFFSET ?"
+            args += [limit + 1, offset]
+
+            if params.get("explain"):
+                return {
+                    "sql": sql,
+                    "params": args,
+                    "join_order": (
+                        {name: _join_order(plan) for name, _, plan in plans} if multi
+                        else _join_order(plans[0][2])
+                    ),
+                    "query_plan": [row["detail"] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, args)]
+                }
+
+            with _time_limit(conn, QUERY_TIMEOUT_MS):
+                rows = conn.execute(sql, args).fetchall()
+        finally:
+            for alias in attached:
+                conn.execute(f"DETACH DATABASE {alias}")
+
+    results = []
+    for row in rows[:limit]:
+        values, i = ({"graph": row[0]}, 1) if multi else ({}, 0)
+        for var, kind in columns:
+            if kind == "node":
+                values[var] = {"id": row[i], "label": row[i + 1], "type": row[i + 2]}
+                i += 3
+            else:
+                values[var] = row[i]
+                i += 1
+        results.append(values)
+
+    return {
+        "graphs": names,
+        "variables": [var for var, _ in columns],
+        "rows": results,
+        "has_more": len(rows) > limit
+    }
+
+# ------------------------------------------------------------
+# Snapshots
+# ------------------------------------------------------------
+#
+# Online backup inside one read transaction (a single WAL point in
+# time), gzipped next to a manifest with its SHA-256 and change seq.
+# Restores always go to a new file.
+
+SNAPSHOT_NAME_RE = re.compile(r"^[\w.-]+$")
+
+def _snapshot_paths(name):
+    if not SNAPSHOT_NAME_RE.match(name or ""):
+        raise ValueError(f"Invalid snapshot name: {name!r}")
+    base = os.path.join(current_graph().snapshot_dir, name)
+    return base + ".db.gz", base + ".json"
+
+def _read_manifest(name):
+    _, manifest_path = _snapshot_paths(name)
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise ValueError(f"Snapshot not found: {name}") from None
+
+def _write_json(path, payload):
+    with open(path + ".part", "w") as f:
+        json.dump(payload, f, indent=2)
+    os.replace(path + ".part", path)
+
+def _gzip_file(source_path, target_path):
+    """Compress `source_path`; returns the SHA-256 of the uncompressed bytes."""
+    digest = hashlib.sha256()
+    with open(source_path, "rb") as src, gzip.open(target_path, "wb", compresslevel=SNAPSHOT_COMPRESSLEVEL) as dst:
+        for chunk in iter(lambda: src.read(SNAPSHOT_CHUNK_SIZE), b""):
+            digest.update(chunk)
+            dst.write(chunk)
+    return digest.hexdigest()
+
+def _gunzip_file(source_path, target_path):
+    digest = hashlib.sha256()
+    with gzip.open(source_path, "rb") as src, open(target_path, "wb") as dst:
+        for chunk in iter(lambda: src.read(SNAPSHOT_CHUNK_SIZE), b""):
+            digest.update(chunk)
+            dst.write(chunk)
+    return digest.hexdigest()
+
+def _check_database(path):
+    conn = sqlite3.connect(path)
+    try:
+        result = conn.execute("PRAGMA quick_check").fetchone()[0]
+    finally:
+        conn.close()
+    if result != "ok":
+        raise ValueError(f"Integrity check failed for {path}: {result}")
+
+def tool_snapshot(params):
+    """
+    Take an online, compressed, checksummed snapshot.
+
+    Accepts: { "name": "before-migration", "verify": false, "keep": 10 }
+        name    defaults to a UTC timestamp
+        verify  run PRAGMA quick_check on the copy before compressing
+        keep    afterwards delete the oldest snapshots beyond this count (>= 1)
+    """
+    started = time.monotonic()
+    keep = params.get("keep")
+    if keep is not None:
+        keep = int(keep)
+        if keep < 1:
+            raise ValueError("keep must be at least 1")
+    name = params.get("name") or datetime.now(timezone.utc).strftime("snapshot-%Y%m%dT%H%M%S%fZ")
+    archive_path, manifest_path = _snapshot_paths(name)
+    if os.path.exists(manifest_path):
+        raise ValueError(f"Snapshot already exists: {name}")
+    graph = current_graph()
+    os.makedirs(graph.snapshot_dir, exist_ok=True)
+
+    raw_path = os.path.join(graph.snapshot_dir, name + ".db.part")
+    steps = 0
+
+    def progress(status, remaining, total):
+        nonlocal steps
+        steps += 1
+
+    try:
+        target = sqlite3.connect(raw_path)
+        try:
+            with DB.reader() as conn:
+                if not conn.in_transaction:
+                    conn.execute("BEGIN")
+                # The first read starts the snapshot the backup copies from.
+                change_seq = conn.execute("SELECT MAX(seq) FROM changes").fetchone()[0] or 0
+                nodes = conn.execute("SELECT COUNT(*) FROM nodes").fetchone()[0]
+                edges = conn.execute("SELECT COUNT(*) FROM edges").fetchone()[0]
+                schema_version = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0]
+                conn.backup(target, pages=SNAPSHOT_PAGES_PER_STEP, progress=progress)
+            # Self-contained single file, independent of the source's WAL
+            target.execute("PRAGMA journal_mode = DELETE")
+            page_size = target.execute("PRAGMA page_size").fetchone()[0]
+            page_count = target.execute("PRAGMA page_count").fetchone()[0]
+        finally:
+            target.close()
+
+        if params.get("verify"):
+            _check_database(raw_path)
+
+        sha256 = _gzip_file(raw_path, archive_path + ".part")
+        os.replace(archive_path + ".part", archive_path)
+    finally:
+        for leftover in (raw_path, archive_path + ".part"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+    manifest = {
+        "name": name,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "graph": graph.name,
+        "source": os.path.abspath(graph.path),
+        "file": os.path.basename(archive_path),
+        "sha256": sha256,
+        "bytes": page_size * page_count,
+        "compressed_bytes": os.path.getsize(archive_path),
+        "page_size": page_size,
+        "page_count": page_count,
+        "schema_version": schema_version,
+        "change_seq": change_seq,
+        "nodes": nodes,
+        "edges": edges,
+    }
+    _write_json(manifest_path, manifest)
+
+    pruned = []
+    if keep is not None:
+        for old in _list_manifests()[keep:]:
+            for path in _snapshot_paths(old["name"]):
+                if os.path.exists(path):
+                    os.remove(path)
+            pruned.append(old["name"])
+
+    return {
+        **manifest,
+        "steps": steps,
+        "duration_ms": round((time.monotonic() - started) * 1000, 1),
+        "pruned": pruned
+    }
+
+def _list_manifests():
+    """Manifests of the current graph's snapshots, newest first."""
+    snapshot_dir = current_graph().snapshot_dir
+    if not os.path.isdir(snapshot_dir):
+        return []
+    manifests = []
+    for entry in os.listdir(snapshot_dir):
+        if entry.endswith(".json"):
+            try:
+                manifests.append(_read_manifest(entry[:-len(".json")]))
+            except (ValueError, OSError):
+                continue
+    manifests.sort(key=lambda m: m["created_at"], reverse=True)
+    return manifests
+
+def tool_list_snapshots(params):
+    """Snapshots of the current graph, newest first."""
+    return {"directory": os.path.abspath(current_graph().snapshot_dir), "snapshots": _list_manifests()}
+
+def tool_restore_snapshot(params):
+    """
+    Decompress a snapshot into a new database file and verify it.
+
+    Accepts:
+        {
+            "name": "snapshot-...",
+            "target_graph": "recovered",   # restore as a new named graph, or
+            "target_path": "restored.db"   # to an explicit file
+        }
+
+    The target must not exist. A target_path must lie in the graph's
+    snapshot directory or GRAPHS_DIR; relative paths are taken from the
+    snapshot directory, which is also the default destination.
+    """
+    name = params.get("name")
+    manifest = _read_manifest(name)
+    archive_path, _ = _snapshot_paths(name)
+
+    target_graph = params.get("target_graph")
+    if target_graph:
+        target_path = GRAPHS.path_for(target_graph)
+        os.makedirs(os.path.dirname(target_path) or ".", exist_ok=True)
+    else:
+        snapshot_dir = current_graph().snapshot_dir
+        target_path = os.path.realpath(
+            os.path.join(snapshot_dir, params.get("target_path") or f"{name}.restored.db")
+        )
+        allowed = [os.path.realpath(directory) for directory in (snapshot_dir, GRAPHS_DIR)]
+        if os.path.dirname(target_path) not in allowed:
+            raise ValueError("target_path must be in the snapshot directory or the graphs directory")
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    if os.path.exists(target_path):
+        raise ValueError(f"Target already exists: {target_path}")
+
+    part_path = target_path + ".part"
+    try:
+        sha256 = _gunzip_file(archive_path, part_path)
+        if sha256 != manifest["sha256"]:
+            raise ValueError(f"Checksum mismatch for snapshot {name}")
+        _check_database(part_path)
+        os.replace(part_path, target_path)
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+    return {
+        "name": name,
+        "graph": target_graph,
+        "path": os.path.abspath(target_path),
+        "sha256": sha256,
+        "verified": True,
+        "change_seq": manifest["change_seq"]
+    }
+
+# ------------------------------------------------------------
+# Subgraph export
+# ------------------------------------------------------------
+#
+# export_subgraph writes columnar arrays (.npz or Arrow IPC) and a JSON
+# manifest into EXPORT_DIR and returns paths and counts. Edges are those
+# induced by the exported nodes; edge_source / edge_target are rows in
+# node_ids.
+
+EXPORT_FORMATS = ("npz", "arrow")
+
+def _export_paths(name, fmt):
+    """(manifest path, data paths) for an export."""
+    if not SNAPSHOT_NAME_RE.match(name or ""):
+        raise ValueError(f"Invalid export name: {name!r}")
+    base = os.path.join(EXPORT_DIR, name)
+    if fmt == "npz":
+        return base + ".json", [base + ".npz"]
+    return base + ".json", [base + ".nodes.arrow", base + ".edges.arrow"]
+
+def _export_where(params, values_key, column):
+    """WHERE clause and args for the value list and created_at window."""
+    where, args = [], []
+    values = params.get(values_key)
+    if values is not None:
+        if not isinstance(values, list) or not values:
+            raise ValueError(f"{values_key} must be a non-empty list")
+        where.append(f"{column} IN ({', '.join('?' * len(values))})")
+        args.extend(values)
+    since = _normalize_timestamp(params.get("since"), "since")
+    until = _normalize_timestamp(params.get("until"), "until")
+    if since is not None:
+        where.append("created_at >= ?")
+        args.append(since)
+    if until is not None:
+        where.append("created_at < ?")
+        args.append(until)
+    return (" WHERE " + " AND ".join(where)) if where else "", args
+
+def _read_export_arrays(conn, params):
+    """Columnar arrays of the filtered subgraph, read from `conn`."""
+    node_where, node_args = _export_where(params, "types", "type")
+    edge_where, edge_args = _export_where(params, "relations", "relation")
+
+    node_ids, type_codes, labels = [], [], []
+    type_names = {}
+    cursor = conn.execute(f"SELECT id, type, label FROM nodes{node_where} ORDER BY id", node_args)
+    while True:
+        batch = cursor.fetchmany(EXPORT_FETCH_SIZE)
+        if not batch:
+            break
+        for node_id, node_type, label in batch:
+            node_ids.append(node_id)
+            type_codes.append(type_names.setdefault(node_type, len(type_names)))
+            labels.append(label or "")
+
+    edge_ids, sources, targets, relation_codes = [], [], [], []
+    relation_names = {}
+    cursor = conn.execute(
+        f"SELECT id, source_id, target_id, relation FROM edges{edge_where} ORDER BY id", edge_args
+    )
+    while True:
+        batch = cursor.fetchmany(EXPORT_FETCH_SIZE)
+        if not batch:
+            break
+        for edge_id, source_id, target_id, relation in batch:
+            edge_ids.append(edge_id)
+            sources.append(source_id)
+            targets.append(target_id)
+            relation_codes.append(relation_names.setdefault(relation, len(relation_names)))
+
+    node_ids = np.array(node_ids, dtype=np.int64)
+    edge_ids = np.array(edge_ids, dtype=np.int64)
+    source_rows = _rows_in(node_ids, np.array(sources, dtype=np.int64))
+    target_rows = _rows_in(node_ids, np.array(targets, dtype=np.int64))
+    induced = (source_rows >= 0) & (target_rows >= 0)
+    # Re-code relations so only those of exported edges are named
+    used, relation_codes = np.unique(np.array(relation_codes, dtype=np.int32)[induced], return_inverse=True)
+    relation_names = np.array(list(relation_names), dtype=str)[used] if len(used) else np.array([], dtype=str)
+
+    encoded = [label.encode("utf-8") for label in labels]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+
+    return {
+        "node_ids": node_ids,
+        "node_type_codes": np.array(type_codes, dtype=np.int32),
+        "type_names": np.array(list(type_names), dtype=str),
+        "node_label_offsets": offsets,
+        "node_label_bytes": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+        "edge_ids": edge_ids[induced],
+        "edge_source": source_rows[induced].astype(np.int32),
+        "edge_target": target_rows[induced].astype(np.int32),
+        "edge_relation_codes": relation_codes.astype(np.int32),
+        "relation_names": relation_names,
+    }, labels
+
+def _rows_in(sorted_ids, ids):
+    """Row of each id in `sorted_ids`, -1 where absent."""
+    rows = np.searchsorted(sorted_ids, ids)
+    rows[rows >= len(sorted_ids)] = 0
+    found = sorted_ids[rows] == ids if len(sorted_ids) else np.zeros(len(ids), dtype=bool)
+    return np.where(found, rows, -1)
+
+def _write_npz(path, arrays):
+    with open(path + ".part", "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(path + ".part", path)
+
+def _write_arrow(path, columns, metadata):
+    table = pa.table(columns).replace_schema_metadata({"knowledge_graph": json.dumps(metadata)})
+    with pa.OSFile(path + ".part", "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(path + ".part", path)
+
+def tool_export_subgraph(params):
+    """
+    Write the nodes and edges matching a filter as columnar arrays.
+
+    Accepts:
+        {
+            "name": "concepts",            # file stem, defaults to graph + UTC timestamp
+            "format": "npz",               # "npz" (default) | "arrow" (needs pyarrow)
+            "types": ["concept"],          # node types to export (default: all)
+            "relations": ["relates_to"],   # edge relations to export (default: all)
+            "since": "...", "until": "..." # created_at window for nodes and edges
+            "overwrite": false
+        }
+
+    Returns the file paths and node / edge counts.
+    """
+    if np is None:
+        raise RuntimeError("NumPy is required for subgraph export")
+    fmt = params.get("format", "npz")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    if fmt == "arrow" and pa is None:
+        raise ValueError("The arrow format requires pyarrow")
+
+    started = time.monotonic()
+    graph = current_graph()
+    name = params.get("name") or (
+        graph.name + datetime.now(timezone.utc).strftime("-%Y%m%dT%H%M%S%fZ")
+    )
+    manifest_path, data_paths = _export_paths(name, fmt)
+    if os.path.exists(manifest_path) and not params.get("overwrite"):
+        raise ValueError(f"Export already exists: {name}")
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+
+    with DB.reader() as conn:
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+        # Nodes, edges and seq all come from the same read snapshot.
+        change_seq = conn.execute("SELECT MAX(seq) FROM changes").fetchone()[0] or 0
+        arrays, labels = _read_export_arrays(conn, params)
+
+    manifest = {
+        "name": name,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "graph": graph.name,
+        "format": fmt,
+        "files": [os.path.basename(path) for path in data_paths],
+        "filters": {
+            key: params[key] for key in ("types", "relations", "since", "until") if params.get(key) is not None
+        },
+        "change_seq": change_seq,
+        "nodes": len(arrays["node_ids"]),
+        "edges": len(arrays["edge_ids"]),
+    }
+
+    if fmt == "npz":
+        manifest["arrays"] = {
+            key: {"dtype": str(value.dtype), "shape": list(value.shape)} for key, value in arrays.items()
+        }
+        _write_npz(data_paths[0], arrays)
+    else:
+        type_names = pa.array(arrays["type_names"].tolist(), pa.string())
+        relation_names = pa.array(arrays["relation_names"].tolist(), pa.string())
+        _write_arrow(data_paths[0], {
+            "id": pa.array(arrays["node_ids"]),
+            "type": pa.DictionaryArray.from_arrays(pa.array(arrays["node_type_codes"]), type_names),
+            "label": pa.array(labels, pa.string()),
+        }, manifest)
+        _write_arrow(data_paths[1], {
+            "id": pa.array(arrays["edge_ids"]),
+            "source": pa.array(arrays["edge_source"]),
+            "target": pa.array(arrays["edge_target"]),
+            "relation": pa.DictionaryArray.from_arrays(pa.array(arrays["edge_relation_codes"]), relation_names),
+        }, manifest)
+    _write_json(manifest_path, manifest)
+
+    return {
+        "name": name,
+        "format": fmt,
+        "paths": [os.path.abspath(path) for path in data_paths],
+        "manifest": os.path.abspath(manifest_path),
+        "nodes": manifest["nodes"],
+        "edges": manifest["edges"],
+        "change_seq": change_seq,
+        "bytes": sum(os.path.getsize(path) for path in data_paths),
+        "duration_ms": round((time.monotonic() - started) * 1000, 1)
+    }
+
+# ------------------------------------------------------------
+# Database statistics
+# ------------------------------------------------------------
+
+def tool_db_stats(params):
+    """
+    Lock contention and storage figures for the current graph.
+
+    wait_ms histograms cover the writer lock, BEGIN IMMEDIATE, commit
+    and the reader pool.
+
+    Accepts: { "reset": false }   # reset counters after reading them
+    """
+    graph = current_graph()
+    with DB.reader() as conn:
+        storage = {
+            name: conn.execute(f"PRAGMA {name}").fetchone()[0]
+            for name in ("journal_mode", "page_size", "page_count", "freelist_count", "auto_vacuum")
+        }
+    for key, path in (("db_bytes", graph.path), ("wal_bytes", graph.path + "-wal")):
+        storage[key] = os.path.getsize(path) if os.path.exists(path) else 0
+
+    result = {
+        "graph": graph.name,
+        "pid": os.getpid(),
+        "config": {
+            "busy_timeout_ms": BUSY_TIMEOUT_MS,
+            "lock_retries": LOCK_RETRIES,
+            "lock_backoff_ms": LOCK_BACKOFF_MS,
+            "lock_backoff_max_ms": LOCK_BACKOFF_MAX_MS,
+            "reader_pool_size": READER_POOL_SIZE
+        },
+        **DB.stats.snapshot(),
+        "storage": storage
+    }
+    if params.get("reset"):
+        DB.stats.reset()
+    return result
+
+# ------------------------------------------------------------
+# Graph registry
+# ------------------------------------------------------------
+
+GRAPHS = None
+
+def init_graphs():
+    """Open (creating and migrating if needed) the default graph; idempotent."""
+    global GRAPHS
+    if GRAPHS is None:
+        GRAPHS = GraphRegistry(GRAPH_CACHE_SIZE)
+    return GRAPHS
+
+def tool_list_graphs(params):
+    """Known graphs (the default plus every file in GRAPHS_DIR) and which are open."""
+    open_graphs = {graph.name for graph in GRAPHS.each_open()}
+    return {
+        "graphs": [
+            {
+                "name": name,
+                "path": os.path.abspath(GRAPHS.path_for(name)),
+                "open": name in open_graphs
+            }
+            for name in GRAPHS.names()
+        ]
+    }
+
+# ------------------------------------------------------------
+# Tool registry
+# ------------------------------------------------------------
+
+TOOLS = {
+    "add_node": tool_add_node,
+    "add_edge": tool_add_edge,
+    "list_recent_nodes": tool_list_recent_nodes,
+    "list_recent_edges": tool_list_recent_edges,
+    "find_or_create_state_node": tool_find_or_create_state_node,
+    "update_node_data": tool_update_node_data,
+    "add_nodes_batch": tool_add_nodes_batch,
+    "add_edges_batch": tool_add_edges_batch,
+    "apply_write_plan": tool_apply_write_plan,
+    "patch_node_data": tool_patch_node_data,
+    "append_state_history": tool_append_state_history,
+    "get_state_history": tool_get_state_history,
+    "reconstruct_state": tool_reconstruct_state,
+    "neighbors": tool_neighbors,
+    "k_hop_subgraph": tool_k_hop_subgraph,
+    "shortest_path": tool_shortest_path,
+    "adjacency_cache_status": tool_adjacency_cache_status,
+    "search_nodes": tool_search_nodes,
+    "changes_since": tool_changes_since,
+    "set_retention_policy": tool_set_retention_policy,
+    "apply_retention": tool_apply_retention,
+    "compute_graph_metrics": tool_compute_graph_metrics,
+    "top_central_nodes": tool_top_central_nodes,
+    "similar_nodes": tool_similar_nodes,
+    "query": tool_query,
+    "snapshot": tool_snapshot,
+    "list_snapshots": tool_list_snapshots,
+    "restore_snapshot": tool_restore_snapshot,
+    "export_subgraph": tool_export_subgraph,
+    "list_graphs": tool_list_graphs,
+    "db_stats": tool_db_stats,
+}
+
+# Tools that may appear as steps inside apply_write_plan
+PLAN_TOOLS = {
+    "add_node",
+    "add_edge",
+    "find_or_create_state_node",
+    "update_node_data",
+    "patch_node_data",
+    "add_nodes_batch",
+    "add_edges_batch",
+    "append_state_history",
+}
+
+# Run outside the group-commit transaction (they ATTACH / VACUUM, or
+# write node_metrics / the embedding sidecar after reading a snapshot)
+STANDALONE_WRITE_TOOLS = {"apply_retention"}
+# Routed to the single writer thread by the request loop
+WRITE_TOOLS = PLAN_TOOLS | STANDALONE_WRITE_TOOLS | {"apply_write_plan", "set_retention_policy"}
+
+TOOL_SCHEMAS = [
+    {
+        "name": "add_node",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "label": { "type": "string" },
+                "type": { "type": "string" },
+                "data": { "type": "object" },
+                "unique": { "type": "boolean" }
+            },
+            "required": ["label"]
+        }
+    },
+    {
+        "name": "add_edge",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "source_id": { "type": "integer" },
+                "target_id": { "type": "integer" },
+                "relation": { "type": "string" },
+                "data": { "type": "object" },
+                "unique": { "type": "boolean" }
+            },
+            "required": ["source_id", "target_id"]
+        }
+    },
+    {
+        "name": "list_recent_nodes",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "limit": { "type": "integer" },
+                "cursor": { "type": "string" },
+                "since": { "type": "string" },
+                "until": { "type": "string" },
+                "order": { "type": "string", "enum": ["desc", "asc"] },
+                "fields": { "type": "array", "items": { "type": "string" } },
+                "data_paths": { "type": "array", "items": { "type": "string" } }
+            }
+        }
+    },
+    {
+        "name": "list_recent_edges",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "limit": { "type": "integer" },
+                "cursor": { "type": "string" },
+                "since": { "type": "string" },
+                "until": { "type": "string" },
+                "order": { "type": "string", "enum": ["desc", "asc"] },
+                "fields": { "type": "array", "items": { "type": "string" } },
+                "data_paths": { "type": "array", "items": { "type": "string" } }
+            }
+        }
+    },
+    {
+        "name": "find_or_create_state_node",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "label": { "type": "string" },
+                "type": { "type": "string" },
+                "data": { "type": "object" }
+            },
+            "required": ["label", "type"]
+        }
+    },
+    {
+        "name": "update_node_data",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "node_id": { "type": "integer" },
+                "data": { "type": "object" }
+            },
+            "required": ["node_id", "data"]
+        }
+    },
+    {
+        "name": "patch_node_data",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "node_id": { "type": "integer" },
+                "merge": { "type": "object" },
+                "ops": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "op": { "type": "string", "enum": ["set", "append", "remove"] },
+                            "path": { "type": "string" },
+                            "value": {}
+                        },
+                        "required": ["op", "path"]
+                    }
+                },
+                "return_data": { "type": "boolean" }
+            },
+            "required": ["node_id"]
+        }
+    },
+    {
+        "name": "append_state_history",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "node_id": { "type": "integer" },
+                "cycle": { "type": "integer" },
+                "record": { "type": "object" },
+                "delta": { "type": "object" }
+            },
+            "required": ["node_id", "cycle"]
+        }
+    },
+    {
+        "name": "get_state_history",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "node_id": { "type": "integer" },
+                "limit": { "type": "integer" },
+                "before_cycle": { "type": "integer" },
+                "reconstruct": { "type": "boolean" }
+            },
+            "required": ["node_id"]
+        }
+    },
+    {
+        "name": "reconstruct_state",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "node_id": { "type": "integer" },
+                "cycle": { "type": "integer" }
+            },
+            "required": ["node_id"]
+        }
+    },
+    {
+        "name": "add_nodes_batch",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "nodes": { "type": "array", "items": { "type": "object" } },
+                "edges": { "type": "array", "items": { "type": "object" } }
+            },
+            "required": ["nodes"]
+        }
+    },
+    {
+        "name": "add_edges_batch",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "edges": { "type": "array", "items": { "type": "object" } },
+                "refs": { "type": "object" }
+            },
+            "required": ["edges"]
+        }
+    },
+    {
+        "name": "apply_write_plan",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "plan": { "type": "array", "items": { "type": "object" } }
+            },
+            "required": ["plan"]
+        }
+    },
+    {
+        "name": "neighbors",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "node_id": { "type": "integer" },
+                "direction": { "type": "string", "enum": ["out", "in", "both"] },
+                "relations": { "type": "array", "items": { "type": "string" } },
+                "limit": { "type": "integer" }
+            },
+            "required": ["node_id"]
+        }
+    },
+    {
+        "name": "k_hop_subgraph",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "node_id": { "type": "integer" },
+                "depth": { "type": "integer" },
+                "direction": { "type": "string", "enum": ["out", "in", "both"] },
+                "relations": { "type": "array", "items": { "type": "string" } },
+                "max_fanout": { "type": "integer" },
+                "max_nodes": { "type": "integer" },
+                "max_edges": { "type": "integer" }
+            },
+            "required": ["node_id"]
+        }
+    },
+    {
+        "name": "shortest_path",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "source_id": { "type": "integer" },
+                "target_id": { "type": "integer" },
+                "max_depth": { "type": "integer" },
+                "direction": { "type": "string", "enum": ["out", "in", "both"] },
+                "relations": { "type": "array", "items": { "type": "string" } },
+                "max_fanout": { "type": "integer" },
+                "max_nodes": { "type": "integer" }
+            },
+            "required": ["source_id", "target_id"]
+        }
+    },
+    {
+        "name": "adjacency_cache_status",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "refresh": { "type": "boolean" }
+            }
+        }
+    },
+    {
+        "name": "search_nodes",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "query": { "type": "string" },
+                "types": { "type": "array", "items": { "type": "string" } },
+                "limit": { "type": "integer" },
+                "syntax": { "type": "string", "enum": ["simple", "fts5"] },
+                "prefix": { "type": "boolean" },
+                "snippet_tokens": { "type": "integer" }
+            },
+            "required": ["query"]
+        }
+    },
+    {
+        "name": "changes_since",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "cursor": { "type": "integer" },
+                "limit": { "type": "integer" },
+                "include_rows": { "type": "boolean" },
+                "exclude_types": { "type": "array", "items": { "type": "string" } },
+                "on_expired": { "type": "string", "enum": ["error", "reset"] }
+            }
+        }
+    },
+    {
+        "name": "set_retention_policy",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "type": { "type": "string" },
+                "max_age_days": { "type": "number" },
+                "max_count": { "type": "integer" },
+                "rollup": { "type": "string", "enum": ["day", "week", "month"] },
+                "rollup_path": { "type": "string" },
+                "archive": { "type": "boolean" },
+                "remove": { "type": "boolean" }
+            },
+            "required": ["type"]
+        }
+    },
+    {
+        "name": "apply_retention",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "types": { "type": "array", "items": { "type": "string" } },
+                "dry_run": { "type": "boolean" },
+                "batch_size": { "type": "integer" },
+                "vacuum": { "type": "string", "enum": ["incremental", "full", "none"] }
+            }
+        }
+    },
+    {
+        "name": "compute_graph_metrics",
+        "inputSchema": {
+            "type": "object",
+            "properties": {}
+        }
+    },
+    {
+        "name": "top_central_nodes",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "limit": { "type": "integer" },
+                "metric": { "type": "string", "enum": ["pagerank", "in_degree", "out_degree"] },
+                "types": { "type": "array", "items": { "type": "string" } },
+                "refresh": { "type": "string", "enum": ["auto", "never"] }
+            }
+        }
+    },
+    {
+        "name": "similar_nodes",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "node_id": { "type": "integer" },
+                "node_ids": { "type": "array", "items": { "type": "integer" } },
+                "text": { "type": "string" },
+                "texts": { "type": "array", "items": { "type": "string" } },
+                "limit": { "type": "integer" },
+                "types": { "type": "array", "items": { "type": "string" } },
+                "min_score": { "type": "number" }
+            }
+        }
+    },
+    {
+        "name": "query",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "query": { "type": "string" },
+                "limit": { "type": "integer" },
+                "offset": { "type": "integer" },
+                "explain": { "type": "boolean" },
+                "graphs": { "type": "array", "items": { "type": "string" } }
+            },
+            "required": ["query"]
+        }
+    },
+    {
+        "name": "snapshot",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "name": { "type": "string" },
+                "verify": { "type": "boolean" },
+                "keep": { "type": "integer" }
+            }
+        }
+    },
+    {
+        "name": "list_snapshots",
+        "inputSchema": {
+            "type": "object",
+            "properties": {}
+        }
+    },
+    {
+        "name": "restore_snapshot",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "name": { "type": "string" },
+                "target_graph": { "type": "string" },
+                "target_path": { "type": "string" }
+            },
+            "required": ["name"]
+        }
+    },
+    {
+        "name": "export_subgraph",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "name": { "type": "string" },
+                "format": { "type": "string", "enum": ["npz", "arrow"] },
+                "types": { "type": "array", "items": { "type": "string" } },
+                "relations": { "type": "array", "items": { "type": "string" } },
+                "since": { "type": "string" },
+                "until": { "type": "string" },
+                "overwrite": { "type": "boolean" }
+            }
+        }
+    },
+    {
+        "name": "list_graphs",
+        "inputSchema": {
+            "type": "object",
+            "properties": {}
+        }
+    },
+    {
+        "name": "db_stats",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "reset": { "type": "boolean" }
+            }
+        }
+    }
+]
+
+# Every tool takes the optional graph namespace argument.
+for _schema in TOOL_SCHEMAS:
+    _schema["inputSchema"]["properties"]["graph"] = { "type": "string" }
+
+# ------------------------------------------------------------
+# Dispatch
+# ------------------------------------------------------------
+
+def error_response(req_id, message, code=-32000):
+    return {
+        "jsonrpc": "2.0",
+        "id": req_id,
+        "error": {
+            "code": code,
+            "message": message
+        }
+    }
+
+def call_tool(tool, handler, args):
+    """
+    Run a tool. Reads are re-run on lock errors; writes are not, since
+    writer() already retries BEGIN / COMMIT and the body cannot be replayed.
+    """
+    if tool in WRITE_TOOLS or DB.in_write():
+        return handler(args)
+    for attempt in range(LOCK_RETRIES + 1):
+        try:
+            return handler(args)
+        except sqlite3.OperationalError as e:
+            if not is_lock_error(e) or attempt == LOCK_RETRIES:
+                raise
+            DB.stats.count("read_retries")
+            time.sleep(backoff_delay(attempt))
+
+def process_request(msg):
+    """Handle one JSON-RPC message and return the response."""
+    method = msg.get("method")
+    params = msg.get("params", {})
+    req_id = msg.get("id")
+
+    try:
+        if method == "initialize":
+            return {
+                "jsonrpc": "2.0",
                 "id": req_id,
                 "result": {
                     "protocolVersion": "2024-11-05",
@@ -285,140 +4953,145 @@ def handle_request(msg):
                         "tools": {}
                     }
                 }
-            })
-            return
+            }
 
         if method in ("tools/list", "list_tools"):
-            send_message({
+            return {
                 "jsonrpc": "2.0",
                 "id": req_id,
                 "result": {
-                    "tools": [
-                        {
-                            "name": "add_node",
-                            "inputSchema": {
-                                "type": "object",
-                                "properties": {
-                                    "label": { "type": "string" },
-                                    "type": { "type": "string" },
-                                    "data": { "type": "object" }
-                                },
-                                "required": ["label"]
-                            }
-                        },
-                        {
-                            "name": "add_edge",
-                            "inputSchema": {
-                                "type": "object",
-                                "properties": {
-                                    "source_id": { "type": "integer" },
-                                    "target_id": { "type": "integer" },
-                                    "relation": { "type": "string" },
-                                    "data": { "type": "object" }
-                                },
-                                "required": ["source_id", "target_id"]
-                            }
-                        },
-                        {
-                            "name": "list_recent_nodes",
-                            "inputSchema": {
-                                "type": "object",
-                                "properties": {
-                                    "limit": { "type": "integer" }
-                                }
-                            }
-                        },
-                        {
-                            "name": "list_recent_edges",
-                            "inputSchema": {
-                                "type": "object",
-                                "properties": {
-                                    "limit": { "type": "integer" }
-                                }
-                            }
-                        },
-                        {
-                            "name": "find_or_create_state_node",
-                            "inputSchema": {
-                                "type": "object",
-                                "properties": {
-                                    "label": { "type": "string" },
-                                    "type": { "type": "string" }
-                                },
-                                "required": ["label", "type"]
-                            }
-                        },
-                        {
-                            "name": "update_node_data",
-                            "inputSchema": {
-                                "type": "object",
-                                "properties": {
-                                    "node_id": { "type": "integer" },
-                                    "data": { "type": "object" }
-                                },
-                                "required": ["node_id", "data"]
-                            }
-                        }
-                    ]
+                    "tools": TOOL_SCHEMAS
                 }
-            })
-            return
+            }
 
         if method in ("tools/call", "call_tool"):
             tool = params.get("name")
             args = params.get("arguments", {})
 
-            if tool == "add_node":
-                result = tool_add_node(args)
-            elif tool == "add_edge":
-                result = tool_add_edge(args)
-            elif tool == "list_recent_nodes":
-                result = tool_list_recent_nodes(args)
-            elif tool == "list_recent_edges":
-                result = tool_list_recent_edges(args)
-            elif tool == "find_or_create_state_node":
-                result = tool_find_or_create_state_node(args)
-            elif tool == "update_node_data":
-                result = tool_update_node_data(args)
-            else:
+            handler = TOOLS.get(tool)
+            if handler is None:
                 raise ValueError(f"Unknown tool: {tool}")
+            with use_graph(args.get("graph")):
+                result = call_tool(tool, handler, args)
 
-            send_message({
+            return {
                 "jsonrpc": "2.0",
                 "id": req_id,
                 "result": result
-            })
-            return
-
-        send_message({
-            "jsonrpc": "2.0",
-            "id": req_id,
-            "error": {
-                "code": -32601,
-                "message": f"Unknown method: {method}"
             }
-        })
+
+        return error_response(req_id, f"Unknown method: {method}", code=-32601)
 
     except Exception as e:
-        send_message({
-            "jsonrpc": "2.0",
-            "id": req_id,
-            "error": {
-                "code": -32000,
-                "message": str(e)
-            }
-        })
+        return error_response(req_id, str(e))
+
+def handle_request(msg):
+    send_message(process_request(msg))
 
 # ------------------------------------------------------------
 # Main loop
 # ------------------------------------------------------------
+#
+# Reads run on a thread pool. WRITE_TOOLS queue for one writer thread
+# that commits up to WRITE_BATCH_MAX requests per transaction, a
+# savepoint each, and runs queued background jobs between groups.
+# Responses may arrive out of order.
 
-def main():
+class _RollbackRequest(Exception):
+    """Undo a failed write request's savepoint without failing the group."""
+
+def tool_name(msg):
+    if msg.get("method") in ("tools/call", "call_tool"):
+        return (msg.get("params") or {}).get("name")
+    return None
+
+def graph_name(msg):
+    arguments = (msg.get("params") or {}).get("arguments") or {}
+    return arguments.get("graph") or DEFAULT_GRAPH
+
+def _run_write(msg):
+    try:
+        with DB.writer():
+            response = process_request(msg)
+            if "error" in response:
+                raise _RollbackRequest()
+    except _RollbackRequest:
+        pass
+    return response
+
+def _write_group(messages):
+    # One transaction per graph; order within each graph is preserved.
+    by_graph = OrderedDict()
+    for msg in messages:
+        by_graph.setdefault(graph_name(msg), []).append(msg)
+
+    for name, group in by_graph.items():
+        try:
+            with use_graph(name), DB.writer() as conn:
+                responses = [_run_write(msg) for msg in group]
+                prune_change_log(conn)
+        except Exception as e:
+            # Unknown graph, or the commit itself failed: nothing in the group was written.
+            responses = [error_response(msg.get("id"), str(e)) for msg in group]
+        for response in responses:
+            send_message(response)
+
+def _writer_loop(queue):
+    _ON_WRITER.active = True
+    try:
+        _drain_writes(queue)
+    finally:
+        _ON_WRITER.active = False
+
+def _drain_writes(queue):
     while True:
-        msg = read_message()
-        if msg is None:
-            break
-        handle_request(msg)
+        batch = [queue.get()]
+        while batch[-1] is not None and len(batch) < WRITE_BATCH_MAX:
+            try:
+                batch.append(queue.get_nowait())
+            except Empty:
+                break
+
+        group = []
+        for msg in batch:
+            if msg is None or callable(msg) or tool_name(msg) in STANDALONE_WRITE_TOOLS:
+                if group:
+                    _write_group(group)
+                    group = []
+                if msg is None:
+                    return
+                if callable(msg):
+                    msg()       # background job queued by the server itself
+                else:
+                    handle_request(msg)
+            else:
+                group.append(msg)
+        if group:
+            _write_group(group)
+
+def main():
+    global WRITE_QUEUE
+    init_graphs()
+    writes = WRITE_QUEUE = Queue()
+    writer = threading.Thread(target=_writer_loop, args=(writes,), name="kg-writer")
+    writer.start()
+
+    with ThreadPoolExecutor(max_workers=READ_WORKERS, thread_name_prefix="kg-reader") as readers:
+        while True:
+            try:
+                msg = read_message()
+            except ValueError as e:
+                send_message(error_response(None, f"Parse error: {e}", code=-32700))
+                continue
+            if msg is None:
+                break
+            if tool_name(msg) in WRITE_TOOLS:
+                writes.put(msg)
+            else:
+                readers.submit(handle_request, msg)
+
+    writes.put(None)
+    writer.join()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
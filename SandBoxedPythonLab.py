@@ -6,6 +6,8 @@ import math
 import random
 import io
 import base64
+import struct
+import zipfile
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
@@ -37,6 +39,13 @@ except ImportError:
     scipy = None
     integrate = None
 
+# Columnar knowledge-graph exports (Arrow IPC)
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:
+    pa = None
+
 # Plotting (headless)
 try:
     import matplotlib
@@ -197,6 +206,89 @@ def plot_data_series(x: List[float], y: List[float], title: str = "Plot") -> byt
     return buf.read()
 
 
+# =========================
+# Knowledge graph exports
+# =========================
+
+# The knowledge graph's export_subgraph tool writes here by default.
+EXPORTS_DIR = "exports"
+
+
+def _mmap_npz(path: Path) -> Dict[str, Any]:
+    """
+    Memory-map every member of an uncompressed .npz.
+
+    np.load() reads .npz members fully into memory; stored (uncompressed)
+    members are plain .npy files at a fixed offset, so they can be mapped
+    read-only instead. Anything else falls back to np.load().
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as zf, open(path, "rb") as f:
+        for info in zf.infolist():
+            key = info.filename[:-len(".npy")]
+            if info.compress_type != zipfile.ZIP_STORED:
+                with zf.open(info) as member:
+                    arrays[key] = np.load(member, allow_pickle=False)
+                continue
+            # Local file header: 30 fixed bytes, then file name and extra field
+            f.seek(info.header_offset + 26)
+            name_len, extra_len = struct.unpack("<HH", f.read(4))
+            f.seek(info.header_offset + 30 + name_len + extra_len)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+            elif version == (2, 0):
+                shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+            else:
+                with zf.open(info) as member:
+                    arrays[key] = np.load(member, allow_pickle=False)
+                continue
+            if dtype.hasobject:
+                raise ValueError(f"Refusing to load object array {key!r}")
+            if math.prod(shape) == 0:
+                arrays[key] = np.empty(shape, dtype=dtype)
+                continue
+            arrays[key] = np.memmap(path, dtype=dtype, mode="r", offset=f.tell(),
+                                    shape=shape, order="F" if fortran else "C")
+    return arrays
+
+
+def load_graph_export(name: str) -> Dict[str, Any]:
+    """
+    Open a knowledge-graph subgraph export by name.
+
+    npz exports return the arrays described in the manifest, memory-mapped;
+    arrow exports return {"nodes": Table, "edges": Table} read from memory
+    maps. Either way the dict also carries the export's "manifest".
+    """
+    manifest_path = sandbox_path(f"{EXPORTS_DIR}/{name}.json")
+    if not manifest_path.exists():
+        raise FileNotFoundError(f"No such export: {name}")
+    manifest = json.loads(manifest_path.read_text())
+    files = []
+    for file_name in manifest["files"]:
+        # Data files sit next to the manifest; anything else is refused.
+        path = (manifest_path.parent / file_name).resolve()
+        if Path(file_name).name != file_name or not path.is_relative_to(SANDBOX_ROOT.resolve()):
+            raise ValueError(f"Export {name} lists a file outside the sandbox: {file_name!r}")
+        files.append(path)
+
+    if manifest["format"] == "npz":
+        if np is None:
+            raise RuntimeError("NumPy is required to load npz exports.")
+        result = _mmap_npz(files[0])
+    else:
+        if pa is None:
+            raise RuntimeError("pyarrow is required to load arrow exports.")
+        nodes_path, edges_path = files
+        result = {
+            "nodes": pa.ipc.open_file(pa.memory_map(str(nodes_path))).read_all(),
+            "edges": pa.ipc.open_file(pa.memory_map(str(edges_path))).read_all(),
+        }
+    result["manifest"] = manifest
+    return result
+
+
 # =========================
 # Sandboxed Python execution
 # =========================
@@ -231,6 +323,7 @@ ALLOWED_MODULES["gravitational_redshift"] = gravitational_redshift
 ALLOWED_MODULES["sample_orbit_radii"] = sample_orbit_radii
 ALLOWED_MODULES["generate_chaos_parameters"] = generate_chaos_parameters
 ALLOWED_MODULES["generate_noise_field"] = generate_noise_field
+ALLOWED_MODULES["load_graph_export"] = load_graph_export
 
 
 def run_sandboxed_python(code: str) -> Dict[str, Any]:
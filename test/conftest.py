@@ -0,0 +1,32 @@
+import importlib.util
+import os
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_module(name, filename):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def kg(tmp_path, monkeypatch):
+    """A fresh KnowledgeGraphServer module whose databases live in tmp_path."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("KG_EXPORT_DIR", str(tmp_path / "exports"))
+    module = load_module("kg_server_under_test", "KnowledgeGraphServer.py")
+    module.init_graphs()
+    yield module
+    for graph in module.GRAPHS.each_open():
+        graph.close()
+
+
+@pytest.fixture
+def loop(tmp_path, monkeypatch):
+    """A fresh CognitiveLoopServerV0.5 module, run from tmp_path."""
+    monkeypatch.chdir(tmp_path)
+    return load_module("cognitive_loop_under_test", "CognitiveLoopServerV0.5.py")
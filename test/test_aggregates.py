@@ -0,0 +1,106 @@
+import copy
+
+import pytest
+
+
+def node(node_id, label, type_):
+    return {"id": node_id, "label": label, "type": type_}
+
+
+def test_update_counts_and_patch(loop, kg):
+    aggregates = loop.default_aggregates()
+    nodes = [node(1, "graphs", "concept"), node(2, "paper", "document"), node(3, "misc", None)]
+    edges = [{"id": 1, "relation": "mentions"}, {"id": 2, "relation": None}]
+    patch = loop.update_aggregates(aggregates, nodes, edges)
+
+    assert aggregates["type_counts"] == {"concept": 1, "document": 1}
+    assert aggregates["relation_counts"] == {"mentions": 1}
+    assert aggregates["documents"]["total"] == 1
+    assert patch["type_counts"] == {"concept": 1, "document": 1}
+    assert kg._merge_patch(loop.default_aggregates(), patch) == aggregates
+
+
+def test_updates_only_count_inserts(loop):
+    aggregates = loop.default_aggregates()
+    events = [[1, "node", 1, "insert"], [2, "node", 2, "update"]]
+    loop.update_aggregates(aggregates, [node(1, "a", "concept"), node(2, "b", "concept")], [], events)
+    assert aggregates["type_counts"] == {"concept": 1}
+    assert set(aggregates["concepts"]) == {"a", "b"}
+
+
+def test_decay_is_lazy_and_ranks_recent_concepts_higher(loop):
+    aggregates = loop.default_aggregates()
+    loop.update_aggregates(aggregates, [node(1, "old", "concept")], [])
+    for _ in range(5):
+        loop.update_aggregates(aggregates, [], [])
+    loop.update_aggregates(aggregates, [node(2, "new", "concept")], [])
+    (first, first_weight), (second, second_weight) = loop.top_concepts(aggregates)
+    assert (first, second) == ("new", "old")
+    assert first_weight == 1.0 and second_weight == round(loop.CONCEPT_DECAY ** 6, 3)
+
+
+def test_concept_map_is_pruned(loop, monkeypatch):
+    monkeypatch.setattr(loop, "CONCEPT_AGGREGATE_MAX", 2)
+    aggregates = loop.default_aggregates()
+    patch = loop.update_aggregates(aggregates, [node(i, f"c{i}", "concept") for i in range(5)], [])
+    assert len(aggregates["concepts"]) == 2
+    assert sum(1 for value in patch["concepts"].values() if value is None) == 3
+
+
+def test_reflect_does_not_mutate_the_given_aggregates(loop):
+    aggregates = loop.default_aggregates()
+    before = copy.deepcopy(aggregates)
+    result = loop.tool_reflect({"nodes": [node(1, "graphs", "concept")], "edges": [], "aggregates": aggregates})
+    assert aggregates == before
+    assert result["aggregates_patch"]["concepts"]["graphs"] > 0
+
+
+def test_reflect_carries_over_header_aggregates(loop):
+    legacy = loop.default_aggregates()
+    loop.update_aggregates(legacy, [node(1, "old", "concept")], [])
+    state = dict(loop.default_cognitive_state(), cycle_count=1, aggregates=legacy)
+
+    result = loop.tool_reflect({"nodes": [], "edges": [], "state": state, "aggregates": loop.default_aggregates()})
+    patch = result["aggregates_patch"]
+    assert "old" in patch["concepts"] and patch["cycles"] == 2
+
+    applied = loop.tool_apply_insights({
+        "reflection": result["reflection"], "summary": result["summary"], "state_node_id": 1,
+        "state": state, "aggregates_node_id": 2, "aggregates_patch": patch,
+    })
+    header = next(c for c in applied["write_plan"] if c["arguments"].get("node_id") == 1 and "merge" in c["arguments"])
+    assert header["arguments"]["merge"]["aggregates"] is None
+    assert "aggregates" not in applied["updated_state"]
+
+
+def test_expired_changes_need_a_full_export(loop):
+    changes = {"cursor": 9, "events": [], "nodes": [], "edges": [], "expired": True}
+    with pytest.raises(ValueError, match="without filters"):
+        loop.tool_reflect({"changes": changes, "aggregates": loop.default_aggregates()})
+
+
+def test_expired_cursor_rebuilds_aggregates_from_the_whole_graph(loop):
+    pytest.importorskip("numpy")
+    loop.tool_run_full_cycle({"transport": "inprocess"})
+    server = loop.graph_transport("inprocess").server
+    try:
+        for label in ("graphs", "paths", "trees"):
+            server.tool_add_node({"label": label, "type": "concept"})
+        with server.DB.writer() as conn:
+            server.prune_change_log(conn, keep=1)
+
+        result = loop.tool_run_full_cycle({"transport": "inprocess"})
+        assert result["summary"]["change_log_reset"]
+        aggregates = server.tool_find_or_create_state_node(
+            {"label": "Cognitive Loop Aggregates", "type": "cognitive_aggregates"}
+        )["data"]
+        assert aggregates["type_counts"]["concept"] == 3
+        assert set(aggregates["concepts"]) == {"graphs", "paths", "trees"}
+        assert aggregates["cycles"] == 2
+        header = server.tool_find_or_create_state_node({"label": "Cognitive Loop State", "type": "cognitive_state"})
+        assert header["data"]["last_reset_cycle"] == 2
+
+        assert not loop.tool_run_full_cycle({"transport": "inprocess"})["summary"]["change_log_reset"]
+    finally:
+        for graph in server.GRAPHS.each_open():
+            graph.close()
@@ -0,0 +1,68 @@
+import pytest
+
+
+def add_nodes(kg, count, type_="concept"):
+    return [kg.tool_add_node({"label": f"n{i}", "type": type_})["node_id"] for i in range(count)]
+
+
+def test_cursor_pages_through_events(kg):
+    ids = add_nodes(kg, 5)
+    first = kg.tool_changes_since({"cursor": 0, "limit": 3})
+    assert first["has_more"] and [e[2] for e in first["events"]] == ids[:3]
+    second = kg.tool_changes_since({"cursor": first["cursor"], "limit": 3})
+    assert not second["has_more"] and [e[2] for e in second["events"]] == ids[3:]
+    assert kg.tool_changes_since({"cursor": second["cursor"]})["events"] == []
+
+
+def test_changes_carry_rows_and_deletes(kg):
+    a, b = add_nodes(kg, 2)
+    cursor = kg.tool_changes_since({})["cursor"]
+    kg.tool_update_node_data({"node_id": a, "data": {"x": 1}})
+    with kg.DB.writer() as conn:
+        conn.execute("DELETE FROM nodes WHERE id = ?", (b,))
+    result = kg.tool_changes_since({"cursor": cursor})
+    assert [(e[2], e[3]) for e in result["events"]] == [(a, "update"), (b, "delete")]
+    assert [n["data"] for n in result["nodes"]] == [{"x": 1}]
+    assert result["deleted"] == {"nodes": [b], "edges": []}
+
+
+def test_exclude_types(kg):
+    add_nodes(kg, 2, "cognitive_state")
+    ids = add_nodes(kg, 1)
+    result = kg.tool_changes_since({"exclude_types": ["cognitive_state"]})
+    assert [e[2] for e in result["events"]] == ids
+
+
+def test_pruned_cursor_expires(kg):
+    add_nodes(kg, 10)
+    with kg.DB.writer() as conn:
+        assert kg.prune_change_log(conn, keep=4) == 6
+        assert kg.change_log_floor(conn) == 6
+
+    with pytest.raises(ValueError, match="cursor expired"):
+        kg.tool_changes_since({"cursor": 3})
+    assert len(kg.tool_changes_since({"cursor": 6})["events"]) == 4
+
+    reset = kg.tool_changes_since({"cursor": 3, "on_expired": "reset"})
+    assert reset["expired"] and [e[0] for e in reset["events"]] == [7, 8, 9, 10]
+
+
+def test_apply_retention_caps_the_change_log(kg, monkeypatch):
+    add_nodes(kg, 10)
+    monkeypatch.setattr(kg, "CHANGE_LOG_KEEP", 3)
+    assert kg.tool_apply_retention({"vacuum": "none"})["change_log_pruned"] == 7
+    assert kg.tool_changes_since({"cursor": 7})["cursor"] == 10
+
+
+def test_adjacency_rebuilds_after_missing_pruned_events(kg):
+    pytest.importorskip("numpy")
+    a, b = add_nodes(kg, 2)
+    edge = kg.tool_add_edge({"source_id": a, "target_id": b})["edge_id"]
+    kg.tool_add_edge({"source_id": b, "target_id": b})
+    assert kg.ADJACENCY.ready()
+    with kg.DB.writer() as conn:
+        conn.execute("DELETE FROM edges WHERE id = ?", (edge,))
+    add_nodes(kg, 3)
+    with kg.DB.writer() as conn:
+        kg.prune_change_log(conn, keep=1)
+    assert kg.tool_neighbors({"node_id": a}) == {"node_id": a, "engine": "memory", "neighbors": []}
@@ -0,0 +1,157 @@
+import sqlite3
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def db(kg, tmp_path):
+    db = kg.ConnectionManager(str(tmp_path / "pool.db"), readers=2)
+    with db.writer() as conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+    yield db
+    db.close()
+
+
+def count(conn):
+    return conn.execute("SELECT COUNT(*) FROM t").fetchone()[0]
+
+
+def test_readers_only_see_committed_writes(db):
+    writing, release = threading.Event(), threading.Event()
+
+    def write():
+        with db.writer() as conn:
+            conn.execute("INSERT INTO t VALUES (1)")
+            # The writing thread reads its own uncommitted row
+            with db.reader() as own:
+                assert own is conn and count(own) == 1
+            writing.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    writing.wait(5)
+    with db.reader() as conn:
+        assert count(conn) == 0
+    release.set()
+    thread.join()
+    with db.reader() as conn:
+        assert count(conn) == 1
+
+
+def test_nested_readers_share_one_pool_slot(db):
+    with db.reader() as outer, db.reader() as inner:
+        assert inner is outer
+        assert len(db._readers) == 1
+
+
+def test_an_exhausted_pool_waits_for_a_free_reader(kg, tmp_path):
+    db = kg.ConnectionManager(str(tmp_path / "one.db"), readers=1)
+    held, release = threading.Event(), threading.Event()
+    acquired = []
+
+    def hold():
+        with db.reader() as conn:
+            acquired.append(conn)
+            held.set()
+            release.wait(5)
+
+    def wait():
+        with db.reader() as conn:
+            acquired.append(conn)
+
+    holder, waiter = threading.Thread(target=hold), threading.Thread(target=wait)
+    holder.start()
+    held.wait(5)
+    waiter.start()
+    waiter.join(0.2)
+    assert waiter.is_alive() and len(acquired) == 1
+    release.set()
+    holder.join()
+    waiter.join(5)
+    assert len(acquired) == 2 and acquired[0] is acquired[1]
+    assert db.stats.snapshot()["wait_ms"]["reader_pool"]["max"] >= 150
+    db.close()
+
+
+def test_after_commit_callbacks(db):
+    ran = []
+    with db.writer() as conn:
+        conn.execute("INSERT INTO t VALUES (1)")
+        db.after_commit(lambda: ran.append("outer"))
+        with pytest.raises(RuntimeError):
+            with db.writer():
+                db.after_commit(lambda: ran.append("rolled back savepoint"))
+                raise RuntimeError
+        with db.writer():
+            db.after_commit(lambda: ran.append("released savepoint"))
+        assert ran == []
+    assert ran == ["outer", "released savepoint"]
+
+    with pytest.raises(RuntimeError):
+        with db.writer() as conn:
+            conn.execute("INSERT INTO t VALUES (2)")
+            db.after_commit(lambda: ran.append("rolled back"))
+            raise RuntimeError
+    assert ran == ["outer", "released savepoint"]
+    with db.reader() as conn:
+        assert count(conn) == 1
+
+
+@pytest.fixture
+def impatient(kg, tmp_path, monkeypatch):
+    """A manager that gives up on a busy database at once and retries without waiting."""
+    monkeypatch.setattr(kg, "BUSY_TIMEOUT_MS", 0)
+    monkeypatch.setattr(kg, "backoff_delay", lambda attempt: 0)
+    db = kg.ConnectionManager(str(tmp_path / "busy.db"))
+    with db.writer() as conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+    other = sqlite3.connect(str(tmp_path / "busy.db"), isolation_level=None, check_same_thread=False)
+    other.execute("BEGIN IMMEDIATE")
+    yield db, other
+    if other.in_transaction:
+        other.rollback()
+    other.close()
+    db.close()
+
+
+def test_busy_begin_is_retried(kg, impatient, monkeypatch):
+    db, other = impatient
+    # The other connection lets go during the first backoff
+    monkeypatch.setattr(kg, "backoff_delay", lambda attempt: other.rollback() or 0)
+    with db.writer() as conn:
+        conn.execute("INSERT INTO t VALUES (1)")
+    counters = db.stats.snapshot()["counters"]
+    assert counters["lock_errors"] == counters["lock_retries"] == 1
+    assert "lock_failures" not in counters and counters["write_transactions"] == 2
+
+
+def test_busy_begin_gives_up_after_the_retries(kg, impatient):
+    db, _ = impatient
+    with pytest.raises(sqlite3.OperationalError, match="locked"):
+        with db.writer():
+            pass
+    counters = db.stats.snapshot()["counters"]
+    assert counters["lock_errors"] == kg.LOCK_RETRIES + 1
+    assert counters["lock_failures"] == 1 and counters["lock_retries"] == kg.LOCK_RETRIES
+    assert db.stats.snapshot()["wait_ms"]["begin_immediate"]["count"] == 2
+    assert not db.in_write()
+
+
+def test_lock_errors_and_backoff(kg):
+    assert kg.is_lock_error(sqlite3.OperationalError("database is locked"))
+    assert not kg.is_lock_error(sqlite3.OperationalError("no such table: t"))
+    assert not kg.is_lock_error(ValueError("locked"))
+    for attempt in range(12):
+        assert 0 <= kg.backoff_delay(attempt) <= kg.LOCK_BACKOFF_MAX_MS / 1000
+
+
+def test_db_stats_reports_and_resets_counters(kg):
+    kg.tool_add_node({"label": "a"})
+    stats = kg.tool_db_stats({"reset": True})
+    assert stats["graph"] == kg.DEFAULT_GRAPH and stats["storage"]["journal_mode"] == "wal"
+    assert stats["counters"]["write_transactions"] >= 1
+    assert stats["wait_ms"]["writer_lock"]["count"] >= 1
+    after = kg.tool_db_stats({})
+    assert after["counters"] == {} and "writer_lock" not in after["wait_ms"]
@@ -0,0 +1,45 @@
+import pytest
+
+
+@pytest.fixture
+def concepts(kg):
+    ids = {}
+    for label, type_ in (("graphs", "concept"), ("paths", "concept"), ("paper", "document"), ("misc", "note")):
+        ids[label] = kg.tool_add_node({"label": label, "type": type_})["node_id"]
+    kg.tool_add_edge({"source_id": ids["paper"], "target_id": ids["graphs"], "relation": "mentions"})
+    kg.tool_add_edge({"source_id": ids["paper"], "target_id": ids["paths"], "relation": "mentions"})
+    kg.tool_add_edge({"source_id": ids["misc"], "target_id": ids["graphs"], "relation": "about"})
+    return ids
+
+
+def test_host_mode_rebuilds_from_an_export_after_a_restart(kg, loop, concepts, tmp_path):
+    pytest.importorskip("numpy")
+    changes = kg.tool_changes_since({"cursor": 0})
+    state = dict(loop.default_cognitive_state(), last_change_cursor=changes["cursor"])
+
+    plan = loop.tool_run_cycle({"change_cursor": changes["cursor"]})["plan"]
+    descriptor = loop.KG_CLIENT.export_subgraph(loop.COOCCURRENCE_EXPORT, loop.COOCCURRENCE_TYPES)
+    assert descriptor in plan
+
+    # The host passes on only the export result; the arrays stay on disk
+    export = kg.tool_export_subgraph(descriptor["arguments"])
+    assert export["nodes"] == 3 and export["edges"] == 2
+    # Replaying events the export already covers must not double-count
+    result = loop.tool_reflect({"changes": changes, "state": state, "subgraph_export": export})
+    assert result["summary"]["cooccurrence"] == {"concepts": 2, "pairs": 1, "complete": True}
+    assert list(loop.COOCCURRENCE.weights) == [1.0]
+    assert loop.COOCCURRENCE.labels == ["graphs", "paths"]
+
+    plan = loop.tool_run_cycle({"change_cursor": changes["cursor"]})["plan"]
+    assert all(call["call"] != "knowledge-graph:export_subgraph" for call in plan)
+
+    # Later restarts overwrite the same files instead of adding more
+    kg.tool_export_subgraph(descriptor["arguments"])
+    assert sorted(path.name for path in (tmp_path / "exports").iterdir()) == [
+        "cognitive-loop-cooccurrence.json", "cognitive-loop-cooccurrence.npz"
+    ]
+
+
+def test_reflect_rejects_other_exports(loop):
+    with pytest.raises(ValueError, match="npz export_subgraph"):
+        loop.tool_reflect({"subgraph_export": {"format": "arrow", "paths": ["x.nodes.arrow"]}})
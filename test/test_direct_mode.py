@@ -0,0 +1,53 @@
+import json
+import sys
+
+import pytest
+
+from conftest import load_module
+
+FAKE_MEMORY_SERVER = """
+import json, sys
+for line in sys.stdin:
+    msg = json.loads(line)
+    memories = [{"text": "first"}, {"text": "second"}]
+    result = {"content": [{"type": "text", "text": json.dumps(memories)}]}
+    print(json.dumps({"jsonrpc": "2.0", "id": msg.get("id"), "result": result}), flush=True)
+"""
+
+
+@pytest.fixture
+def direct(loop):
+    yield loop
+    for name, transport in loop._transports.items():
+        if name == "inprocess":
+            for graph in transport.server.GRAPHS.each_open():
+                graph.close()
+        else:
+            transport.close()
+
+
+def test_importing_the_graph_server_opens_nothing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    module = load_module("kg_server_imported", "KnowledgeGraphServer.py")
+    assert list(tmp_path.iterdir()) == []
+    with pytest.raises(RuntimeError, match="init_graphs"):
+        module.current_graph()
+
+
+def test_full_cycle_reads_long_term_memory(direct, tmp_path, monkeypatch):
+    server = tmp_path / "memory_server.py"
+    server.write_text(FAKE_MEMORY_SERVER)
+    monkeypatch.setattr(direct, "LTM_SERVER_COMMAND", f"{json.dumps(sys.executable)} {server}")
+
+    result = direct.tool_run_full_cycle({"transport": "inprocess"})
+    assert result["summary"]["memory_count"] == 2
+    assert result["skipped_calls"] == []
+
+    # Memories passed by the host take precedence
+    result = direct.tool_run_full_cycle({"transport": "inprocess", "memories": [{"text": "host"}]})
+    assert result["summary"]["memory_count"] == 1
+
+
+def test_full_cycle_without_a_memory_server_reports_the_skip(direct):
+    result = direct.tool_run_full_cycle({"transport": "inprocess"})
+    assert "long_term_memory:list_memories" in result["skipped_calls"]
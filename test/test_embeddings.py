@@ -0,0 +1,61 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+
+@pytest.fixture
+def topics(kg):
+    return {
+        label: kg.tool_add_node({"label": label, "type": type_})["node_id"]
+        for label, type_ in (("sparse graphs", "concept"), ("dense graphs", "concept"), ("bread recipes", "note"))
+    }
+
+
+def matches(result, query=0):
+    return [match["id"] for match in result["results"][query]["matches"]]
+
+
+def test_search_ranks_by_similarity_and_filters(kg, topics):
+    result = kg.tool_similar_nodes({"node_id": topics["sparse graphs"], "text": "bread recipes", "limit": 1})
+    assert matches(result, 0) == [topics["dense graphs"]]
+    assert matches(result, 1) == [topics["bread recipes"]]
+
+    result = kg.tool_similar_nodes({"text": "graphs", "types": ["note"]})
+    assert matches(result) == [topics["bread recipes"]]
+    result = kg.tool_similar_nodes({"text": "graphs", "limit": 100, "min_score": 0.99})
+    assert matches(result) == []
+
+
+def test_limit_is_validated_and_clamped(kg, topics):
+    for limit in (0, -5):
+        with pytest.raises(ValueError, match="limit must be positive"):
+            kg.tool_similar_nodes({"text": "graphs", "limit": limit})
+    assert len(matches(kg.tool_similar_nodes({"text": "graphs", "limit": 100}))) == 3
+
+
+def test_sync_follows_node_changes(kg, topics):
+    kg.EMBEDDINGS.sync()
+    row = kg.EMBEDDINGS.node_rows[topics["bread recipes"]]
+    kg.tool_update_node_data({"node_id": topics["bread recipes"], "data": {"notes": "sparse graphs"}})
+    added = kg.tool_add_node({"label": "graph sparsity"})["node_id"]
+    assert not kg.EMBEDDINGS.is_current()
+
+    kg.EMBEDDINGS.sync()
+    assert kg.EMBEDDINGS.is_current()
+    assert kg.EMBEDDINGS.node_rows[topics["bread recipes"]] == row
+    assert kg.EMBEDDINGS.rows == 4
+    assert added in matches(kg.tool_similar_nodes({"text": "sparsity", "limit": 1}))
+
+
+def test_index_is_reloaded_from_the_sidecar(kg, topics):
+    kg.EMBEDDINGS.sync()
+    expected = kg.tool_similar_nodes({"text": "graphs"})
+
+    graph = kg.current_graph()
+    reopened = kg.EmbeddingIndex(graph.db, graph.embedding_path, kg.EMBEDDER)
+    rebuilds = []
+    reopened._rebuild = lambda *args: rebuilds.append(args)
+    reopened.sync()
+    assert rebuilds == [] and reopened.node_rows == kg.EMBEDDINGS.node_rows
+    np.testing.assert_array_equal(reopened.matrix[:reopened.rows], kg.EMBEDDINGS.matrix[:reopened.rows])
+    assert kg.tool_similar_nodes({"text": "graphs"}) == expected
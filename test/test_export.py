@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from conftest import load_module
+
+np = pytest.importorskip("numpy")
+
+
+@pytest.fixture
+def lab(tmp_path, monkeypatch):
+    """SandBoxedPythonLab with its sandbox in tmp_path, where kg exports land."""
+    module = load_module("sandbox_lab_under_test", "SandBoxedPythonLab.py")
+    monkeypatch.setattr(module, "SANDBOX_ROOT", tmp_path)
+    return module
+
+
+@pytest.fixture
+def graph(kg):
+    ids = [kg.tool_add_node({"label": label, "type": type_})["node_id"]
+           for label, type_ in (("α graphs", "concept"), ("paths", "concept"), ("paper", "document"))]
+    kg.tool_add_edge({"source_id": ids[2], "target_id": ids[0], "relation": "mentions"})
+    kg.tool_add_edge({"source_id": ids[2], "target_id": ids[1], "relation": "cites"})
+    return ids
+
+
+def test_npz_export_loads_memory_mapped(kg, lab, graph):
+    export = kg.tool_export_subgraph({"name": "g", "types": ["concept", "document"], "relations": ["mentions"]})
+    assert (export["nodes"], export["edges"]) == (3, 1)
+
+    loaded = lab.load_graph_export("g")
+    assert loaded["manifest"]["change_seq"] == export["change_seq"]
+    assert isinstance(loaded["node_ids"], np.memmap)
+    assert loaded["node_ids"].tolist() == graph
+    labels = loaded["node_label_bytes"].tobytes()
+    offsets = loaded["node_label_offsets"]
+    assert labels[offsets[0]:offsets[1]].decode("utf-8") == "α graphs"
+    # Edge endpoints are rows in node_ids
+    assert (loaded["edge_source"].tolist(), loaded["edge_target"].tolist()) == ([2], [0])
+    assert loaded["relation_names"].tolist() == ["mentions"]
+
+
+def test_exports_are_not_overwritten_by_default(kg, graph):
+    kg.tool_export_subgraph({"name": "g"})
+    with pytest.raises(ValueError, match="already exists"):
+        kg.tool_export_subgraph({"name": "g"})
+    assert kg.tool_export_subgraph({"name": "g", "types": ["concept"], "overwrite": True})["nodes"] == 2
+    with pytest.raises(ValueError, match="Invalid export name"):
+        kg.tool_export_subgraph({"name": "../g"})
+
+
+def test_arrow_export_loads(kg, lab, graph):
+    pytest.importorskip("pyarrow")
+    kg.tool_export_subgraph({"name": "g", "format": "arrow"})
+    loaded = lab.load_graph_export("g")
+    assert loaded["nodes"].column("label").to_pylist() == ["α graphs", "paths", "paper"]
+    assert loaded["edges"].num_rows == 2
+
+
+def test_loader_refuses_files_outside_the_sandbox(kg, lab, graph, tmp_path):
+    kg.tool_export_subgraph({"name": "g"})
+    manifest_path = tmp_path / "exports" / "g.json"
+    manifest = json.loads(manifest_path.read_text())
+    for file_name in ("/etc/passwd", "../../outside.npz", "sub/g.npz"):
+        manifest["files"] = [file_name]
+        manifest_path.write_text(json.dumps(manifest))
+        with pytest.raises(ValueError, match="outside the sandbox"):
+            lab.load_graph_export("g")
@@ -0,0 +1,76 @@
+import threading
+
+import pytest
+
+
+def call(kg, name, **arguments):
+    response = kg.process_request({
+        "jsonrpc": "2.0", "id": 1, "method": "tools/call", "params": {"name": name, "arguments": arguments}
+    })
+    assert "error" not in response, response
+    return response["result"]
+
+
+def labels(kg, graph=None):
+    nodes = call(kg, "list_recent_nodes", limit=10, **({"graph": graph} if graph else {}))["nodes"]
+    return [node["label"] for node in nodes]
+
+
+def test_named_graphs_are_separate_databases(kg):
+    call(kg, "add_node", label="in default")
+    call(kg, "add_node", label="in alpha", graph="alpha")
+
+    assert labels(kg) == ["in default"]
+    assert labels(kg, "alpha") == ["in alpha"]
+    graphs = {g["name"]: g for g in kg.tool_list_graphs({})["graphs"]}
+    assert set(graphs) == {kg.DEFAULT_GRAPH, "alpha"}
+    assert graphs["alpha"]["path"].endswith("alpha.db")
+
+    for name in ("../alpha", "a/b", "", "x" * 65):
+        with pytest.raises(ValueError, match="Invalid graph name"):
+            kg.GRAPHS.path_for(name)
+
+
+def test_use_graph_is_per_thread_and_nests(kg):
+    seen = []
+    with kg.use_graph("alpha"):
+        with kg.use_graph("beta"):
+            assert kg.current_graph().name == "beta"
+        assert kg.current_graph().name == "alpha"
+
+        thread = threading.Thread(target=lambda: seen.append(kg.current_graph().name))
+        thread.start()
+        thread.join()
+    assert seen == [kg.DEFAULT_GRAPH]
+    assert kg.current_graph() is kg.GRAPHS.default
+
+
+def test_idle_graphs_are_evicted_least_recently_used_first(kg, monkeypatch):
+    monkeypatch.setattr(kg.GRAPHS, "capacity", 2)
+    for name in ("a", "b"):
+        with kg.use_graph(name):
+            kg.tool_add_node({"label": name})
+    with kg.use_graph("a"):
+        pass
+    with kg.use_graph("c"):
+        assert list(kg.GRAPHS._open) == ["a", "c"]
+
+    # A graph in use is never closed, even past capacity
+    with kg.use_graph("b") as busy:
+        with kg.use_graph("d"), kg.use_graph("e"):
+            assert "b" in kg.GRAPHS._open
+        assert kg.GRAPHS._open["b"] is busy
+    assert len(kg.GRAPHS._open) == 2
+
+    # Reopening an evicted graph finds its data again
+    with kg.use_graph("a"):
+        assert [node["label"] for node in kg.tool_list_recent_nodes({})["nodes"]] == ["a"]
+
+
+def test_write_plans_stay_in_one_graph(kg):
+    with kg.use_graph("alpha"):
+        with pytest.raises(ValueError, match="runs in one graph"):
+            kg.tool_apply_write_plan({"plan": [
+                {"call": "knowledge-graph:add_node", "arguments": {"label": "x", "graph": "beta"}}
+            ]})
+        assert kg.tool_list_recent_nodes({})["nodes"] == []
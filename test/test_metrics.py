@@ -0,0 +1,80 @@
+import threading
+import time
+from queue import Queue
+
+import pytest
+
+pytest.importorskip("numpy")
+
+
+@pytest.fixture
+def writer(kg, monkeypatch):
+    queue = Queue()
+    monkeypatch.setattr(kg, "WRITE_QUEUE", queue)
+    thread = threading.Thread(target=kg._writer_loop, args=(queue,), name="kg-writer")
+    thread.start()
+    yield queue
+    queue.put(None)
+    thread.join(timeout=10)
+
+
+@pytest.fixture
+def star(kg, writer):
+    hub = kg.tool_add_node({"label": "hub", "type": "concept"})["node_id"]
+    for i in range(4):
+        leaf = kg.tool_add_node({"label": f"leaf{i}", "type": "concept"})["node_id"]
+        kg.tool_add_edge({"source_id": leaf, "target_id": hub})
+    return hub
+
+
+def wait_until(predicate, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_reads_start_a_refresh_off_the_writer_thread(kg, star, monkeypatch):
+    computed_on = []
+    pagerank = kg.pagerank
+
+    def recording_pagerank(*args, **kwargs):
+        computed_on.append(threading.current_thread().name)
+        return pagerank(*args, **kwargs)
+    monkeypatch.setattr(kg, "pagerank", recording_pagerank)
+
+    first = kg.tool_top_central_nodes({})
+    assert first["stale"] and first["refresh_queued"]
+
+    wait_until(lambda: not kg.tool_top_central_nodes({"refresh": "never"})["stale"])
+    assert computed_on == ["kg-metrics"]
+    served = kg.tool_top_central_nodes({"limit": 1})
+    assert served["pending_changes"] == 0
+    assert served["nodes"][0]["id"] == star and served["nodes"][0]["in_degree"] == 4
+
+
+def test_compute_graph_metrics_only_stores_on_the_writer(kg, star, monkeypatch):
+    assert "compute_graph_metrics" not in kg.WRITE_TOOLS
+    stored_on = []
+    run_on_writer = kg.run_on_writer
+
+    def recording(job):
+        def wrapped():
+            stored_on.append(threading.current_thread().name)
+            return job()
+        return run_on_writer(wrapped)
+    monkeypatch.setattr(kg, "run_on_writer", recording)
+
+    run = kg.tool_compute_graph_metrics({})
+    assert stored_on == ["kg-writer"]
+    assert run["nodes"] == 5 and run["computed_at"]
+
+
+def test_stale_metrics_are_served_with_a_flag(kg, star, monkeypatch):
+    kg.compute_node_metrics()
+    monkeypatch.setattr(kg, "METRICS_REFRESH_CHANGES", 2)
+    kg.tool_add_node({"label": "x"})
+    kg.tool_add_node({"label": "y"})
+    result = kg.tool_top_central_nodes({"refresh": "never", "limit": 1})
+    assert result["stale"] and not result["refresh_queued"] and result["pending_changes"] == 2
+    assert result["nodes"][0]["id"] == star
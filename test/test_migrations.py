@@ -0,0 +1,59 @@
+import sqlite3
+
+
+def test_fresh_database_is_fully_migrated(kg):
+    with kg.DB.reader() as conn:
+        assert kg.get_schema_version(conn) == kg.MIGRATIONS[-1][0]
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {"nodes", "edges", "changes", "retention_policies", "state_history"} <= tables
+
+
+def test_migrate_is_idempotent(kg):
+    assert kg.migrate(kg.DB) == []
+
+
+def test_baseline_database_is_upgraded_in_place(kg, tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE nodes (id INTEGER PRIMARY KEY AUTOINCREMENT, label TEXT NOT NULL, "
+                 "type TEXT, data TEXT, created_at TEXT DEFAULT CURRENT_TIMESTAMP)")
+    conn.execute("CREATE TABLE edges (id INTEGER PRIMARY KEY AUTOINCREMENT, source_id INTEGER NOT NULL, "
+                 "target_id INTEGER NOT NULL, relation TEXT, data TEXT, created_at TEXT DEFAULT CURRENT_TIMESTAMP)")
+    conn.execute("INSERT INTO nodes (label, type, data) VALUES ('a', 'concept', '{}')")
+    conn.commit()
+    conn.close()
+
+    db = kg.ConnectionManager(path)
+    try:
+        assert kg.migrate(db) == [version for version, _, _ in kg.MIGRATIONS]
+        with db.reader() as conn:
+            assert [tuple(row) for row in conn.execute("SELECT entity, entity_id, op FROM changes")] == [("node", 1, "insert")]
+            assert conn.execute("SELECT hits FROM nodes").fetchone()[0] == 1
+    finally:
+        db.close()
+
+
+def test_dedup_key_rewrite_stays_out_of_the_change_log(kg, tmp_path, monkeypatch):
+    migrations = kg.MIGRATIONS
+    db = kg.ConnectionManager(str(tmp_path / "v10.db"))
+    try:
+        monkeypatch.setattr(kg, "MIGRATIONS", migrations[:10])
+        kg.migrate(db)
+        with db.writer() as conn:
+            conn.execute("INSERT INTO nodes (label) VALUES ('a'), ('b')")
+            conn.execute("INSERT INTO edges (source_id, target_id, relation, dedup_key) "
+                         "VALUES (1, 2, NULL, ''), (2, 1, 'r', 'r')")
+            before = conn.execute("SELECT COUNT(*) FROM changes").fetchone()[0]
+
+        monkeypatch.setattr(kg, "MIGRATIONS", migrations)
+        assert kg.migrate(db) == [11, 12]
+        with db.writer() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM changes").fetchone()[0] == before
+            assert [row[0] for row in conn.execute("SELECT dedup_key FROM edges ORDER BY id")] == ["null", '"r"']
+            # The trigger is back for ordinary updates
+            conn.execute("UPDATE edges SET data = '{}' WHERE id = 1")
+            assert tuple(conn.execute("SELECT entity, entity_id, op FROM changes ORDER BY seq DESC").fetchone()) == (
+                "edge", 1, "update"
+            )
+    finally:
+        db.close()
@@ -0,0 +1,63 @@
+import base64
+
+import pytest
+
+
+@pytest.fixture
+def nodes(kg):
+    """Six nodes, pairs of them sharing a created_at second."""
+    ids = [kg.tool_add_node({"label": f"n{i}"})["node_id"] for i in range(6)]
+    with kg.DB.writer() as conn:
+        for node_id in ids:
+            conn.execute("UPDATE nodes SET created_at = ? WHERE id = ?",
+                         (f"2024-01-0{(node_id + 1) // 2} 12:00:00", node_id))
+    return ids
+
+
+def pages(kg, **params):
+    seen, cursor = [], None
+    while True:
+        page = kg.tool_list_recent_nodes({**params, "cursor": cursor})
+        seen.append([node["id"] for node in page["nodes"]])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return seen
+
+
+def test_cursors_page_through_ties_in_both_orders(kg, nodes):
+    assert pages(kg, limit=4) == [[6, 5, 4, 3], [2, 1]]
+    assert pages(kg, limit=3, order="asc") == [[1, 2, 3], [4, 5, 6]]
+    assert pages(kg, limit=1, order="asc") == [[i] for i in nodes]
+    # The last full page has no cursor
+    assert kg.tool_list_recent_nodes({"limit": 6})["next_cursor"] is None
+
+
+def test_since_and_until_bound_the_window(kg, nodes):
+    window = {"since": "2024-01-02T12:00:00Z", "until": "2024-01-03 12:00:00", "order": "asc"}
+    assert pages(kg, limit=1, **window) == [[3], [4]]
+    # Offsets are converted to UTC
+    assert pages(kg, since="2024-01-03T14:00:00+02:00") == [[6, 5]]
+    with pytest.raises(ValueError, match="since must be an ISO-8601 timestamp"):
+        kg.tool_list_recent_nodes({"since": "yesterday"})
+
+
+def test_edges_page_the_same_way(kg, nodes):
+    for target in nodes[1:]:
+        kg.tool_add_edge({"source_id": nodes[0], "target_id": target})
+    first = kg.tool_list_recent_edges({"limit": 3, "order": "asc"})
+    second = kg.tool_list_recent_edges({"limit": 3, "order": "asc", "cursor": first["next_cursor"]})
+    assert [e["id"] for e in first["edges"] + second["edges"]] == [1, 2, 3, 4, 5]
+    assert second["next_cursor"] is None
+
+
+def test_invalid_cursors_and_parameters(kg, nodes):
+    def encode(raw):
+        return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+    for cursor in ("not a cursor!", encode(b"[1]"), encode(b'{"a": 1}'), encode(b'["x", "y"]'), encode(b"null")):
+        with pytest.raises(ValueError, match="Invalid cursor"):
+            kg.tool_list_recent_nodes({"cursor": cursor})
+    with pytest.raises(ValueError, match="limit must be positive"):
+        kg.tool_list_recent_nodes({"limit": 0})
+    with pytest.raises(ValueError, match="order must be"):
+        kg.tool_list_recent_edges({"order": "sideways"})
@@ -0,0 +1,62 @@
+import pytest
+
+
+@pytest.fixture
+def node(kg):
+    data = {"list": ["a", "b"], "map": {"0": "zero", "1": "one"}, "nested": [{"0": "x"}]}
+    return kg.tool_add_node({"label": "n", "data": data})["node_id"]
+
+
+def patch(kg, node_id, **params):
+    return kg.tool_patch_node_data({"node_id": node_id, "return_data": True, **params})["data"]
+
+
+def test_numeric_segments_follow_the_target_type(kg, node):
+    data = patch(kg, node, ops=[
+        {"op": "set", "path": "/list/0", "value": "A"},
+        {"op": "set", "path": "/map/0", "value": "ZERO"},
+        {"op": "remove", "path": "/map/1"},
+        {"op": "set", "path": "/nested/0/0", "value": "X"},
+    ])
+    assert data["list"] == ["A", "b"]
+    assert data["map"] == {"0": "ZERO"}
+    assert data["nested"] == [{"0": "X"}]
+
+
+def test_ops_see_earlier_ops_and_the_merge(kg, node):
+    data = patch(kg, node, merge={"fresh": {"7": 1}}, ops=[
+        {"op": "append", "path": "/made", "value": 1},
+        {"op": "set", "path": "/made/0", "value": 2},
+        {"op": "set", "path": "/fresh/7", "value": 3},
+        {"op": "set", "path": "/list/-", "value": "c"},
+    ])
+    assert data["made"] == [2]
+    assert data["fresh"] == {"7": 3}
+    assert data["list"] == ["a", "b", "c"]
+
+
+def test_data_paths_resolve_numeric_segments_per_row(kg, node):
+    page = kg.tool_list_recent_nodes({"fields": ["id"], "data_paths": ["/list/1", "/map/0", "/nested/0/0"]})
+    assert page["nodes"][0]["data"] == {"/list/1": "b", "/map/0": "zero", "/nested/0/0": "x"}
+
+
+def test_invalid_pointer(kg, node):
+    with pytest.raises(ValueError, match="Invalid JSON pointer"):
+        patch(kg, node, ops=[{"op": "set", "path": "list", "value": 1}])
+
+
+def test_query_filters_on_data_paths(kg, node):
+    rows = kg.tool_query({"query": "?n.data.map.0 = 'zero'; ?n.data.list.1 = 'b'"})["rows"]
+    assert [row["n"]["id"] for row in rows] == [node]
+
+
+def test_pointer_sql_grows_linearly_with_numeric_depth(kg):
+    sizes = [len(kg.json_pointer_sql("/0" * depth, "data")) for depth in (10, 20, 40)]
+    assert sizes[2] - sizes[1] <= 2 * (sizes[1] - sizes[0])
+
+    deep = "leaf"
+    for depth in range(30):
+        deep = [deep] if depth % 2 else {"0": deep}
+    kg.tool_add_node({"label": "deep", "data": {"d": deep}})
+    page = kg.tool_list_recent_nodes({"fields": ["id"], "data_paths": ["/d" + "/0" * 30], "limit": 1})
+    assert page["nodes"][0]["data"] == {"/d" + "/0" * 30: "leaf"}
@@ -0,0 +1,45 @@
+import pytest
+
+
+@pytest.fixture
+def reflection(kg):
+    a = kg.tool_add_node({"label": "reflection", "type": "reflection", "data": {
+        "summary": {"text": "long text", "tags": ["x", "y"]},
+        "a/b": 1, "m~n": 2, "score": 0.5
+    }})["node_id"]
+    b = kg.tool_add_node({"label": "plain"})["node_id"]
+    kg.tool_add_edge({"source_id": a, "target_id": b, "relation": "r", "data": {"w": 3}})
+    return a, b
+
+
+def test_fields_select_columns(kg, reflection):
+    nodes = kg.tool_list_recent_nodes({"fields": ["label", "type"]})["nodes"]
+    assert nodes == [{"label": "plain", "type": None}, {"label": "reflection", "type": "reflection"}]
+    edges = kg.tool_list_recent_edges({"fields": ["source_id", "relation", "hits"]})["edges"]
+    assert edges == [{"source_id": reflection[0], "relation": "r", "hits": 1}]
+
+    with pytest.raises(ValueError, match="Unknown fields: colour"):
+        kg.tool_list_recent_nodes({"fields": ["id", "colour"]})
+
+
+def test_fields_without_id_still_page(kg, reflection):
+    first = kg.tool_list_recent_nodes({"fields": ["label"], "limit": 1})
+    second = kg.tool_list_recent_nodes({"fields": ["label"], "limit": 1, "cursor": first["next_cursor"]})
+    assert [first["nodes"], second["nodes"]] == [[{"label": "plain"}], [{"label": "reflection"}]]
+
+
+def test_data_paths_extract_on_the_server(kg, reflection):
+    paths = ["/summary/tags", "/summary/text", "/a~1b", "/m~0n", "/missing"]
+    node = kg.tool_list_recent_nodes({"fields": ["id"], "data_paths": paths, "order": "asc", "limit": 1})["nodes"][0]
+    assert node == {"id": reflection[0], "data": {
+        "/summary/tags": ["x", "y"], "/summary/text": "long text", "/a~1b": 1, "/m~0n": 2, "/missing": None
+    }}
+    edge = kg.tool_list_recent_edges({"fields": ["id", "data"], "data_paths": ["/w"]})["edges"][0]
+    assert edge["data"] == {"/w": 3}
+
+
+def test_undecodable_data_reads_as_empty(kg, reflection):
+    with kg.DB.writer() as conn:
+        conn.execute("UPDATE nodes SET data = 'not json' WHERE id = ?", (reflection[1],))
+    nodes = kg.tool_list_recent_nodes({"fields": ["label"], "data_paths": ["/x"], "limit": 1})["nodes"]
+    assert nodes == [{"label": "plain", "data": {}}]
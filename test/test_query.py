@@ -0,0 +1,84 @@
+import pytest
+
+
+@pytest.fixture
+def library(kg):
+    ids = {}
+    for label, type_ in (("paper", "document"), ("notes", "document"), ("graphs", "concept"),
+                         ("paths", "concept"), ("trees", "concept")):
+        ids[label] = kg.tool_add_node({"label": label, "type": type_})["node_id"]
+    for doc, concept in (("paper", "graphs"), ("paper", "paths"), ("notes", "graphs"), ("notes", "trees")):
+        kg.tool_add_edge({"source_id": ids[doc], "target_id": ids[concept], "relation": "tagged_with"})
+    kg.tool_add_edge({"source_id": ids["paths"], "target_id": ids["graphs"], "relation": "part_of"})
+    return ids
+
+
+def labels(result, var):
+    return sorted(row[var]["label"] for row in result["rows"])
+
+
+def test_patterns_filters_and_returns(kg, library):
+    result = kg.tool_query({"query": "?d -[tagged_with]-> 'graphs'; ?d.type = 'document'"})
+    assert result["variables"] == ["d"] and labels(result, "d") == ["notes", "paper"]
+
+    result = kg.tool_query({"query": "'paper' --> ?c; ?other --> ?c; ?other.label != 'paper'; return ?other"})
+    assert labels(result, "other") == ["notes", "paths"]
+
+    result = kg.tool_query({"query": "?a -[?rel]-> ?b; ?a.label = 'paths'"})
+    assert [(row["rel"], row["b"]["label"]) for row in result["rows"]] == [("part_of", "graphs")]
+
+    result = kg.tool_query({"query": "?c.type in ('concept'); ?c.label like 'p%'"})
+    assert labels(result, "c") == ["paths"]
+
+
+def test_has_more_is_exact(kg, library):
+    query = "?d -[tagged_with]-> ?c"
+    page = kg.tool_query({"query": query, "limit": 4})
+    assert len(page["rows"]) == 4 and not page["has_more"]
+    page = kg.tool_query({"query": query, "limit": 3})
+    assert len(page["rows"]) == 3 and page["has_more"]
+    page = kg.tool_query({"query": query, "limit": 3, "offset": 3})
+    assert len(page["rows"]) == 1 and not page["has_more"]
+    with pytest.raises(ValueError, match="limit must be positive"):
+        kg.tool_query({"query": query, "limit": 0})
+
+
+def test_planner_starts_from_the_most_selective_alias(kg, library):
+    explained = kg.tool_query({"query": "?d -[tagged_with]-> ?c; ?c.label = 'trees'", "explain": True})
+    order = [step["alias"] for step in explained["join_order"]]
+    assert order[0] == "?c" and explained["join_order"][0]["estimated_rows"] == 1
+    assert "CROSS JOIN" in explained["sql"] and explained["query_plan"]
+    assert "rows" not in explained
+
+
+def test_parse_errors(kg):
+    for query, message in (
+        ("?a -[r]- ?b", "exactly one direction"),
+        ("?a.colour = 'red'", "Unknown field"),
+        ("?a.id in 3", "parenthesized list"),
+        ("?a --> ?b; return ?z", "unknown variable"),
+        ("nonsense", "Cannot parse clause"),
+    ):
+        with pytest.raises(ValueError, match=message):
+            kg.tool_query({"query": query})
+
+
+def test_query_across_graphs(kg, library):
+    with kg.use_graph("other"):
+        doc = kg.tool_add_node({"label": "thesis", "type": "document"})["node_id"]
+        concept = kg.tool_add_node({"label": "graphs", "type": "concept"})["node_id"]
+        kg.tool_add_edge({"source_id": doc, "target_id": concept, "relation": "tagged_with"})
+
+    result = kg.tool_query({
+        "query": "?d -[tagged_with]-> ?c; ?c.label = 'graphs'",
+        "graphs": [kg.DEFAULT_GRAPH, "other"]
+    })
+    found = sorted((row["graph"], row["d"]["label"]) for row in result["rows"])
+    assert found == [(kg.DEFAULT_GRAPH, "notes"), (kg.DEFAULT_GRAPH, "paper"), ("other", "thesis")]
+
+    explained = kg.tool_query({"query": "?d --> ?c", "graphs": [kg.DEFAULT_GRAPH, "other"], "explain": True})
+    assert set(explained["join_order"]) == {kg.DEFAULT_GRAPH, "other"}
+    assert kg.tool_query({"query": "?d --> ?c", "graphs": [kg.DEFAULT_GRAPH, "other"], "limit": 4})["has_more"]
+
+    with pytest.raises(ValueError, match="At most"):
+        kg.tool_query({"query": "?d --> ?c", "graphs": [f"g{i}" for i in range(kg.QUERY_MAX_GRAPHS + 1)]})
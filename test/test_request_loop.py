@@ -0,0 +1,123 @@
+import threading
+from queue import Queue
+
+import pytest
+
+
+def request(req_id, name, **arguments):
+    return {"jsonrpc": "2.0", "id": req_id, "method": "tools/call", "params": {"name": name, "arguments": arguments}}
+
+
+@pytest.fixture
+def sent(kg, monkeypatch):
+    messages = []
+    monkeypatch.setattr(kg, "send_message", messages.append)
+    return messages
+
+
+def run_writer(kg, *messages):
+    queue = Queue()
+    for msg in messages + (None,):
+        queue.put(msg)
+    kg._writer_loop(queue)
+
+
+def test_failing_write_rolls_back_alone(kg, sent):
+    run_writer(
+        kg,
+        request(1, "add_node", label="a"),
+        request(2, "add_edge", source_id=1),
+        request(3, "add_node", label="b"),
+    )
+    by_id = {msg["id"]: msg for msg in sent}
+    assert by_id[1]["result"]["node_id"] == 1
+    assert "target_id" in by_id[2]["error"]["message"]
+    assert by_id[3]["result"]["node_id"] == 2
+
+
+def test_write_plan_rolls_back_as_a_whole(kg):
+    with pytest.raises(ValueError, match=r"plan\[1\] \(add_edge\): Unknown ref: missing"):
+        kg.tool_apply_write_plan({"plan": [
+            {"call": "knowledge-graph:add_node", "arguments": {"label": "a"}, "ref": "a"},
+            {"call": "knowledge-graph:add_edge", "arguments": {"source_ref": "a", "target_ref": "missing"}},
+        ]})
+    with kg.DB.reader() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM nodes").fetchone()[0] == 0
+
+
+def test_write_plan_resolves_refs(kg):
+    result = kg.tool_apply_write_plan({"plan": [
+        {"call": "knowledge-graph:add_node", "arguments": {"label": "a"}, "ref": "a"},
+        {"call": "add_node", "arguments": {"label": "b"}, "ref": "b"},
+        {"call": "add_edge", "arguments": {"source_ref": "a", "target_ref": "b", "relation": "r"}},
+    ]})
+    assert result["refs"] == {"a": 1, "b": 2}
+    assert (result["results"][2]["source_id"], result["results"][2]["target_id"]) == (1, 2)
+
+
+def test_write_plan_rejects_other_tools(kg):
+    with pytest.raises(ValueError, match="not allowed"):
+        kg.tool_apply_write_plan({"plan": [{"call": "apply_retention", "arguments": {}}]})
+
+
+def test_writing_tools_are_routed_to_the_writer(kg):
+    assert "apply_retention" in kg.WRITE_TOOLS and "apply_retention" in kg.STANDALONE_WRITE_TOOLS
+    reads = {"top_central_nodes", "compute_graph_metrics", "similar_nodes", "changes_since", "neighbors"}
+    assert not reads & kg.WRITE_TOOLS
+
+
+def test_standalone_writes_run_on_the_writer_thread(kg, sent):
+    run_writer(
+        kg,
+        request(1, "add_node", label="graph theory"),
+        request(2, "apply_retention", dry_run=True),
+    )
+    by_id = {msg["id"]: msg for msg in sent}
+    assert "error" not in by_id[2]
+
+
+def test_similar_nodes_syncs_on_the_writer_only_when_stale(kg, monkeypatch):
+    pytest.importorskip("numpy")
+    queue = Queue()
+    monkeypatch.setattr(kg, "WRITE_QUEUE", queue)
+    writer = threading.Thread(target=kg._writer_loop, args=(queue,), name="kg-writer")
+    writer.start()
+    synced_on = []
+    sync = kg.EmbeddingIndex.sync
+
+    def recording_sync(index):
+        synced_on.append(threading.current_thread().name)
+        return sync(index)
+    monkeypatch.setattr(kg.EmbeddingIndex, "sync", recording_sync)
+    try:
+        kg.tool_add_node({"label": "graph theory"})
+        first = kg.tool_similar_nodes({"text": "graph"})
+        again = kg.tool_similar_nodes({"text": "graph"})
+    finally:
+        queue.put(None)
+        writer.join(timeout=10)
+    assert synced_on == ["kg-writer"]
+    assert first["results"][0]["matches"][0]["label"] == "graph theory"
+    assert again == first
+
+
+def test_read_tools_never_open_a_write_transaction(kg, monkeypatch):
+    node = kg.tool_add_node({"label": "a", "type": "concept", "data": {"x": [1]}})["node_id"]
+    kg.tool_add_edge({"source_id": node, "target_id": node, "relation": "self"})
+    monkeypatch.setattr(kg, "WRITE_QUEUE", Queue())
+
+    def no_writes():
+        raise AssertionError("read tool opened a write transaction")
+    monkeypatch.setattr(kg.current_graph().db, "writer", no_writes)
+
+    reads = {
+        "list_recent_nodes": {}, "list_recent_edges": {}, "neighbors": {"node_id": node},
+        "k_hop_subgraph": {"node_id": node}, "shortest_path": {"source_id": node, "target_id": node},
+        "search_nodes": {"query": "a"}, "changes_since": {}, "top_central_nodes": {},
+        "query": {"query": "?a -[self]-> ?b"}, "get_state_history": {"node_id": node},
+        "db_stats": {}, "list_graphs": {}, "adjacency_cache_status": {},
+    }
+    assert not set(reads) & kg.WRITE_TOOLS
+    for tool, arguments in reads.items():
+        response = kg.process_request(request(1, tool, **arguments))
+        assert "error" not in response, (tool, response)
@@ -0,0 +1,63 @@
+import pytest
+
+
+def add_reflections(kg, concepts):
+    return [
+        kg.tool_add_node({"label": f"r{i}", "type": "reflection", "data": {"summary": {"active_concepts": c}, "tag": "t"}})["node_id"]
+        for i, c in enumerate(concepts)
+    ]
+
+
+def test_max_count_keeps_the_newest(kg):
+    ids = add_reflections(kg, [[]] * 5)
+    kg.tool_set_retention_policy({"type": "reflection", "max_count": 2, "archive": False})
+    report = kg.tool_apply_retention({"vacuum": "none"})
+    assert report["policies"][0]["expired"] == 3
+    with kg.DB.reader() as conn:
+        assert [row[0] for row in conn.execute("SELECT id FROM nodes ORDER BY id")] == ids[3:]
+
+
+def test_dry_run_changes_nothing(kg):
+    add_reflections(kg, [[]] * 3)
+    kg.tool_set_retention_policy({"type": "reflection", "max_count": 1})
+    report = kg.tool_apply_retention({"dry_run": True})
+    assert report["policies"][0]["expired"] == 2
+    with kg.DB.reader() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM nodes").fetchone()[0] == 3
+
+
+def test_expired_nodes_and_edges_are_archived(kg):
+    a, b = add_reflections(kg, [[], []])
+    kg.tool_add_edge({"source_id": a, "target_id": b})
+    kg.tool_set_retention_policy({"type": "reflection", "max_count": 1})
+    report = kg.tool_apply_retention({"vacuum": "none"})
+    assert report["policies"][0]["edges_removed"] == 1
+    with kg.DB.writer() as conn:
+        assert conn.execute("SELECT id FROM archive.nodes").fetchall()[0][0] == a
+        assert conn.execute("SELECT COUNT(*) FROM archive.edges").fetchone()[0] == 1
+
+
+@pytest.mark.parametrize("path, counts", [
+    ("/summary/active_concepts", {"graph": 2, "tree": 1}),
+    ("/tag", {"t": 3}),
+    (None, {}),
+])
+def test_rollup_counts_the_policy_path(kg, path, counts):
+    add_reflections(kg, [["graph", "tree"], ["graph"], []])
+    kg.tool_set_retention_policy({"type": "reflection", "max_count": 0, "rollup": "day", "rollup_path": path, "archive": False})
+    report = kg.tool_apply_retention({"vacuum": "none"})
+    (rollup_id,) = report["policies"][0]["rollup_node_ids"]
+    with kg.DB.reader() as conn:
+        data = kg.json.loads(conn.execute("SELECT data FROM nodes WHERE id = ?", (rollup_id,)).fetchone()[0])
+    assert data["count"] == 3
+    assert data["rollup_path"] == path
+    assert data["value_counts"] == counts
+
+
+def test_rollup_path_is_validated(kg):
+    with pytest.raises(ValueError, match="requires rollup"):
+        kg.tool_set_retention_policy({"type": "reflection", "max_count": 1, "rollup_path": "/a"})
+    with pytest.raises(ValueError, match="Invalid JSON pointer"):
+        kg.tool_set_retention_policy({"type": "reflection", "max_count": 1, "rollup": "day", "rollup_path": "a"})
+    with pytest.raises(ValueError, match="cannot have a retention policy"):
+        kg.tool_set_retention_policy({"type": "cognitive_state", "max_count": 1})
@@ -0,0 +1,131 @@
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture
+def scheduler(loop):
+    scheduler = loop.CycleScheduler()
+    scheduler.config.update(interval_s=0, change_threshold=0, min_interval_s=0, time_budget_ms=1000)
+    yield scheduler
+    scheduler.stop(timeout=5)
+
+
+def fake_cycle(loop, monkeypatch, cursor=7, error=None, delay=0.0):
+    calls = []
+
+    def run_full_cycle(params):
+        calls.append(params)
+        time.sleep(delay)
+        if error:
+            raise RuntimeError(error)
+        return {"updated_state": {"last_change_cursor": cursor, "cycle_count": len(calls)}}
+
+    monkeypatch.setattr(loop, "tool_run_full_cycle", run_full_cycle)
+    return calls
+
+
+def test_triggers_coalesce(scheduler):
+    scheduler.trigger("manual")
+    scheduler.trigger("changes")
+    scheduler.trigger("manual")
+    assert scheduler.pending == {"manual", "changes"}
+    assert scheduler.counters["triggers"] == 3
+    assert scheduler.counters["coalesced"] == 2
+
+
+def test_successful_cycle_advances_the_cursor(loop, scheduler, monkeypatch):
+    calls = fake_cycle(loop, monkeypatch, cursor=42)
+    scheduler.backoff_s = 8.0
+    scheduler._run_cycle(["manual"])
+
+    assert calls[0]["time_budget_ms"] == 1000
+    assert scheduler.change_cursor == 42
+    assert scheduler.backoff_s == 0.0
+    assert scheduler.last_cycle["cycle"] == 1 and scheduler.last_cycle["error"] is None
+
+
+def test_failures_and_overruns_back_off(loop, scheduler, monkeypatch):
+    fake_cycle(loop, monkeypatch, error="graph unavailable")
+    for _ in range(12):
+        scheduler._run_cycle(["cadence"])
+    assert scheduler.counters["errors"] == 12
+    assert scheduler.backoff_s == loop.CYCLE_BACKOFF_MAX_S
+    assert scheduler.last_error == "graph unavailable"
+
+    scheduler.backoff_s = 0.0
+    scheduler.config["time_budget_ms"] = 1
+    fake_cycle(loop, monkeypatch, delay=0.01)
+    scheduler._run_cycle(["cadence"])
+    assert scheduler.counters["overruns"] == 1
+    assert scheduler.backoff_s == 1.0
+
+
+def test_change_poll_triggers_at_the_threshold(loop, scheduler, monkeypatch):
+    scheduler.config["change_threshold"] = 3
+    scheduler.change_cursor = 0
+    events = []
+    monkeypatch.setattr(loop, "graph_transport", lambda kind=None: None)
+    monkeypatch.setattr(loop, "execute_call", lambda transport, descriptor: {"events": list(events)})
+
+    events.extend([1, 2])
+    scheduler._poll_changes()
+    assert not scheduler.pending
+
+    events.append(3)
+    scheduler._poll_changes()
+    assert scheduler.pending == {"changes"}
+
+
+def test_cadence_runs_cycles_until_paused(loop, scheduler, monkeypatch):
+    calls = fake_cycle(loop, monkeypatch)
+    scheduler.resume(interval_s=0.05)
+    deadline = time.monotonic() + 5
+    while len(calls) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    scheduler.pause()
+    assert len(calls) >= 2
+    assert scheduler.status()["paused"]
+
+
+def test_resume_rejects_unknown_transports(loop):
+    with pytest.raises(ValueError, match="Unknown transport"):
+        loop.tool_resume({"transport": "carrier-pigeon"})
+
+
+def test_resume_validates_the_config(loop):
+    for params, message in (
+        ({"poll_s": 0}, "poll_s must be positive"),
+        ({"min_interval_s": -1}, "min_interval_s must be a non-negative number"),
+        ({"interval_s": "soon"}, "interval_s must be a non-negative number"),
+        ({"change_threshold": 2.5}, "change_threshold must be a non-negative number"),
+        ({"time_budget_ms": True}, "time_budget_ms must be a non-negative number"),
+    ):
+        with pytest.raises(ValueError, match=message):
+            loop.tool_resume(params)
+    assert loop.SCHEDULER.config["poll_s"] == loop.CYCLE_POLL_S
+
+
+def test_main_waits_for_a_running_cycle_before_closing_transports(loop, monkeypatch):
+    events = []
+    started = threading.Event()
+
+    def run_full_cycle(params):
+        started.set()
+        time.sleep(0.2)
+        events.append("cycle finished")
+        return {"updated_state": {"last_change_cursor": 1, "cycle_count": 1}}
+
+    class Transport:
+        def close(self):
+            events.append("transport closed")
+
+    monkeypatch.setattr(loop, "tool_run_full_cycle", run_full_cycle)
+    monkeypatch.setattr(loop, "_transports", {"inprocess": Transport()})
+    monkeypatch.setattr(loop, "read_message", lambda: started.wait(5) and None)
+    # The cycle overruns its budget
+    monkeypatch.setattr(loop, "CYCLE_TIME_BUDGET_MS", 50)
+    loop.SCHEDULER.config.update(interval_s=60, min_interval_s=0, time_budget_ms=50)
+    loop.main()
+    assert events == ["cycle finished", "transport closed"]
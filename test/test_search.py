@@ -0,0 +1,53 @@
+import pytest
+
+
+def search(kg, query, **params):
+    return [row["label"] for row in kg.tool_search_nodes({"query": query, **params})["results"]]
+
+
+@pytest.fixture
+def notes(kg):
+    return {
+        label: kg.tool_add_node({"label": label, "type": type_, "data": data})["node_id"]
+        for label, type_, data in (
+            ("graph theory", "concept", {"summary": "vertices and edges"}),
+            ("reading list", "document", {"items": ["intro to graph theory", "café notes"]}),
+            ("trees", "concept", {}),
+        )
+    }
+
+
+def test_label_matches_rank_above_data_matches(kg, notes):
+    # bm25 needs the terms to be rare in the corpus to score above zero
+    kg.tool_add_nodes_batch({"nodes": [{"label": f"filler {i}"} for i in range(6)]})
+    result = kg.tool_search_nodes({"query": "graph theory"})
+    assert result["engine"] == "fts5"
+    assert [row["label"] for row in result["results"]] == ["graph theory", "reading list"]
+    assert result["results"][0]["score"] > result["results"][1]["score"]
+    assert "[graph]" in result["results"][1]["snippet"]
+
+
+def test_simple_syntax(kg, notes):
+    assert search(kg, "graph edges") == ["graph theory"]        # every word must match
+    assert search(kg, "tree") == []
+    assert search(kg, "tree", prefix=True) == ["trees"]
+    assert search(kg, "cafe") == ["reading list"]               # diacritics folded
+    assert search(kg, 'graph OR "trees') == []                  # operators are literal words
+    assert search(kg, "graph", types=["document"]) == ["reading list"]
+
+
+def test_fts5_syntax(kg, notes):
+    assert sorted(search(kg, "graph OR trees", syntax="fts5")) == ["graph theory", "reading list", "trees"]
+    assert search(kg, "label:graph", syntax="fts5") == ["graph theory"]
+    with pytest.raises(ValueError, match="Invalid search query"):
+        kg.tool_search_nodes({"query": '"unbalanced', "syntax": "fts5"})
+
+
+def test_index_follows_node_writes(kg, notes):
+    kg.tool_update_node_data({"node_id": notes["trees"], "data": {"summary": "forests of vertices"}})
+    assert sorted(search(kg, "vertices")) == ["graph theory", "trees"]
+    with kg.DB.writer() as conn:
+        conn.execute("UPDATE nodes SET label = 'forests' WHERE id = ?", (notes["trees"],))
+        conn.execute("DELETE FROM nodes WHERE id = ?", (notes["graph theory"],))
+    assert search(kg, "vertices") == ["forests"]
+    assert search(kg, "trees") == []
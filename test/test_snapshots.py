@@ -0,0 +1,78 @@
+import gzip
+import os
+
+import pytest
+
+
+@pytest.fixture
+def populated(kg):
+    a = kg.tool_add_node({"label": "a", "type": "concept"})["node_id"]
+    b = kg.tool_add_node({"label": "b", "type": "concept"})["node_id"]
+    kg.tool_add_edge({"source_id": a, "target_id": b})
+    return a, b
+
+
+def test_snapshot_is_verified_and_listed(kg, populated):
+    snapshot = kg.tool_snapshot({"name": "first", "verify": True})
+    assert (snapshot["nodes"], snapshot["edges"]) == (2, 1)
+    assert snapshot["change_seq"] == kg.tool_changes_since({"cursor": 0})["cursor"]
+    assert [s["name"] for s in kg.tool_list_snapshots({})["snapshots"]] == ["first"]
+    with pytest.raises(ValueError, match="already exists"):
+        kg.tool_snapshot({"name": "first"})
+    with pytest.raises(ValueError, match="Invalid snapshot name"):
+        kg.tool_snapshot({"name": "../first"})
+
+
+def test_keep_prunes_the_oldest_and_must_be_positive(kg, populated):
+    for name in ("one", "two", "three"):
+        kg.tool_snapshot({"name": name})
+    for keep in (0, -1):
+        with pytest.raises(ValueError, match="keep must be at least 1"):
+            kg.tool_snapshot({"name": "four", "keep": keep})
+
+    assert kg.tool_snapshot({"name": "four", "keep": 2})["pruned"] == ["two", "one"]
+    assert [s["name"] for s in kg.tool_list_snapshots({})["snapshots"]] == ["four", "three"]
+
+
+def test_restore_as_a_new_graph(kg, populated):
+    kg.tool_snapshot({"name": "before"})
+    kg.tool_add_node({"label": "after"})
+
+    restored = kg.tool_restore_snapshot({"name": "before", "target_graph": "recovered"})
+    assert restored["verified"] and restored["graph"] == "recovered"
+    with kg.use_graph("recovered"):
+        assert [n["label"] for n in kg.tool_list_recent_nodes({"limit": 10})["nodes"]] == ["b", "a"]
+    with pytest.raises(ValueError, match="already exists"):
+        kg.tool_restore_snapshot({"name": "before", "target_graph": "recovered"})
+
+
+def test_restore_targets_stay_in_the_snapshot_or_graphs_directory(kg, populated, tmp_path):
+    kg.tool_snapshot({"name": "s"})
+    snapshot_dir = kg.current_graph().snapshot_dir
+
+    default = kg.tool_restore_snapshot({"name": "s"})
+    assert os.path.dirname(default["path"]) == os.path.realpath(snapshot_dir)
+    named = kg.tool_restore_snapshot({"name": "s", "target_path": "copy.db"})
+    assert named["path"] == os.path.realpath(os.path.join(snapshot_dir, "copy.db"))
+    graphs_target = os.path.abspath(os.path.join(kg.GRAPHS_DIR, "x.db"))
+    in_graphs = kg.tool_restore_snapshot({"name": "s", "target_path": graphs_target})
+    assert os.path.exists(in_graphs["path"])
+
+    for target in (str(tmp_path / "outside.db"), "../outside.db", "nested/copy.db"):
+        with pytest.raises(ValueError, match="target_path must be"):
+            kg.tool_restore_snapshot({"name": "s", "target_path": target})
+    assert not (tmp_path / "outside.db").exists()
+
+
+def test_restore_rejects_a_corrupted_archive(kg, populated):
+    kg.tool_snapshot({"name": "s"})
+    archive_path, _ = kg._snapshot_paths("s")
+    with gzip.open(archive_path, "rb") as f:
+        raw = bytearray(f.read())
+    raw[-1] ^= 0xFF
+    with gzip.open(archive_path, "wb") as f:
+        f.write(raw)
+
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        kg.tool_restore_snapshot({"name": "s", "target_path": "bad.db"})
+    assert sorted(os.listdir(kg.current_graph().snapshot_dir)) == ["s.db.gz", "s.json"]
@@ -0,0 +1,71 @@
+import pytest
+
+from conftest import load_module
+
+
+@pytest.fixture
+def state_node(kg):
+    return kg.tool_find_or_create_state_node({"label": "State", "type": "cognitive_state"})["node_id"]
+
+
+def record(cycle, concepts):
+    return {"time": f"t{cycle}", "summary": {"cycle": cycle, "concepts": concepts}, "note": "same"}
+
+
+def test_records_are_stored_as_deltas_against_the_last_stored_record(kg, state_node):
+    kg.tool_append_state_history({"node_id": state_node, "cycle": 1, "record": record(1, ["a"])})
+    kg.tool_append_state_history({"node_id": state_node, "cycle": 2, "record": record(2, ["a", "b"])})
+
+    latest = kg.tool_get_state_history({"node_id": state_node, "limit": 1})["entries"][0]
+    assert latest["delta"] == {"time": "t2", "summary": {"cycle": 2, "concepts": ["a", "b"]}}
+    assert kg.tool_reconstruct_state({"node_id": state_node})["record"] == record(2, ["a", "b"])
+
+
+def test_reconstruction_across_checkpoints(kg, state_node, monkeypatch):
+    monkeypatch.setattr(kg, "STATE_CHECKPOINT_INTERVAL", 3)
+    for cycle in range(1, 9):
+        kg.tool_append_state_history({"node_id": state_node, "cycle": cycle, "record": record(cycle, [str(cycle)])})
+    # Plain deltas still work alongside full records
+    kg.tool_append_state_history({"node_id": state_node, "cycle": 9, "delta": {"note": None}})
+
+    history = kg.tool_get_state_history({"node_id": state_node, "limit": 9, "reconstruct": True})
+    records = {entry["cycle"]: entry["record"] for entry in history["entries"]}
+    for cycle in range(1, 9):
+        assert records[cycle] == record(cycle, [str(cycle)])
+    assert "note" not in records[9]
+    assert kg.tool_reconstruct_state({"node_id": state_node, "cycle": 5})["record"] == record(5, ["5"])
+
+
+def test_append_validation(kg, state_node):
+    kg.tool_append_state_history({"node_id": state_node, "cycle": 1, "record": {}})
+    with pytest.raises(ValueError, match="not after"):
+        kg.tool_append_state_history({"node_id": state_node, "cycle": 1, "record": {}})
+    with pytest.raises(ValueError, match="exactly one"):
+        kg.tool_append_state_history({"node_id": state_node, "cycle": 2, "record": {}, "delta": {}})
+
+
+def test_loop_history_survives_a_restart(loop, tmp_path):
+    loop.tool_run_full_cycle({"transport": "inprocess"})
+    loop.tool_run_full_cycle({"transport": "inprocess"})
+    # A fresh process knows nothing about earlier cycles
+    restarted = load_module("cognitive_loop_restarted", "CognitiveLoopServerV0.5.py")
+    result = restarted.tool_run_full_cycle({"transport": "inprocess"})
+
+    server = restarted.graph_transport("inprocess").server
+    try:
+        state_id = result["state_node_id"]
+        history = server.tool_get_state_history({"node_id": state_id, "limit": 3, "reconstruct": True})
+        assert [entry["cycle"] for entry in history["entries"]] == [3, 2, 1]
+        assert history["entries"][0]["record"]["summary"] == result["summary"]
+
+        header = server.tool_find_or_create_state_node({"label": "Cognitive Loop State", "type": "cognitive_state"})["data"]
+        assert "aggregates" not in header and header["cycle_count"] == 3
+        aggregates = server.tool_find_or_create_state_node(
+            {"label": "Cognitive Loop Aggregates", "type": "cognitive_aggregates"}
+        )["data"]
+        assert aggregates["cycles"] == 3
+    finally:
+        for module in (loop, restarted):
+            for transport in module._transports.values():
+                for graph in transport.server.GRAPHS.each_open():
+                    graph.close()
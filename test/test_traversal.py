@@ -0,0 +1,64 @@
+import pytest
+
+
+@pytest.fixture(params=["memory", "sql"])
+def graph(kg, request, monkeypatch):
+    if request.param == "memory":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(kg, "ADJACENCY_CACHE_ENABLED", False)
+    ids = [kg.tool_add_node({"label": label, "type": "concept"})["node_id"] for label in "abc"]
+    kg.tool_add_edge({"source_id": ids[0], "target_id": ids[1], "relation": "r"})
+    kg.tool_add_edge({"source_id": ids[1], "target_id": ids[2], "relation": "r"})
+    return kg, ids, request.param
+
+
+def test_shortest_path(graph):
+    kg, ids, engine = graph
+    result = kg.tool_shortest_path({"source_id": ids[0], "target_id": ids[2], "direction": "out"})
+    assert result["engine"] == engine
+    assert result["found"] and result["length"] == 2
+    assert [node["id"] for node in result["nodes"]] == ids
+
+
+def test_shortest_path_to_itself(graph):
+    kg, ids, engine = graph
+    result = kg.tool_shortest_path({"source_id": ids[1], "target_id": str(ids[1])})
+    assert result["engine"] == engine
+    assert result["found"] and result["length"] == 0
+    assert [node["id"] for node in result["nodes"]] == [ids[1]]
+    assert result["edges"] == []
+
+
+def test_neighbors(graph):
+    kg, ids, engine = graph
+    result = kg.tool_neighbors({"node_id": str(ids[1])})
+    assert result["engine"] == engine
+    assert result["node_id"] == ids[1]
+    assert sorted((n["direction"], n["node_id"]) for n in result["neighbors"]) == [("in", ids[0]), ("out", ids[2])]
+
+
+def test_neighbors_requires_an_existing_node(graph):
+    kg, ids, engine = graph
+    with pytest.raises(ValueError, match="node_id is required"):
+        kg.tool_neighbors({})
+    with pytest.raises(ValueError, match="does not exist"):
+        kg.tool_neighbors({"node_id": 999})
+
+
+def test_fanout_cap_covers_base_and_new_edges_together(kg):
+    pytest.importorskip("numpy")
+    hub = kg.tool_add_node({"label": "hub"})["node_id"]
+    leaves = [kg.tool_add_node({"label": f"leaf{i}"})["node_id"] for i in range(4)]
+    for leaf in leaves[:2]:
+        kg.tool_add_edge({"source_id": hub, "target_id": leaf})
+    assert kg.ADJACENCY.ready()
+    for leaf in leaves[2:]:
+        kg.tool_add_edge({"source_id": hub, "target_id": leaf})
+    assert kg.ADJACENCY.ready() and kg.ADJACENCY.status()["delta_edges"] == 2
+
+    for fanout, expected in ((1, leaves[:1]), (3, leaves[:3]), (None, leaves)):
+        _, reached, _, _ = kg.ADJACENCY.expand([hub], "out", fanout=fanout)
+        assert reached.tolist() == expected
+    _, reached, _, _ = kg.ADJACENCY.expand([hub, leaves[0]], "both", fanout=3)
+    assert reached.tolist() == leaves[:3] + [hub]
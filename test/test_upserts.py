@@ -0,0 +1,39 @@
+def test_unique_node_returns_the_merged_row(kg):
+    first = kg.tool_add_node({"label": "Graph  Theory", "type": "concept", "data": {"a": 1}, "unique": True})
+    second = kg.tool_add_node({"label": "graph theory", "type": "concept", "data": {"b": 2}, "unique": True})
+    assert second["node_id"] == first["node_id"]
+    assert not second["created"] and second["hits"] == 2
+    assert second["label"] == "Graph  Theory"
+    assert second["data"] == {"a": 1, "b": 2}
+
+
+def test_unique_edges_key_on_the_relation_value(kg):
+    a = kg.tool_add_node({"label": "a"})["node_id"]
+    b = kg.tool_add_node({"label": "b"})["node_id"]
+    null_edge = kg.tool_add_edge({"source_id": a, "target_id": b, "relation": None, "unique": True})
+    empty_edge = kg.tool_add_edge({"source_id": a, "target_id": b, "relation": "", "unique": True})
+    assert null_edge["edge_id"] != empty_edge["edge_id"]
+
+    repeat = kg.tool_add_edge({"source_id": a, "target_id": b, "relation": None, "data": {"w": 2}, "unique": True})
+    assert repeat["edge_id"] == null_edge["edge_id"]
+    assert repeat["relation"] is None and repeat["hits"] == 2 and repeat["data"] == {"w": 2}
+
+
+def test_repeated_upserts_do_not_leave_id_gaps(kg):
+    a = kg.tool_add_node({"label": "a", "type": "concept", "unique": True})["node_id"]
+    b = kg.tool_add_node({"label": "b", "type": "concept", "unique": True})["node_id"]
+    first = kg.tool_add_edge({"source_id": a, "target_id": b, "relation": "r", "unique": True})["edge_id"]
+    for _ in range(3):
+        kg.tool_add_node({"label": "a", "type": "concept", "unique": True})
+        kg.tool_add_edge({"source_id": a, "target_id": b, "relation": "r", "unique": True})
+    assert kg.tool_add_node({"label": "c", "type": "concept", "unique": True})["node_id"] == b + 1
+    assert kg.tool_add_edge({"source_id": b, "target_id": a, "relation": "r", "unique": True})["edge_id"] == first + 1
+
+
+def test_old_edge_dedup_keys_are_rekeyed(kg):
+    a = kg.tool_add_node({"label": "a"})["node_id"]
+    with kg.DB.writer() as conn:
+        conn.execute("INSERT INTO edges (source_id, target_id, relation, dedup_key) VALUES (?, ?, NULL, '')", (a, a))
+        kg._migration_011_edge_dedup_relation(conn)
+    repeat = kg.tool_add_edge({"source_id": a, "target_id": a, "unique": True})
+    assert not repeat["created"] and repeat["hits"] == 2
@@ -0,0 +1,70 @@
+import pytest
+
+
+def counts(kg):
+    with kg.DB.reader() as conn:
+        return tuple(conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                     for table in ("nodes", "edges", "changes"))
+
+
+def transactions(kg):
+    return kg.DB.stats.snapshot()["counters"].get("write_transactions", 0)
+
+
+def test_batches_link_by_ref_and_are_atomic(kg):
+    result = kg.tool_add_nodes_batch({
+        "nodes": [{"label": "a", "ref": "a"}, {"label": "b", "ref": "b"}],
+        "edges": [{"source_ref": "a", "target_ref": "b", "relation": "r"}]
+    })
+    assert result["refs"] == {"a": 1, "b": 2} and len(result["edge_ids"]) == 1
+    edges = kg.tool_add_edges_batch({
+        "edges": [{"source_ref": "a", "target_id": 1}], "refs": result["refs"]
+    })
+    assert len(edges["edge_ids"]) == 1
+
+    before = counts(kg)
+    with pytest.raises(ValueError, match="Unknown ref"):
+        kg.tool_add_nodes_batch({
+            "nodes": [{"label": "c", "ref": "c"}],
+            "edges": [{"source_ref": "c", "target_ref": "nope"}]
+        })
+    assert counts(kg) == before
+
+
+def test_plan_commits_once(kg):
+    before = transactions(kg)
+    kg.tool_apply_write_plan({"plan": [
+        {"call": "add_node", "arguments": {"label": "a"}, "ref": "a"},
+        {"call": "add_nodes_batch", "arguments": {"nodes": [{"label": "b"}, {"label": "c"}]}},
+        {"call": "update_node_data", "arguments": {"node_ref": "a", "data": {"x": 1}}},
+    ]})
+    assert transactions(kg) == before + 1
+    assert counts(kg)[0] == 3
+
+
+def test_failed_plan_leaves_no_rows_events_or_cache_entries(kg):
+    a = kg.tool_add_node({"label": "a"})["node_id"]
+    kg.tool_neighbors({"node_id": a})    # warm the adjacency cache
+    before = counts(kg)
+
+    with pytest.raises(ValueError, match=r"plan\[2\] \(add_nodes_batch\): nodes\[1\]"):
+        kg.tool_apply_write_plan({"plan": [
+            {"call": "add_node", "arguments": {"label": "b"}, "ref": "b"},
+            {"call": "add_edge", "arguments": {"source_id": a, "target_ref": "b"}},
+            {"call": "add_nodes_batch", "arguments": {"nodes": [{"label": "c"}, {"label": ""}]}},
+        ]})
+    assert counts(kg) == before
+    assert kg.tool_neighbors({"node_id": a})["neighbors"] == []
+
+
+def test_plan_inside_an_outer_write_rolls_back_to_its_savepoint(kg):
+    with kg.DB.writer():
+        kg.tool_add_node({"label": "kept"})
+        with pytest.raises(ValueError):
+            kg.tool_apply_write_plan({"plan": [
+                {"call": "add_node", "arguments": {"label": "dropped"}},
+                {"call": "add_edge", "arguments": {"source_ref": "missing", "target_id": 1}},
+            ]})
+        kg.tool_add_node({"label": "also kept"})
+    labels = [node["label"] for node in kg.tool_list_recent_nodes({})["nodes"]]
+    assert sorted(labels) == ["also kept", "kept"]